@@ -0,0 +1,221 @@
+"""Drive main.app against local GitHub/Ollama stand-ins and report latencies.
+
+    python -m benchmarks.loadtest --scenario chat --concurrency 20 --requests 200
+
+The app runs in-process under uvicorn with a throwaway sessions/index/summary
+directory, so nothing touches the real GitHub API, a real Ollama daemon or the
+developer's local databases. Pass ``--json`` to get machine-readable output
+that two runs (e.g. before/after a change) can be compared with.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from dataclasses import fields
+
+import httpx
+
+from benchmarks.upstreams import FakeUpstreams, ServerThread, UpstreamConfig
+
+CHAT_MESSAGES = [
+    "Give me an overview of this repository",
+    "What does main.py do?",
+    "Which languages does this project use?",
+    "Where is the request handler defined?",
+    "How do I run the tests?",
+    "Explain src/pkg_3/module_3.py",
+]
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = (len(ordered) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def summarize(samples: list[float]) -> dict:
+    """Latency summary in milliseconds for samples given in seconds."""
+    return {
+        "count": len(samples),
+        "mean": round(statistics.fmean(samples) * 1000, 2),
+        "p50": round(percentile(samples, 50) * 1000, 2),
+        "p90": round(percentile(samples, 90) * 1000, 2),
+        "p99": round(percentile(samples, 99) * 1000, 2),
+        "max": round(max(samples) * 1000, 2),
+    }
+
+
+def build_request(scenario: str, rng: random.Random, repos: int) -> tuple:
+    repo = f"repo{rng.randrange(repos)}"
+    if scenario == "files":
+        return "GET", f"/repos/bench/{repo}/files", {"recursive": "true"}, None
+    if scenario == "file-content":
+        path = rng.choice(["main.py", "README.md", "src/pkg_1/module_1.py"])
+        return "GET", f"/repos/bench/{repo}/file-content", {"path": path}, None
+    body = {
+        "message": rng.choice(CHAT_MESSAGES),
+        "repo": repo,
+        "github_user": "bench",
+    }
+    return "POST", "/api/chat", None, body
+
+
+async def run_load(base_url: str, args) -> dict:
+    rng = random.Random(args.seed)
+    plan = [
+        build_request(rng.choice(args.scenario), rng, args.repos)
+        for _ in range(args.requests)
+    ]
+    latencies: dict[str, list[float]] = {}
+    statuses: Counter = Counter()
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in plan:
+        queue.put_nowait(item)
+
+    async def worker(client: httpx.AsyncClient):
+        while True:
+            try:
+                method, path, params, body = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            route = path.rsplit("/", 1)[-1] if path.startswith("/repos") else path
+            start = time.perf_counter()
+            try:
+                res = await client.request(method, path, params=params, json=body)
+                statuses[f"{route}:{res.status_code}"] += 1
+            except httpx.HTTPError as exc:
+                statuses[f"{route}:{type(exc).__name__}"] += 1
+            latencies.setdefault(route, []).append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=base_url, timeout=args.timeout, limits=limits
+    ) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(plan) / elapsed, 2) if elapsed else 0.0,
+        "statuses": dict(sorted(statuses.items())),
+        "latency_ms": {
+            route: summarize(samples) for route, samples in sorted(latencies.items())
+        },
+    }
+
+
+def scratch_paths(workdir: str) -> dict:
+    """Env vars pointing sessions, the search index and summaries into ``workdir``."""
+    return {
+        "SESSIONS_DB_PATH": os.path.join(workdir, "sessions.db"),
+        "SEARCH_INDEX_DIR": os.path.join(workdir, "index"),
+        "SUMMARIES_DB_PATH": os.path.join(workdir, "summaries.db"),
+    }
+
+
+def load_app(env: dict, app_dir: str | None = None, log_level: str = "WARNING"):
+    """Import main.py (from ``app_dir`` if given) configured by ``env``.
+
+    Sessions, the search index and summaries go to a fresh temporary directory.
+    """
+    workdir = tempfile.mkdtemp(prefix="codescribe-bench-")
+    os.environ.update(env)
+    os.environ.update(scratch_paths(workdir))
+    os.environ.pop("TRAFFIC_CAPTURE_PATH", None)
+    os.environ.setdefault("GITHUB_CLIENT_ID", "bench")
+    os.environ.setdefault("GITHUB_CLIENT_SECRET", "bench")
+    if app_dir:
+        sys.path.insert(0, os.path.abspath(app_dir))
+    # Imported late so module-level configuration picks up the env above.
+    import main as app_module
+
+    for name in ("codescribe", "httpx"):
+        logging.getLogger(name).setLevel(log_level)
+    return app_module
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=["chat", "files", "file-content"],
+        help="Request mix; repeat to combine (default: chat)",
+    )
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument(
+        "--repos", type=int, default=5, help="Distinct repos (cache spread)"
+    )
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--json", action="store_true", help="Print JSON only")
+    parser.add_argument("--log-level", default="WARNING")
+    for f in fields(UpstreamConfig):
+        parser.add_argument(
+            f"--{f.name.replace('_', '-')}", type=type(f.default), default=f.default
+        )
+    args = parser.parse_args(argv)
+    args.scenario = args.scenario or ["chat"]
+    return args
+
+
+def main(argv=None) -> dict:
+    args = parse_args(argv)
+    cfg = UpstreamConfig(
+        **{f.name: getattr(args, f.name) for f in fields(UpstreamConfig)}
+    )
+    with FakeUpstreams(cfg) as upstreams:
+        app_module = load_app(upstreams.environment(), log_level=args.log_level)
+        server = ServerThread(app_module.app, lifespan="on").start()
+        try:
+            report = asyncio.run(run_load(server.url, args))
+        finally:
+            server.stop()
+        report["upstream_calls"] = dict(sorted(upstreams.calls.items()))
+    report["config"] = {
+        "scenario": args.scenario,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "repos": args.repos,
+        **{f.name: getattr(cfg, f.name) for f in fields(cfg)},
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return report
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"{report['config']['requests']} requests in {report['elapsed_s']}s "
+        f"({report['throughput_rps']} req/s, concurrency "
+        f"{report['config']['concurrency']})"
+    )
+    print(f"{'route':<16}{'n':>6}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}  (ms)")
+    for route, s in report["latency_ms"].items():
+        print(
+            f"{route:<16}{s['count']:>6}{s['p50']:>10}{s['p90']:>10}"
+            f"{s['p99']:>10}{s['max']:>10}"
+        )
+    print("statuses:", ", ".join(f"{k}={v}" for k, v in report["statuses"].items()))
+    print("upstream calls:")
+    for name, count in report["upstream_calls"].items():
+        print(f"  {name}: {count}")
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
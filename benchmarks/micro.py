@@ -0,0 +1,411 @@
+"""Micro-benchmarks for per-request hot paths, checked against stored baselines.
+
+    python -m benchmarks.micro                  # compare with benchmarks/baselines.json
+    python -m benchmarks.micro --filter session # only matching cases
+    python -m benchmarks.micro --save           # record new baselines
+
+Each case times one call of a function on a synthetic fixture (large trees, long
+messages, many stored sessions). The best of ``--repeat`` rounds is compared with
+the baseline and the run exits 1 when any case is slower by more than
+``--tolerance``. Baselines only mean something on the machine that recorded them;
+re-run with ``--save`` after moving to other hardware. Redis cases run only when
+REDIS_URL answers a PING and are reported as skipped otherwise.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import string
+import sys
+import tempfile
+import time
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from benchmarks.loadtest import load_app
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+CASES: dict[str, Callable[[object], Iterator[Callable[[], object]]]] = {}
+
+
+class Skip(Exception):
+    """Raised by a case setup whose prerequisites are missing."""
+
+
+def case(name: str):
+    """Register a setup generator that yields the zero-argument call to time."""
+
+    def register(setup):
+        CASES[name] = contextmanager(setup)
+        return setup
+
+    return register
+
+
+# ---- Fixtures ----
+
+_rng = random.Random(46)
+
+
+def _words(n: int) -> str:
+    return " ".join(
+        "".join(_rng.choices(string.ascii_lowercase, k=_rng.randint(2, 9)))
+        for _ in range(n)
+    )
+
+
+TYPICAL_MESSAGES = [
+    "Give me an overview of this repository",
+    "What does main.py do?",
+    "Which languages does this project use?",
+    "Where is the request handler defined?",
+    "How do I run the tests?",
+    "Explain src/app/routes.py line by line",
+    "who contributes most to this repo",
+    "Is there a license?",
+    "summarize the README",
+    "find usages of get_current_user",
+] * 20
+LONG_MESSAGE = _words(700) + " so where is the main entry point defined?"
+
+
+def synthetic_tree(entries: int) -> list[dict]:
+    tree = []
+    for i in range(entries):
+        depth = "/".join(f"pkg{(i >> s) % 16}" for s in (0, 4, 8)[: 1 + i % 3])
+        if i % 10 == 0:
+            tree.append({"path": f"src/{depth}", "type": "tree", "sha": f"{i:040x}"})
+        tree.append(
+            {
+                "path": f"src/{depth}/module_{i}.py",
+                "type": "blob",
+                "size": 1000 + i,
+                "sha": f"{i:040x}",
+            }
+        )
+    tree.append({"path": "vendor/lib", "type": "commit", "sha": "0" * 40})
+    return tree
+
+
+def large_context() -> dict:
+    return {
+        "description": _words(30),
+        "license": "MIT",
+        "stars": 12345,
+        "languages": {f"Lang{i}": round(100 / 30, 2) for i in range(30)},
+        "files": [f"file_{i}.py" for i in range(5000)],
+        "dirs": [f"dir_{i}" for i in range(500)],
+        "readme": _words(15000),
+    }
+
+
+def _session(i: int) -> dict:
+    return {
+        "user": {"login": f"user{i}", "id": i, "name": f"User {i}"},
+        "access_token": "gho_" + "x" * 36,
+        "expires": time.time() + 3600,
+    }
+
+
+@contextmanager
+def _sqlite_store(app, sessions: int):
+    saved = (app.SESSION_STORE_TYPE, app.SESSIONS_DB_PATH)
+    with tempfile.TemporaryDirectory() as tmp:
+        app.SESSION_STORE_TYPE = "sqlite"
+        app.SESSIONS_DB_PATH = os.path.join(tmp, "sessions.db")
+        app.init_session_store()
+        with app._db_connect() as conn:
+            conn.executemany(
+                "INSERT INTO sessions (session_id, data, expires) VALUES (?, ?, ?)",
+                (
+                    (f"s{i}", json.dumps(s := _session(i)), s["expires"])
+                    for i in range(sessions)
+                ),
+            )
+        try:
+            yield
+        finally:
+            app._SESSION_CACHE.clear()
+            app.SESSION_STORE_TYPE, app.SESSIONS_DB_PATH = saved
+            app._get_db_connection()  # reopen the original file
+
+
+@contextmanager
+def _redis_store(app, sessions: int):
+    try:
+        import redis
+
+        client = redis.from_url(app.REDIS_URL, decode_responses=True)
+        client.ping()
+    except Exception as e:
+        raise Skip(f"Redis unavailable at {app.REDIS_URL}: {e}")
+    saved = (app.SESSION_STORE_TYPE, app._redis_client)
+    app.SESSION_STORE_TYPE, app._redis_client = "redis", client
+    keys = [f"bench-{i}" for i in range(sessions)]
+    pipe = client.pipeline()
+    for i, key in enumerate(keys):
+        pipe.set(f"session:{key}", json.dumps(_session(i)), ex=600)
+    pipe.execute()
+    try:
+        yield keys
+    finally:
+        client.delete(*(f"session:{k}" for k in keys))
+        app._SESSION_CACHE.clear()
+        app.SESSION_STORE_TYPE, app._redis_client = saved
+
+
+# ---- Cases ----
+
+
+@case("detect_intent/typical_messages_x200")
+def bench_detect_intent_typical_messages_x200(app):
+    yield lambda: [app.detect_intent(m) for m in TYPICAL_MESSAGES]
+
+
+@case("detect_intent/long_message")
+def bench_detect_intent_long_message(app):
+    yield lambda: app.detect_intent(LONG_MESSAGE)
+
+
+@case("format_context_block/large_context")
+def bench_format_context_block_large_context(app):
+    ctx = large_context()
+    yield lambda: app.format_context_block(ctx)
+
+
+@case("normalize_tree/50k_entries")
+def bench_normalize_tree_50k_entries(app):
+    tree = synthetic_tree(50_000)
+    yield lambda: app.normalize_tree(tree)
+
+
+@case("normalize_tree/50k_entries_subdir")
+def bench_normalize_tree_50k_entries_subdir(app):
+    tree = synthetic_tree(50_000)
+    yield lambda: app.normalize_tree(tree, "src/pkg3")
+
+
+@case("render_json/tree_50k_rows")
+def bench_render_json_tree_50k_rows(app):
+    rows = app.normalize_tree(synthetic_tree(50_000))
+    yield lambda: app.FastJSONResponse(rows)
+
+
+@case("columnar_listing/tree_50k_rows")
+def bench_columnar_listing_tree_50k_rows(app):
+    rows = app.normalize_tree(synthetic_tree(50_000))
+    yield lambda: app.columnar_listing(rows)
+
+
+@case("compress_gzip/tree_50k_columnar")
+def bench_compress_gzip_tree_50k_columnar(app):
+    rows = app.normalize_tree(synthetic_tree(50_000))
+    body = app.FastJSONResponse(app.columnar_listing(rows)).body
+    yield lambda: app._compress(body, "gzip")
+
+
+@case("cache_get/hit_10k_keys")
+def bench_cache_get_hit_10k_keys(app):
+    app._CACHE.clear()
+    for i in range(10_000):
+        app.cache_set(f"gh:https://api.github.com/repos/o/r{i}", {"i": i})
+    yield lambda: app.cache_get("gh:https://api.github.com/repos/o/r5000")
+    app._CACHE.clear()
+
+
+@case("cache_get/miss")
+def bench_cache_get_miss(app):
+    yield lambda: app.cache_get("gh:https://api.github.com/repos/o/missing")
+
+
+@case("cache_set/10k_keys")
+def bench_cache_set_10k_keys(app):
+    keys = [f"gh:https://api.github.com/repos/o/r{i}" for i in range(10_000)]
+    payload = {"default_branch": "main"}
+
+    def run():
+        for key in keys:
+            app.cache_set(key, payload)
+
+    yield run
+    app._CACHE.clear()
+
+
+@case("serializer_loads/session_cookie")
+def bench_serializer_loads_session_cookie(app):
+    cookie = app.serializer.dumps({"session_id": "a" * 43})
+    yield lambda: app.serializer.loads(cookie)
+
+
+@case("session_store_get/sqlite_cached")
+def bench_session_store_get_sqlite_cached(app):
+    with _sqlite_store(app, 20_000):
+        app.session_store_get("s123")
+        yield lambda: app.session_store_get("s123")
+
+
+@case("session_store_get/sqlite_uncached_20k_sessions")
+def bench_session_store_get_sqlite_uncached_20k_sessions(app):
+    with _sqlite_store(app, 20_000):
+        ids = [f"s{_rng.randrange(20_000)}" for _ in range(256)]
+
+        def run():
+            for sid in ids:
+                app._SESSION_CACHE.pop(sid, None)
+                app.session_store_get(sid)
+
+        yield run
+
+
+@case("session_store_get/sqlite_8_threads_x_128")
+def bench_session_store_get_sqlite_8_threads_x_128(app):
+    with _sqlite_store(app, 20_000), ThreadPoolExecutor(8) as pool:
+        batches = [[f"s{_rng.randrange(20_000)}" for _ in range(128)] for _ in range(8)]
+
+        def read(ids):
+            for sid in ids:
+                app._session_store_read(sid)
+
+        yield lambda: list(pool.map(read, batches))
+
+
+@case("session_store_set/sqlite")
+def bench_session_store_set_sqlite(app):
+    with _sqlite_store(app, 20_000):
+        data = _session(1)
+        yield lambda: app.session_store_set("s1", data)
+
+
+@case("session_store_get/redis_uncached")
+def bench_session_store_get_redis_uncached(app):
+    with _redis_store(app, 2_000) as keys:
+        ids = keys[:256]
+
+        def run():
+            for sid in ids:
+                app._SESSION_CACHE.pop(sid, None)
+                app.session_store_get(sid)
+
+        yield run
+
+
+@case("session_store_set/redis")
+def bench_session_store_set_redis(app):
+    with _redis_store(app, 1) as keys:
+        data = _session(1)
+        yield lambda: app.session_store_set(keys[0], data)
+
+
+# ---- Runner ----
+
+
+def measure(fn: Callable[[], object], repeat: int, min_time: float) -> float:
+    """Best per-call time in seconds over ``repeat`` rounds of >= ``min_time``."""
+    timer = timeit.Timer(fn)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)))
+    rounds = [elapsed] + timer.repeat(repeat=max(0, repeat - 1), number=number)
+    return min(rounds) / number
+
+
+def run_cases(app, names: list[str], repeat: int, min_time: float) -> dict:
+    results = {}
+    for name in names:
+        try:
+            with CASES[name](app) as fn:
+                results[name] = measure(fn, repeat, min_time) * 1e6
+        except Skip as e:
+            results[name] = None
+            print(f"{name:<52} skipped: {e}")
+    return results
+
+
+def machine() -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Print a table of results vs baseline; return the names that regressed."""
+    stored = baseline.get("cases", {})
+    regressed = []
+    print(f"{'case':<52}{'base us':>12}{'now us':>12}{'change':>10}")
+    for name, now in results.items():
+        if now is None:
+            continue
+        base = stored.get(name)
+        if base is None:
+            print(f"{name:<52}{'-':>12}{now:>12.2f}{'new':>10}")
+            continue
+        change = (now - base) / base
+        flag = "  REGRESSED" if change > tolerance else ""
+        print(f"{name:<52}{base:>12.2f}{now:>12.2f}{change:>+10.1%}{flag}")
+        if change > tolerance:
+            regressed.append(name)
+    return regressed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filter", default="", help="Run cases containing this")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="Write new baselines")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.3,
+        help="Allowed slowdown as a fraction of the baseline (default 0.3)",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--min-time", type=float, default=0.2, help="Seconds per timing round"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    app = load_app({})
+    names = [n for n in CASES if args.filter in n]
+    results = run_cases(app, names, args.repeat, args.min_time)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    if args.save:
+        cases = dict(baseline.get("cases", {}))
+        cases.update({n: round(v, 3) for n, v in results.items() if v is not None})
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"machine": machine(), "cases": cases}, f, indent=2)
+            f.write("\n")
+        compare(results, {}, args.tolerance)
+        print(f"Saved {len(cases)} baselines to {args.baseline}")
+        return 0
+
+    if baseline.get("machine") and baseline["machine"] != machine():
+        print(f"Note: baselines were recorded on {baseline['machine']}")
+    regressed = compare(results, baseline, args.tolerance)
+    if regressed:
+        print(
+            f"{len(regressed)} case(s) slower than baseline by more than "
+            f"{args.tolerance:.0%}: {', '.join(regressed)}"
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
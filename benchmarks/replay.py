@@ -0,0 +1,321 @@
+"""Replay captured production traffic against a local build and compare runs.
+
+Capture traffic by starting the app with ``TRAFFIC_CAPTURE_PATH=traffic.jsonl``.
+Each line holds one inbound request plus the GitHub and Ollama exchanges made
+while serving it. ``run`` serves those exchanges back from local stand-ins,
+using the recorded status, body and timings, replays the inbound requests in
+recorded order and writes a result file. ``compare`` diffs two result files:
+
+    python -m benchmarks.replay run traffic.jsonl --output new.json
+    git worktree add /tmp/base HEAD~1
+    python -m benchmarks.replay run traffic.jsonl --app-dir /tmp/base --output base.json
+    python -m benchmarks.replay compare base.json new.json --fail-over 10
+
+The baseline checkout must honour GITHUB_API_BASE (added with the load-test
+harness) so its GitHub calls reach the stand-in.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import re
+import sys
+import time
+from collections import Counter, defaultdict, deque
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from benchmarks.loadtest import load_app, summarize
+from benchmarks.upstreams import ServerThread
+
+_REPO_PATH_RE = re.compile(r"^/repos/[^/]+/[^/]+")
+_REPO_TAIL_RE = re.compile(r"/(contents|git/trees|git/ref/heads|tarball)/.*$")
+
+
+def load_capture(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def body_bytes(body: dict | None) -> bytes:
+    if not body:
+        return b""
+    if "base64" in body:
+        return base64.b64decode(body["base64"])
+    return body.get("text", "").encode("utf-8")
+
+
+def upstream_route(target: str) -> str:
+    """Collapse owner/repo/path parts so calls group by GitHub endpoint."""
+    path = target.split("?", 1)[0]
+    path = _REPO_PATH_RE.sub("/repos/{owner}/{repo}", path)
+    return _REPO_TAIL_RE.sub(lambda m: f"/{m.group(1)}/{{path}}", path)
+
+
+class RecordedUpstream:
+    """Serve one service's recorded exchanges, matched by method, target, model.
+
+    Repeated calls to the same target get the recorded responses in order; once
+    they run out the last one is reused. Unknown targets get a 404.
+    """
+
+    def __init__(self, service: str, exchanges: list[dict], time_scale: float):
+        self.service = service
+        self.time_scale = time_scale
+        self.calls: Counter = Counter()
+        self._by_key: dict[tuple, deque] = defaultdict(deque)
+        for ex in exchanges:
+            if "status" not in ex:
+                continue  # transport error while recording; nothing to serve
+            model = ex.get("model")
+            self._by_key[(ex["method"], ex["target"], model)].append(ex)
+            if model is not None:
+                self._by_key[(ex["method"], ex["target"], None)].append(ex)
+
+    def _match(self, method: str, target: str, model) -> dict | None:
+        for key in ((method, target, model), (method, target, None)):
+            queue = self._by_key.get(key)
+            if queue:
+                return queue.popleft() if len(queue) > 1 else queue[0]
+        return None
+
+    def app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.api_route(
+            "/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE"]
+        )
+        async def serve(request: Request, path: str):
+            started = time.perf_counter()
+            target = request.url.path
+            if request.url.query:
+                target += f"?{request.url.query}"
+            model = None
+            if self.service == "ollama" and request.method == "POST":
+                try:
+                    model = (await request.json()).get("model")
+                except ValueError:
+                    pass
+            ex = self._match(request.method, target, model)
+            if ex is None:
+                self.calls[(self.service, "unmatched")] += 1
+                return JSONResponse({"message": "Not recorded"}, 404)
+            self.calls[(self.service, upstream_route(target))] += 1
+            wait = ex.get("headers_ms", 0.0) / 1000 * self.time_scale
+            wait -= time.perf_counter() - started
+            if wait > 0:
+                await asyncio.sleep(wait)
+            return self._respond(ex)
+
+        return app
+
+    def _respond(self, ex: dict) -> StreamingResponse:
+        scale = self.time_scale
+        data = body_bytes(ex.get("body"))
+        headers = dict(ex.get("headers") or {})
+        media_type = headers.pop("content-type", None)
+        headers_ms = ex.get("headers_ms", 0.0)
+        body_ms = max(0.0, ex.get("duration_ms", headers_ms) - headers_ms)
+        streamed = "ndjson" in (media_type or "") or "event-stream" in (
+            media_type or ""
+        )
+        chunks = data.splitlines(keepends=True) if streamed and data else [data]
+
+        async def body():
+            gap = body_ms / max(1, len(chunks)) / 1000 * scale
+            for chunk in chunks:
+                if gap:
+                    await asyncio.sleep(gap)
+                yield chunk
+
+        return StreamingResponse(
+            body(), status_code=ex["status"], headers=headers, media_type=media_type
+        )
+
+
+async def drive(base_url: str, capture: list[dict], concurrency: int) -> list[dict]:
+    results: list[dict | None] = [None] * len(capture)
+    queue: asyncio.Queue = asyncio.Queue()
+    for i, entry in enumerate(capture):
+        queue.put_nowait(i)
+
+    async def worker(client: httpx.AsyncClient):
+        while not queue.empty():
+            i = queue.get_nowait()
+            entry = capture[i]
+            headers = dict(entry.get("headers") or {})
+            headers["X-Request-ID"] = f"replay-{entry.get('request_id') or i}"
+            start = time.perf_counter()
+            try:
+                res = await client.request(
+                    entry["method"],
+                    entry["path"],
+                    params=[tuple(p) for p in entry.get("query") or []],
+                    headers=headers,
+                    content=body_bytes(entry.get("body")) or None,
+                )
+                await res.aread()
+                status = res.status_code
+            except httpx.HTTPError as exc:
+                status = type(exc).__name__
+            results[i] = {
+                "route": f"{entry['method']} {entry.get('route') or entry['path']}",
+                "status": status,
+                "recorded_status": entry.get("status"),
+                "seconds": time.perf_counter() - start,
+            }
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=300.0) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    return results
+
+
+def run(args) -> dict:
+    capture = load_capture(args.capture)
+    exchanges: dict[str, list[dict]] = defaultdict(list)
+    for entry in capture:
+        for ex in entry.get("upstream") or []:
+            exchanges[ex["service"]].append(ex)
+    upstreams = {
+        service: RecordedUpstream(service, exchanges.get(service, []), args.time_scale)
+        for service in ("github", "ollama")
+    }
+    servers = {
+        service: ServerThread(up.app()).start() for service, up in upstreams.items()
+    }
+    try:
+        env = {
+            "GITHUB_API_BASE": servers["github"].url,
+            "GITHUB_WEB_BASE": servers["github"].url,
+            "OLLAMA_URL": servers["ollama"].url,
+            "GITHUB_TOKEN": "",
+        }
+        app_module = load_app(env, app_dir=args.app_dir, log_level=args.log_level)
+        server = ServerThread(app_module.app, lifespan="on").start()
+        try:
+            results = asyncio.run(drive(server.url, capture, args.concurrency))
+        finally:
+            server.stop()
+    finally:
+        for s in servers.values():
+            s.stop()
+
+    latencies: dict[str, list[float]] = defaultdict(list)
+    statuses: Counter = Counter()
+    for r in results:
+        latencies[r["route"]].append(r["seconds"])
+        statuses[f"{r['route']}:{r['status']}"] += 1
+    calls: Counter = Counter()
+    for up in upstreams.values():
+        calls.update(up.calls)
+    report = {
+        "capture": args.capture,
+        "app_dir": args.app_dir or ".",
+        "requests": len(results),
+        "status_mismatches": sum(
+            1 for r in results if r["status"] != r["recorded_status"]
+        ),
+        "statuses": dict(sorted(statuses.items())),
+        "latency_ms": {
+            route: summarize(samples) for route, samples in sorted(latencies.items())
+        },
+        "upstream_calls": {
+            f"{service} {route}": n for (service, route), n in sorted(calls.items())
+        },
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    return report
+
+
+def _delta(base: float, new: float) -> str:
+    if not base:
+        return "n/a" if new else "0%"
+    return f"{(new - base) / base * 100:+.1f}%"
+
+
+def compare(args) -> int:
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+
+    regressions = []
+    print(f"{'route':<40}{'stat':>6}{'base ms':>12}{'new ms':>12}{'delta':>10}")
+    for route in sorted(set(base["latency_ms"]) | set(new["latency_ms"])):
+        b = base["latency_ms"].get(route)
+        n = new["latency_ms"].get(route)
+        if not b or not n:
+            print(f"{route:<40} only in {'new' if n else 'base'}")
+            continue
+        for stat in ("p50", "p90", "p99"):
+            print(
+                f"{route:<40}{stat:>6}{b[stat]:>12}{n[stat]:>12}"
+                f"{_delta(b[stat], n[stat]):>10}"
+            )
+        if args.fail_over is not None and b["p90"]:
+            if (n["p90"] - b["p90"]) / b["p90"] * 100 > args.fail_over:
+                regressions.append(route)
+
+    print(f"\n{'upstream route':<52}{'base':>8}{'new':>8}")
+    base_calls, new_calls = base["upstream_calls"], new["upstream_calls"]
+    for route in sorted(set(base_calls) | set(new_calls)):
+        b, n = base_calls.get(route, 0), new_calls.get(route, 0)
+        marker = "" if b == n else "  *"
+        print(f"{route:<52}{b:>8}{n:>8}{marker}")
+    print(
+        f"\nstatus mismatches vs recording: base={base['status_mismatches']} "
+        f"new={new['status_mismatches']}"
+    )
+    if regressions:
+        print(f"p90 regressed more than {args.fail_over}%: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_p = sub.add_parser("run", help="Replay a capture against a local build")
+    run_p.add_argument("capture", help="JSONL file written via TRAFFIC_CAPTURE_PATH")
+    run_p.add_argument("--app-dir", help="Checkout whose main.py to run")
+    run_p.add_argument("--output", help="Write the result JSON here")
+    run_p.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Requests in flight; 1 keeps the replay deterministic",
+    )
+    run_p.add_argument(
+        "--time-scale",
+        type=float,
+        default=1.0,
+        help="Multiply recorded upstream timings (0 = no delay)",
+    )
+    run_p.add_argument("--log-level", default="WARNING")
+    cmp_p = sub.add_parser("compare", help="Diff two run results")
+    cmp_p.add_argument("base")
+    cmp_p.add_argument("new")
+    cmp_p.add_argument(
+        "--fail-over",
+        type=float,
+        help="Exit 1 when any route's p90 grows by more than this percent",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.command == "run":
+        run(args)
+        return 0
+    return compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
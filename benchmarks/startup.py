@@ -0,0 +1,181 @@
+"""Measure how long a fresh process takes to import main and to serve traffic.
+
+    python -m benchmarks.startup                       # this checkout
+    python -m benchmarks.startup --app-dir /tmp/base   # another checkout
+    python -m benchmarks.startup --expired-sessions 200000 --json
+
+Each round runs in new processes with an empty scratch directory:
+
+* ``import``: ``import main`` inside a fresh interpreter, plus which heavy
+  optional packages (celery, redis) that import pulled in;
+* ``listening``: from spawning uvicorn until the first HTTP response;
+* ``ready``: until ``/ready`` answers 200. Builds without ``/ready`` do all
+  their setup before listening, so for them ready equals listening.
+
+``--expired-sessions`` seeds the session database with expired rows so the
+startup purge has real work to do.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.loadtest import scratch_paths, summarize
+from benchmarks.upstreams import free_port
+
+HEAVY_MODULES = ("celery", "redis")
+IMPORT_PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+loaded = [m for m in {HEAVY_MODULES!r} if m in sys.modules]
+print(json.dumps({{"seconds": elapsed, "loaded": loaded}}))
+"""
+
+
+def seed_expired_sessions(path: str, count: int):
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions "
+            "(session_id TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires)"
+        )
+        conn.executemany(
+            "INSERT INTO sessions VALUES (?, ?, ?)",
+            ((f"expired-{i}", "{}", 1.0) for i in range(count)),
+        )
+
+
+def _environment(workdir: str, expired_sessions: int) -> dict:
+    env = dict(os.environ)
+    env.update(scratch_paths(workdir))
+    env.pop("TRAFFIC_CAPTURE_PATH", None)
+    env.setdefault("GITHUB_CLIENT_ID", "bench")
+    env.setdefault("GITHUB_CLIENT_SECRET", "bench")
+    if expired_sessions:
+        seed_expired_sessions(env["SESSIONS_DB_PATH"], expired_sessions)
+    return env
+
+
+def measure_import(app_dir: str, expired_sessions: int) -> dict:
+    with tempfile.TemporaryDirectory(prefix="codescribe-startup-") as workdir:
+        out = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE],
+            cwd=app_dir,
+            env=_environment(workdir, expired_sessions),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def measure_serve(app_dir: str, expired_sessions: int, timeout: float) -> dict:
+    """Seconds from spawning uvicorn to the first response and to readiness."""
+    port = free_port()
+    with tempfile.TemporaryDirectory(prefix="codescribe-startup-") as workdir:
+        env = _environment(workdir, expired_sessions)
+        started = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app"]
+            + ["--port", str(port), "--log-level", "warning"],
+            cwd=app_dir,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        listening = ready = None
+        try:
+            with httpx.Client(base_url=f"http://127.0.0.1:{port}") as client:
+                while ready is None:
+                    if time.perf_counter() - started > timeout:
+                        raise TimeoutError(f"app not ready after {timeout}s")
+                    if proc.poll() is not None:
+                        raise RuntimeError(f"uvicorn exited with {proc.returncode}")
+                    try:
+                        res = client.get("/ready", timeout=1.0)
+                    except httpx.TransportError:
+                        time.sleep(0.005)
+                        continue
+                    now = time.perf_counter() - started
+                    listening = listening if listening is not None else now
+                    if res.status_code in (200, 404):
+                        ready = now
+                    else:
+                        time.sleep(0.005)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+    return {"listening": listening, "ready": ready}
+
+
+def run(args) -> dict:
+    app_dir = os.path.abspath(args.app_dir or ".")
+    imports, listening, ready = [], [], []
+    loaded: set[str] = set()
+    for _ in range(args.repeat):
+        probe = measure_import(app_dir, args.expired_sessions)
+        imports.append(probe["seconds"])
+        loaded.update(probe["loaded"])
+        serve = measure_serve(app_dir, args.expired_sessions, args.timeout)
+        listening.append(serve["listening"])
+        ready.append(serve["ready"])
+    return {
+        "app_dir": app_dir,
+        "rounds": args.repeat,
+        "expired_sessions": args.expired_sessions,
+        "heavy_modules_at_import": sorted(loaded),
+        "startup_ms": {
+            "import": summarize(imports),
+            "listening": summarize(listening),
+            "ready": summarize(ready),
+        },
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"{report['rounds']} cold starts of {report['app_dir']}")
+    print(f"{'stage':<12}{'p50':>10}{'p90':>10}{'max':>10}  (ms)")
+    for stage, s in report["startup_ms"].items():
+        print(f"{stage:<12}{s['p50']:>10}{s['p90']:>10}{s['max']:>10}")
+    heavy = ", ".join(report["heavy_modules_at_import"]) or "none"
+    print(f"heavy modules loaded by import: {heavy}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app-dir", help="Checkout whose main.py to start")
+    parser.add_argument("--repeat", type=int, default=5, help="Cold starts to time")
+    parser.add_argument(
+        "--expired-sessions",
+        type=int,
+        default=0,
+        help="Expired rows to seed into the session database",
+    )
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--json", action="store_true", help="Print JSON only")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
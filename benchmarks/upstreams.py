@@ -0,0 +1,314 @@
+"""Local stand-ins for the GitHub REST API and Ollama, for load tests.
+
+Both servers are small FastAPI apps served by uvicorn on a background thread.
+Latency, payload size, error rate and GitHub rate limiting are configurable
+through ``UpstreamConfig``; every request is counted per route so a benchmark
+can report how many upstream calls the app made.
+"""
+
+import asyncio
+import hashlib
+import io
+import json
+import random
+import socket
+import tarfile
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+
+@dataclass
+class UpstreamConfig:
+    github_latency_ms: float = 40.0
+    github_jitter_ms: float = 20.0
+    github_error_rate: float = 0.0  # share of requests answered with 502
+    github_rate_limit: int = 0  # requests per window before 403s; 0 disables
+    github_rate_window_s: float = 60.0
+    tree_entries: int = 2000
+    file_bytes: int = 8000
+    ollama_latency_ms: float = 300.0  # time to first token
+    ollama_token_ms: float = 5.0
+    ollama_tokens: int = 60
+    ollama_error_rate: float = 0.0
+    seed: int = 7
+
+
+def _sha(*parts) -> str:
+    return hashlib.sha1("\0".join(map(str, parts)).encode()).hexdigest()
+
+
+def _file_body(path: str, size: int) -> bytes:
+    line = f"def handler_{abs(hash(path)) % 1000}(request):  # {path}\n".encode()
+    return (line * (size // len(line) + 1))[:size]
+
+
+def _tree_paths(entries: int) -> list[str]:
+    paths = ["README.md", "main.py", "requirements.txt"]
+    for i in range(max(0, entries - len(paths))):
+        paths.append(f"src/pkg_{i % 25}/module_{i}.py")
+    return paths
+
+
+class _Limiter:
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self.reset_at = time.time() + window
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def take(self) -> tuple[bool, int, int]:
+        with self.lock:
+            now = time.time()
+            if now >= self.reset_at:
+                self.reset_at, self.used = now + self.window, 0
+            self.used += 1
+            remaining = max(0, self.limit - self.used)
+            return self.used <= self.limit, remaining, int(self.reset_at)
+
+
+def make_fake_github(cfg: UpstreamConfig, calls: Counter, base_url: str) -> FastAPI:
+    app = FastAPI()
+    rng = random.Random(cfg.seed)
+    paths = _tree_paths(cfg.tree_entries)
+    limiter = _Limiter(cfg.github_rate_limit, cfg.github_rate_window_s)
+
+    @app.middleware("http")
+    async def behave(request: Request, call_next):
+        delay = cfg.github_latency_ms + rng.uniform(0, cfg.github_jitter_ms)
+        await asyncio.sleep(delay / 1000)
+        headers = {}
+        if cfg.github_rate_limit:
+            allowed, remaining, reset = limiter.take()
+            headers = {
+                "X-RateLimit-Remaining": str(remaining),
+                "X-RateLimit-Reset": str(reset),
+            }
+            if not allowed:
+                calls["github:rate_limited"] += 1
+                return JSONResponse(
+                    {"message": "API rate limit exceeded"}, 403, headers=headers
+                )
+        if rng.random() < cfg.github_error_rate:
+            calls["github:error"] += 1
+            return JSONResponse({"message": "Bad gateway"}, 502)
+        response = await call_next(request)
+        route = request.scope.get("route")
+        calls[f"github:{getattr(route, 'path', request.url.path)}"] += 1
+        response.headers.update(headers)
+        return response
+
+    def entry(owner, repo, path):
+        return {
+            "type": "file",
+            "name": path.rsplit("/", 1)[-1],
+            "path": path,
+            "sha": _sha(owner, repo, path),
+            "size": cfg.file_bytes,
+            "download_url": f"{base_url}/raw/{owner}/{repo}/{path}",
+        }
+
+    @app.get("/repos/{owner}/{repo}")
+    async def repo_meta(owner: str, repo: str):
+        return {
+            "name": repo,
+            "full_name": f"{owner}/{repo}",
+            "default_branch": "main",
+            "description": f"Synthetic repository {owner}/{repo}",
+            "stargazers_count": 42,
+            "license": {"spdx_id": "MIT"},
+        }
+
+    @app.get("/repos/{owner}/{repo}/git/ref/heads/{branch}")
+    async def head_ref(owner: str, repo: str, branch: str):
+        return {"object": {"sha": _sha(owner, repo, "commit")}}
+
+    @app.get("/repos/{owner}/{repo}/git/trees/{ref}")
+    async def tree(owner: str, repo: str, ref: str):
+        dirs = sorted({p.rsplit("/", 1)[0] for p in paths if "/" in p})
+        items = [
+            {"path": d, "type": "tree", "sha": _sha(owner, repo, d)} for d in dirs
+        ] + [
+            {
+                "path": p,
+                "type": "blob",
+                "sha": _sha(owner, repo, p),
+                "size": cfg.file_bytes,
+            }
+            for p in paths
+        ]
+        return {"sha": _sha(owner, repo, "tree"), "tree": items, "truncated": False}
+
+    @app.get("/repos/{owner}/{repo}/contents")
+    @app.get("/repos/{owner}/{repo}/contents/{path:path}")
+    async def contents(owner: str, repo: str, request: Request, path: str = ""):
+        path = path.strip("/")
+        if path and path in paths:
+            body = _file_body(path, cfg.file_bytes)
+            if "raw" in request.headers.get("accept", ""):
+                return Response(body, media_type="text/plain")
+            return entry(owner, repo, path)
+        prefix = f"{path}/" if path else ""
+        children, seen_dirs = [], set()
+        for p in paths:
+            if not p.startswith(prefix):
+                continue
+            rest = p[len(prefix) :]
+            if "/" in rest:
+                d = prefix + rest.split("/", 1)[0]
+                if d not in seen_dirs:
+                    seen_dirs.add(d)
+                    children.append(
+                        {"type": "dir", "name": d.rsplit("/", 1)[-1], "path": d}
+                    )
+            else:
+                children.append(entry(owner, repo, p))
+        if not children:
+            return JSONResponse({"message": "Not Found"}, 404)
+        return children
+
+    @app.get("/raw/{owner}/{repo}/{path:path}")
+    async def raw(owner: str, repo: str, path: str):
+        return Response(_file_body(path, cfg.file_bytes), media_type="text/plain")
+
+    @app.get("/repos/{owner}/{repo}/languages")
+    async def languages(owner: str, repo: str):
+        return {"Python": 81234, "JavaScript": 20431, "CSS": 1200}
+
+    @app.get("/repos/{owner}/{repo}/contributors")
+    async def contributors(owner: str, repo: str):
+        return [{"login": f"dev{i}", "contributions": 10 - i} for i in range(8)]
+
+    @app.get("/repos/{owner}/{repo}/tarball/{ref}")
+    async def tarball(owner: str, repo: str, ref: str):
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w:gz") as tar:
+            for p in paths[:200]:
+                body = _file_body(p, cfg.file_bytes)
+                info = tarfile.TarInfo(f"{owner}-{repo}-{ref[:7]}/{p}")
+                info.size = len(body)
+                tar.addfile(info, io.BytesIO(body))
+        return Response(buf.getvalue(), media_type="application/gzip")
+
+    @app.get("/users/{user}/repos")
+    async def user_repos(user: str):
+        return [
+            {"name": f"repo{i}", "full_name": f"{user}/repo{i}", "pushed_at": None}
+            for i in range(10)
+        ]
+
+    @app.get("/rate_limit")
+    async def rate_limit():
+        return {"resources": {"core": {"limit": 5000, "remaining": 5000}}}
+
+    return app
+
+
+def make_fake_ollama(cfg: UpstreamConfig, calls: Counter) -> FastAPI:
+    app = FastAPI()
+    rng = random.Random(cfg.seed + 1)
+    words = "the handler reads the request and returns a response".split()
+
+    @app.get("/api/tags")
+    async def tags():
+        calls["ollama:/api/tags"] += 1
+        return {"models": [{"name": "bench-model"}]}
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        model = body.get("model", "")
+        calls[f"ollama:generate:{model}"] += 1
+        await asyncio.sleep(cfg.ollama_latency_ms / 1000)
+        if rng.random() < cfg.ollama_error_rate:
+            return JSONResponse({"error": "model crashed"}, 500)
+        tokens = [words[i % len(words)] + " " for i in range(cfg.ollama_tokens)]
+        if not body.get("stream"):
+            await asyncio.sleep(cfg.ollama_token_ms * len(tokens) / 1000)
+            return {"model": model, "response": "".join(tokens), "done": True}
+
+        async def stream():
+            for tok in tokens:
+                await asyncio.sleep(cfg.ollama_token_ms / 1000)
+                yield json.dumps({"response": tok, "done": False}) + "\n"
+            yield json.dumps({"response": "", "done": True}) + "\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ServerThread:
+    """Run an ASGI app with uvicorn on a daemon thread."""
+
+    def __init__(self, app, port: int | None = None, lifespan: str = "off"):
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        config = uvicorn.Config(
+            app,
+            host="127.0.0.1",
+            port=self.port,
+            log_level="warning",
+            lifespan=lifespan,
+            access_log=False,
+        )
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def start(self, timeout: float = 10.0) -> "ServerThread":
+        self.thread.start()
+        deadline = time.time() + timeout
+        while not self.server.started:
+            if time.time() > deadline or not self.thread.is_alive():
+                raise RuntimeError(f"Server on port {self.port} did not start")
+            time.sleep(0.02)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+class FakeUpstreams:
+    """Start fake GitHub and Ollama servers; ``calls`` counts requests per route."""
+
+    def __init__(self, cfg: UpstreamConfig | None = None):
+        self.cfg = cfg or UpstreamConfig()
+        self.calls: Counter = Counter()
+        github_port = free_port()
+        self.github = ServerThread(
+            make_fake_github(self.cfg, self.calls, f"http://127.0.0.1:{github_port}"),
+            github_port,
+        )
+        self.ollama = ServerThread(make_fake_ollama(self.cfg, self.calls))
+
+    def __enter__(self) -> "FakeUpstreams":
+        self.github.start()
+        self.ollama.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.github.stop()
+        self.ollama.stop()
+
+    def environment(self) -> dict[str, str]:
+        """Environment variables that point main.py at these servers."""
+        return {
+            "GITHUB_API_BASE": self.github.url,
+            "GITHUB_WEB_BASE": self.github.url,
+            "OLLAMA_URL": self.ollama.url,
+            "OLLAMA_MODEL": "bench-model",
+            "GITHUB_TOKEN": "",
+        }
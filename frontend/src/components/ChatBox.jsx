@@ -11,6 +11,22 @@ function sortNodes(nodes) {
   });
 }
 
+// Expands the backend's ?format=columnar listing (parallel arrays + shared
+// directory prefixes) back into { type, path, size, download_url } rows.
+function expandColumnar(payload) {
+  const { prefixes, types, prefix, name, type, size } = payload;
+  const urls = payload.download_url || [];
+  return name.map((base, i) => {
+    const dir = prefixes[prefix[i]];
+    return {
+      type: types[type[i]],
+      path: dir ? `${dir}/${base}` : base,
+      size: size[i],
+      download_url: urls[i] ?? null,
+    };
+  });
+}
+
 function buildFileTree(items) {
   const root = { name: "", path: "", type: "dir", childrenMap: new Map() };
 
@@ -99,7 +115,7 @@ export default function ChatBox() {
     const fetchFileTree = async () => {
       try {
         const res = await fetch(
-          `http://127.0.0.1:8000/repos/${selectedRepo.owner.login}/${selectedRepo.name}/files?recursive=true`
+          `http://127.0.0.1:8000/repos/${selectedRepo.owner.login}/${selectedRepo.name}/files?recursive=true&format=columnar`
         );
         if (!res.ok) {
           let detail = "Failed to fetch file tree.";
@@ -111,7 +127,7 @@ export default function ChatBox() {
           }
           throw new Error(detail);
         }
-        const treeData = await res.json();
+        const treeData = expandColumnar(await res.json());
         setFileTree(treeData);
         const initiallyExpanded = {};
         for (const item of treeData) {
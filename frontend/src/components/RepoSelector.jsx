@@ -23,6 +23,15 @@ export default function RepoSelector({ onRepoSelect }) {
     }
   };
 
+  const selectRepo = repo => {
+    // Fire-and-forget: lets the backend prefetch repo metadata before the first question.
+    fetch(
+      `http://127.0.0.1:8000/repos/${repo.owner.login}/${repo.name}/warmup`,
+      { method: "POST" }
+    ).catch(() => {});
+    onRepoSelect(repo);
+  };
+
   return (
     <div className="flex flex-col h-full">
       <h2 className="text-xl font-semibold mb-3 text-gray-100">GitHub Repos</h2>
@@ -63,7 +72,7 @@ export default function RepoSelector({ onRepoSelect }) {
         {repos.map((repo, idx) => (
           <li
             key={idx}
-            onClick={() => onRepoSelect(repo)}
+            onClick={() => selectRepo(repo)}
             className="group p-4 bg-gradient-to-r from-gray-800 to-gray-700 rounded-xl shadow-md hover:from-gray-700 hover:to-gray-600 cursor-pointer transition-all duration-300 border border-gray-600 hover:border-blue-500"
           >
             <div className="flex items-center justify-between">
@@ -1,28 +1,61 @@
-﻿import asyncio
+﻿import ast
+import asyncio
+import base64
+import bisect
+import contextvars
+import cProfile
+import gzip
+import hashlib
+import heapq
+import hmac
+import io
 import json
 import logging
+import marshal
+import math
 import os
+import pstats
+import random
+import re
+import socket
 import sqlite3
+import sys
+import tarfile
+import threading
 import time
-from typing import Optional
+import traceback
+import tracemalloc
+import weakref
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Callable, Literal, Optional
+from urllib.parse import quote
 from uuid import uuid4
 
 import httpx
-from celery import Celery
 from dotenv import load_dotenv
 from fastapi import Depends, FastAPI, HTTPException, Request, Response
+from fastapi.datastructures import DefaultPlaceholder
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
+from fastapi.routing import APIRoute
 from itsdangerous import URLSafeSerializer
 from pydantic import BaseModel
 from starlette import status
+from starlette.datastructures import Headers, MutableHeaders
 
-# Optional Redis dependency for session storage.
+# Optional faster JSON encoding and brotli compression for responses.
 try:
-    import redis
+    import orjson
 except ImportError:  # pragma: no cover
-    redis = None
-
+    orjson = None
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
 
 # Load environment variables first
 load_dotenv()
@@ -38,6 +71,8 @@ OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "phi3:mini")
 OLLAMA_FALLBACK_MODELS = [
     m.strip() for m in os.getenv("OLLAMA_FALLBACK_MODELS", "").split(",") if m.strip()
 ]
+# Generations in flight per process, across chat, batch and summary requests.
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "2"))
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:5173")
 SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "3600"))
 COOKIE_SECURE = APP_ENV != "development"
@@ -49,13 +84,551 @@ CSRF_ENABLED = APP_ENV != "development"
 CSRF_COOKIE_NAME = "csrf_token"
 CSRF_HEADER_NAME = "x-csrf-token"
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup = _schedule_background(_initialize_in_background())
+    sweeper = start_session_sweeper()
+    loop_monitor = start_loop_monitor()
+    circuit_sync = start_circuit_sync()
+    try:
+        yield
+    finally:
+        for task in (startup, sweeper, loop_monitor, circuit_sync):
+            if task is not None:
+                task.cancel()
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded with orjson when it is installed."""
+
+    def render(self, content) -> bytes:
+        if orjson is not None:
+            try:
+                return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+            except TypeError:
+                pass  # e.g. integers beyond 64 bits; the stdlib copes
+        return super().render(content)
+
+
+class FastJSONRoute(APIRoute):
+    """Routes returning plain data render with FastJSONResponse. Routes with a
+    response model keep FastAPI's Pydantic-to-bytes path, which is faster still
+    and only applies while the response class is left at its default."""
+
+    def get_route_handler(self):
+        if self.response_field is None and isinstance(
+            self.response_class, DefaultPlaceholder
+        ):
+            self.response_class = FastJSONResponse
+        return super().get_route_handler()
+
+
+app = FastAPI(lifespan=lifespan)
+app.router.route_class = FastJSONRoute
 logger = logging.getLogger("codescribe")
 if not logger.handlers:
     logging.basicConfig(
         level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s"
     )
 
+# ---- Metrics (Prometheus text exposition, served from /metrics) ----
+# A deliberately small in-process registry: recording is a dict lookup plus a
+# bisect, cheap enough to leave on in production. Label values are positional in
+# the order declared. Increments are not locked; under the GIL a lost update from
+# a worker thread is possible but rare, which is acceptable for telemetry.
+DEFAULT_LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+)
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.values: dict[tuple, object] = {}
+
+    def _label_str(self, key: tuple, extra: str = "") -> str:
+        parts = [
+            f'{name}="{_escape_label(value)}"' for name, value in zip(self.labels, key)
+        ]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self.samples().items()):
+            lines.append(f"{self.name}{self._label_str(key)} {value}")
+        return lines
+
+    def samples(self) -> dict:
+        return self.values
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+
+class Gauge(_Metric):
+    """Set directly, or computed at scrape time by ``collect() -> {labels: value}``."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=(), collect: Optional[Callable] = None):
+        super().__init__(name, help_text, labels)
+        self.collect = collect
+
+    def set(self, value: float, *label_values):
+        self.values[label_values] = value
+
+    def samples(self) -> dict:
+        return self.collect() if self.collect is not None else self.values
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *label_values):
+        state = self.values.get(label_values)
+        if state is None:
+            # [per-bucket counts (+Inf last), sum, count]
+            state = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, n in zip((*self.buckets, "+Inf"), counts):
+                cumulative += n
+                le = f'le="{bound}"'
+                lines.append(
+                    f"{self.name}_bucket{self._label_str(key, le)} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{self._label_str(key)} {total}")
+            lines.append(f"{self.name}_count{self._label_str(key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def _add(self, metric: _Metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labels=()) -> Counter:
+        return self._add(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=(), collect=None) -> Gauge:
+        return self._add(Gauge(name, help_text, labels, collect))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:  # a broken collector must not take /metrics down
+                logger.warning("Metric %s failed to render: %s", metric.name, e)
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+HTTP_REQUEST_SECONDS = METRICS.histogram(
+    "codescribe_http_request_duration_seconds",
+    "Request latency by route template.",
+    ("method", "route", "status"),
+)
+UPSTREAM_REQUEST_SECONDS = METRICS.histogram(
+    "codescribe_upstream_request_duration_seconds",
+    "Latency of calls to GitHub and Ollama.",
+    ("service", "model"),
+)
+UPSTREAM_RESPONSES = METRICS.counter(
+    "codescribe_upstream_responses_total",
+    "Upstream responses by status code ('error' for transport failures).",
+    ("service", "model", "status"),
+)
+UPSTREAM_RETRIES = METRICS.counter(
+    "codescribe_upstream_retries_total",
+    "Retries issued by gh_get and call_llm.",
+    ("service",),
+)
+CACHE_LOOKUPS = METRICS.counter(
+    "codescribe_cache_lookups_total",
+    "In-process cache lookups by result (hit or miss).",
+    ("cache", "result"),
+)
+SESSION_STORE_SECONDS = METRICS.histogram(
+    "codescribe_session_store_duration_seconds",
+    "Session store operation latency, including the in-process cache.",
+    ("backend", "op"),
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0),
+)
+
+
+def observe_upstream(
+    service: str, started: float, status, model: str = "", retried: bool = False
+):
+    UPSTREAM_REQUEST_SECONDS.observe(time.perf_counter() - started, service, model)
+    UPSTREAM_RESPONSES.inc(service, model, str(status))
+    if retried:
+        UPSTREAM_RETRIES.inc(service)
+
+
+def _cache_hit_ratios() -> dict:
+    ratios = {}
+    for (cache, result), n in list(CACHE_LOOKUPS.values.items()):
+        hits, total = ratios.get((cache,), (0, 0))
+        ratios[(cache,)] = (hits + (n if result == "hit" else 0), total + n)
+    return {k: round(h / t, 4) if t else 0.0 for k, (h, t) in ratios.items()}
+
+
+METRICS.gauge(
+    "codescribe_cache_hit_ratio",
+    "Hit ratio of in-process caches since start.",
+    ("cache",),
+    collect=_cache_hit_ratios,
+)
+
+
+# ---- Request tracing (spans -> Server-Timing header, optional export) ----
+# add_request_context opens a Trace per request, keyed by X-Request-ID; span()
+# records a timed stage under whatever span is current. Outside a request (Celery
+# worker, scripts) span() does nothing. Export to a JSONL file and/or an HTTP
+# collector happens after the response, off the request path.
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+TRACE_EXPORT_URL = os.getenv("TRACE_EXPORT_URL", "")
+_CURRENT_TRACE: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar(
+    "current_trace", default=None
+)
+_CURRENT_SPAN: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+_SERVER_TIMING_TOKEN_RE = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class Trace:
+    def __init__(self, request_id: str, name: str = ""):
+        self.request_id = request_id
+        self.name = name
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self.spans: list[dict] = []
+
+    def start_span(self, name: str, parent: Optional[int], attrs: dict) -> dict:
+        entry = {
+            "id": len(self.spans),
+            "parent": parent,
+            "name": name,
+            "start_ms": round((time.perf_counter() - self._t0) * 1000, 3),
+            "duration_ms": None,
+            **({"attrs": attrs} if attrs else {}),
+        }
+        self.spans.append(entry)
+        return entry
+
+    def server_timing(self, total_ms: Optional[float] = None) -> str:
+        """Aggregate finished spans by name: ``name;dur=<summed ms>;desc="n calls"``."""
+        totals: dict[str, list] = {}
+        for entry in self.spans:
+            if entry["duration_ms"] is None:
+                continue
+            agg = totals.setdefault(entry["name"], [0.0, 0])
+            agg[0] += entry["duration_ms"]
+            agg[1] += 1
+        parts = []
+        for name, (dur, count) in totals.items():
+            token = _SERVER_TIMING_TOKEN_RE.sub("_", name)
+            desc = f';desc="{count} calls"' if count > 1 else ""
+            parts.append(f"{token};dur={dur:.1f}{desc}")
+        if total_ms is not None:
+            parts.append(f"total;dur={total_ms:.1f}")
+        return ", ".join(parts)
+
+    def to_dict(self) -> dict:
+        return {
+            "request_id": self.request_id,
+            "name": self.name,
+            "started": self.started,
+            "spans": self.spans,
+        }
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a stage of the current request; yields the span dict (or None)."""
+    trace = _CURRENT_TRACE.get()
+    if trace is None:
+        yield None
+        return
+    entry = trace.start_span(name, _CURRENT_SPAN.get(), attrs)
+    token = _CURRENT_SPAN.set(entry["id"])
+    started = time.perf_counter()
+    try:
+        yield entry
+    except BaseException as e:
+        entry.setdefault("attrs", {})["error"] = type(e).__name__
+        raise
+    finally:
+        entry["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        _CURRENT_SPAN.reset(token)
+
+
+_EXPORT_FILE_LOCK = threading.Lock()
+
+
+def _append_trace_line(path: str, line: str):
+    with _EXPORT_FILE_LOCK, open(path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+async def export_trace(trace: "Trace"):
+    payload = trace.to_dict()
+    try:
+        if TRACE_EXPORT_PATH:
+            await asyncio.to_thread(
+                _append_trace_line, TRACE_EXPORT_PATH, json.dumps(payload)
+            )
+        if TRACE_EXPORT_URL:
+            await get_http_client().post(TRACE_EXPORT_URL, json=payload, timeout=5.0)
+    except Exception as e:
+        logger.warning("Trace export failed: %s", e)
+
+
+# ---- Request deadlines ----
+# Every request gets a time budget of REQUEST_DEADLINE_SECONDS, or less when the
+# client sends X-Request-Deadline (seconds it is willing to wait, capped at
+# REQUEST_DEADLINE_MAX_SECONDS). GitHub and Ollama calls trim their timeouts to
+# what is left, retries, back-offs and model fallbacks stop once they would
+# overrun it, and generation keeps whatever text it had. Outside a request
+# (Celery worker, scripts) there is no deadline and calls use their own timeouts.
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "60"))
+REQUEST_DEADLINE_MAX_SECONDS = float(os.getenv("REQUEST_DEADLINE_MAX_SECONDS", "120"))
+# Share of the remaining budget GitHub context fetching may use before generation.
+CONTEXT_DEADLINE_SHARE = float(os.getenv("CONTEXT_DEADLINE_SHARE", "0.5"))
+DEADLINE_HEADER = "X-Request-Deadline"
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's time budget ran out; ``partial`` holds any text produced."""
+
+    def __init__(self, stage: str, partial: str = ""):
+        super().__init__(f"Deadline exceeded during {stage}")
+        self.stage = stage
+        self.partial = partial
+
+
+class Deadline:
+    __slots__ = ("at", "parent", "exceeded")
+
+    def __init__(self, seconds: float, parent: Optional["Deadline"] = None):
+        self.at = time.monotonic() + seconds
+        if parent is not None:
+            self.at = min(self.at, parent.at)
+        self.parent = parent
+        self.exceeded = False
+
+    def remaining(self) -> float:
+        return self.at - time.monotonic()
+
+    def mark_exceeded(self):
+        node: Optional[Deadline] = self
+        while node is not None:
+            node.exceeded = True
+            node = node.parent
+
+
+_CURRENT_DEADLINE: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar(
+    "current_deadline", default=None
+)
+
+
+def request_budget(header_value: Optional[str]) -> float:
+    """Seconds a request may take: the configured budget or the client's shorter hint."""
+    budget = REQUEST_DEADLINE_SECONDS
+    try:
+        hint = float(header_value) if header_value else 0.0
+    except ValueError:
+        hint = 0.0
+    if hint > 0:
+        budget = min(hint, REQUEST_DEADLINE_MAX_SECONDS)
+    return budget
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """Run the block under a budget of ``seconds``; nesting only ever shortens it."""
+    if seconds is None:
+        yield _CURRENT_DEADLINE.get()
+        return
+    scope = Deadline(seconds, _CURRENT_DEADLINE.get())
+    token = _CURRENT_DEADLINE.set(scope)
+    try:
+        yield scope
+    finally:
+        _CURRENT_DEADLINE.reset(token)
+
+
+def deadline_remaining() -> Optional[float]:
+    """Seconds left in the current budget, or None when there is no deadline."""
+    current = _CURRENT_DEADLINE.get()
+    return None if current is None else current.remaining()
+
+
+def deadline_share(fraction: float) -> Optional[float]:
+    """``fraction`` of the remaining budget, for a stage that must leave time over."""
+    remaining = deadline_remaining()
+    return None if remaining is None else max(0.0, remaining * fraction)
+
+
+def deadline_expired() -> bool:
+    current = _CURRENT_DEADLINE.get()
+    if current is None or current.remaining() > 0:
+        return False
+    current.mark_exceeded()
+    return True
+
+
+def deadline_timeout(default: float, stage: str) -> float:
+    """``default`` trimmed to the remaining budget; raises once nothing is left."""
+    remaining = deadline_remaining()
+    if remaining is None:
+        return default
+    if remaining <= 0:
+        _CURRENT_DEADLINE.get().mark_exceeded()
+        raise DeadlineExceeded(stage)
+    return min(default, remaining)
+
+
+def deadline_allows(seconds: float) -> bool:
+    """Whether waiting ``seconds`` (a back-off) still leaves budget for another try."""
+    current = _CURRENT_DEADLINE.get()
+    if current is None or current.remaining() > seconds:
+        return True
+    current.mark_exceeded()
+    return False
+
+
+# ---- Event-loop lag monitor and blocking-call watchdog ----
+# A coroutine wakes every LOOP_LAG_INTERVAL_SECONDS and records how late it woke
+# (the loop lag). A daemon thread watches its heartbeat: when the loop has not come
+# back for LOOP_BLOCK_THRESHOLD_SECONDS past the interval, whatever is running on
+# the loop thread is blocking it, so the watchdog captures that thread's stack,
+# logs it once per stall and keeps the last few for /debug/loop-blocks.
+# LOOP_DEBUG=true also turns on asyncio debug mode, which names each slow callback.
+LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("LOOP_LAG_INTERVAL_SECONDS", "0.5"))
+LOOP_BLOCK_THRESHOLD_SECONDS = float(os.getenv("LOOP_BLOCK_THRESHOLD_SECONDS", "0.25"))
+LOOP_DEBUG = os.getenv("LOOP_DEBUG", "false").lower() in ("1", "true", "yes")
+_LOOP_BLOCK_REPORTS: deque = deque(maxlen=20)
+_loop_monitor_state = {"heartbeat": None, "thread_id": None, "max_lag": 0.0}
+LOOP_LAG_SECONDS = METRICS.histogram(
+    "codescribe_event_loop_lag_seconds",
+    "How late the event loop ran a timer scheduled LOOP_LAG_INTERVAL_SECONDS ahead.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+LOOP_BLOCKS = METRICS.counter(
+    "codescribe_event_loop_blocked_total",
+    "Stalls longer than LOOP_BLOCK_THRESHOLD_SECONDS caught by the watchdog.",
+)
+METRICS.gauge(
+    "codescribe_event_loop_lag_max_seconds",
+    "Largest loop lag observed since start.",
+    collect=lambda: {(): _loop_monitor_state["max_lag"]},
+)
+
+
+async def _loop_lag_monitor():
+    while True:
+        _loop_monitor_state["heartbeat"] = time.monotonic()
+        expected = time.perf_counter() + LOOP_LAG_INTERVAL_SECONDS
+        await asyncio.sleep(LOOP_LAG_INTERVAL_SECONDS)
+        lag = max(0.0, time.perf_counter() - expected)
+        LOOP_LAG_SECONDS.observe(lag)
+        if lag > _loop_monitor_state["max_lag"]:
+            _loop_monitor_state["max_lag"] = lag
+
+
+def _capture_loop_stack(stalled_for: float):
+    frame = sys._current_frames().get(_loop_monitor_state["thread_id"])
+    if frame is None:
+        return
+    stack = "".join(traceback.format_stack(frame))
+    LOOP_BLOCKS.inc()
+    _LOOP_BLOCK_REPORTS.append(
+        {"at": time.time(), "stalled_ms": round(stalled_for * 1000, 1), "stack": stack}
+    )
+    logger.warning(
+        "Event loop blocked for over %.0fms; loop thread is in:\n%s",
+        stalled_for * 1000,
+        stack,
+    )
+
+
+def _loop_watchdog(stop: threading.Event):
+    reported_beat = None
+    while not stop.wait(max(0.01, LOOP_BLOCK_THRESHOLD_SECONDS / 2)):
+        beat = _loop_monitor_state["heartbeat"]
+        if beat is None or beat == reported_beat:
+            continue  # not started, or this stall was already reported
+        stalled_for = time.monotonic() - beat - LOOP_LAG_INTERVAL_SECONDS
+        if stalled_for > LOOP_BLOCK_THRESHOLD_SECONDS:
+            reported_beat = beat
+            _capture_loop_stack(stalled_for)
+
+
+def start_loop_monitor() -> Optional[asyncio.Task]:
+    """Start the lag monitor on the running loop and its watchdog thread."""
+    if LOOP_LAG_INTERVAL_SECONDS <= 0:
+        return None
+    loop = asyncio.get_running_loop()
+    if LOOP_DEBUG:
+        loop.set_debug(True)
+        loop.slow_callback_duration = LOOP_BLOCK_THRESHOLD_SECONDS
+    _loop_monitor_state["thread_id"] = threading.get_ident()
+    _loop_monitor_state["heartbeat"] = None
+    task = _schedule_background(_loop_lag_monitor())
+    stop = threading.Event()
+    task.add_done_callback(lambda _: stop.set())
+    threading.Thread(
+        target=_loop_watchdog, args=(stop,), name="loop-watchdog", daemon=True
+    ).start()
+    return task
+
+
 # ---- Session persistence ----
 SESSION_STORE_TYPE = os.getenv("SESSION_STORE_TYPE", "sqlite").lower()
 SESSIONS_FILE = "sessions.json"  # legacy migration source (migrated at startup)
@@ -64,9 +637,32 @@ REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
 # Redis client (lazy init).
 _redis_client = None
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+# Reads push a Redis session's expiry SESSION_TTL_SECONDS into the future, but
+# never past SESSION_MAX_LIFETIME_SECONDS after login.
+SESSION_SLIDING_EXPIRATION = os.getenv(
+    "SESSION_SLIDING_EXPIRATION", "false"
+).lower() in ("1", "true", "yes")
+SESSION_MAX_LIFETIME_SECONDS = int(os.getenv("SESSION_MAX_LIFETIME_SECONDS", "86400"))
+
+
+def session_lifetime_end(data: dict) -> float:
+    """When a session must end however often it is used.
+
+    Sessions written before ``issued_at`` was recorded count from their last
+    stored expiry.
+    """
+    issued = data.get("issued_at")
+    if issued is None:
+        issued = float(data.get("expires", 0)) - SESSION_TTL_SECONDS
+    return float(issued) + SESSION_MAX_LIFETIME_SECONDS
+
 
 # ---- GitHub API URL ----
-GITHUB_API_URL = "https://api.github.com/users"
+# Overridable so tests and benchmarks can point the app at a local stand-in.
+GITHUB_API_BASE = os.getenv("GITHUB_API_BASE", "https://api.github.com").rstrip("/")
+GITHUB_WEB_BASE = os.getenv("GITHUB_WEB_BASE", "https://github.com").rstrip("/")
+GITHUB_API_URL = f"{GITHUB_API_BASE}/users"
 
 
 class ChatRequest(BaseModel):
@@ -84,17 +680,101 @@ class ChatResponse(BaseModel):
     meta: dict = {}
 
 
+# One writer connection per process (reopened if SESSIONS_DB_PATH changes), in WAL
+# mode so readers never wait on the writer. The lock serialises use of the writer
+# between the event loop thread (sync API) and the session write thread (async
+# API). Session lookups use a read-only connection per thread instead.
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+_db_conn: Optional[sqlite3.Connection] = None
+_db_conn_path: Optional[str] = None
+_db_lock = threading.RLock()
+_db_read_local = threading.local()
+
+
+def _get_db_connection() -> sqlite3.Connection:
+    global _db_conn, _db_conn_path
+    if _db_conn is not None and _db_conn_path == SESSIONS_DB_PATH:
+        return _db_conn
+    if _db_conn is not None:
+        _db_conn.close()
+    conn = sqlite3.connect(
+        SESSIONS_DB_PATH, check_same_thread=False, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000
+    )
+    conn.row_factory = sqlite3.Row
+    # Only takes effect on a fresh file (before WAL and the first table); lets the
+    # sweeper hand freed pages back with PRAGMA incremental_vacuum.
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    # NORMAL is durable across application crashes in WAL mode; only an OS crash
+    # can roll back the last commits, which for sessions means a re-login.
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    # Idempotent and cheap, so direct callers (scripts, tests) never depend on
+    # startup having run first.
+    with conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                expires REAL NOT NULL
+            )
+            """)
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires)"
+        )
+    _db_conn, _db_conn_path = conn, SESSIONS_DB_PATH
+    return conn
+
+
+@contextmanager
 def _db_connect():
-    conn = sqlite3.connect(SESSIONS_DB_PATH)
+    """Yield the shared connection inside a transaction (commit/rollback on exit)."""
+    with _db_lock:
+        conn = _get_db_connection()
+        with conn:
+            yield conn
+
+
+def _get_read_connection() -> sqlite3.Connection:
+    """This thread's read-only connection; WAL lets it read while a write commits."""
+    conn = getattr(_db_read_local, "conn", None)
+    if conn is not None and _db_read_local.path == SESSIONS_DB_PATH:
+        return conn
+    if conn is not None:
+        conn.close()
+    conn = sqlite3.connect(SESSIONS_DB_PATH, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
     conn.row_factory = sqlite3.Row
+    if not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sessions'"
+    ).fetchone():
+        with _db_lock:
+            _get_db_connection()  # creates WAL mode and the schema
+    conn.execute("PRAGMA query_only=ON")
+    _db_read_local.conn, _db_read_local.path = conn, SESSIONS_DB_PATH
     return conn
 
 
+# Optional Redis dependency (Redis sessions, shared breakers, task events). It is
+# imported on first use, so web workers on the SQLite store never load it;
+# ``main.redis`` resolves through the module __getattr__ below.
+def _redis_module():
+    """The redis package (with redis.asyncio), or None when it is not installed."""
+    if "redis" not in globals():
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError:  # pragma: no cover
+            redis = None
+        globals()["redis"] = redis
+    return globals()["redis"]
+
+
 def _get_redis_client():
     global _redis_client
     if _redis_client:
         return _redis_client
 
+    redis = _redis_module()
     if redis is None:
         raise RuntimeError(
             "Redis support is not installed. Install the 'redis' package or switch SESSION_STORE_TYPE to 'sqlite'."
@@ -108,25 +788,137 @@ def _get_redis_client():
     return _redis_client
 
 
+# redis.asyncio connections belong to the loop that opened them, so each event loop
+# gets its own client (per Redis URL) over a shared, bounded pool (same scheme as
+# get_http_client).
+_ASYNC_REDIS_CLIENTS: (
+    "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, object]]"
+) = weakref.WeakKeyDictionary()
+
+
+def _get_async_redis_client(url: Optional[str] = None):
+    """Pooled redis.asyncio client for ``url`` (REDIS_URL by default)."""
+    redis = _redis_module()
+    if redis is None:
+        raise RuntimeError(
+            "Redis support is not installed. Install the 'redis' package or switch SESSION_STORE_TYPE to 'sqlite'."
+        )
+    url = url or REDIS_URL
+    clients = _ASYNC_REDIS_CLIENTS.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(url)
+    if client is None:
+        pool = redis.asyncio.ConnectionPool.from_url(
+            url, decode_responses=True, max_connections=REDIS_MAX_CONNECTIONS
+        )
+        client = clients[url] = redis.asyncio.Redis(connection_pool=pool)
+    return client
+
+
 def init_session_store():
     if SESSION_STORE_TYPE == "redis":
         _get_redis_client()
         return
 
-    with _db_connect() as conn:
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS sessions (
-                session_id TEXT PRIMARY KEY,
-                data TEXT NOT NULL,
-                expires REAL NOT NULL
-            )
-            """)
-        conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires)"
-        )
+    with _db_lock:
+        _get_db_connection()  # opens the file and creates the schema
+
+
+# ---- In-process cache of decoded sessions ----
+# Saves a SQLite/Redis round trip plus JSON decode on every authenticated request.
+# Entries live SESSION_CACHE_TTL_SECONDS at most and never past the session's own
+# expiry; writes/deletes invalidate locally and, with Redis, on every worker.
+SESSION_CACHE_TTL_SECONDS = float(os.getenv("SESSION_CACHE_TTL_SECONDS", "5"))
+SESSION_CACHE_MAX_ENTRIES = 10000
+SESSION_INVALIDATION_CHANNEL = "session-invalidate"
+_SESSION_CACHE: dict[str, tuple[float, dict]] = {}
+_SESSION_CACHE_STATS = {"hits": 0, "misses": 0, "invalidations": 0}
+_session_listener_started = False
+SESSION_CACHE_INVALIDATIONS = METRICS.counter(
+    "codescribe_session_cache_invalidations_total",
+    "Cached sessions dropped because the session was written or deleted.",
+)
+METRICS.gauge(
+    "codescribe_session_cache_entries",
+    "Sessions held in the in-process session cache.",
+    collect=lambda: {(): len(_SESSION_CACHE)},
+)
+
+
+def _session_cache_get(session_id: str) -> Optional[dict]:
+    hit = _SESSION_CACHE.get(session_id)
+    if hit and hit[0] > time.time():
+        _SESSION_CACHE_STATS["hits"] += 1
+        CACHE_LOOKUPS.inc("session", "hit")
+        return dict(hit[1])
+    if hit:
+        _SESSION_CACHE.pop(session_id, None)
+    _SESSION_CACHE_STATS["misses"] += 1
+    CACHE_LOOKUPS.inc("session", "miss")
+    return None
+
+
+def _session_cache_put(session_id: str, data: dict):
+    if SESSION_CACHE_TTL_SECONDS <= 0:
+        return
+    if len(_SESSION_CACHE) >= SESSION_CACHE_MAX_ENTRIES:
+        now = time.time()
+        for sid in [k for k, (exp, _) in _SESSION_CACHE.items() if exp <= now]:
+            _SESSION_CACHE.pop(sid, None)
+        if len(_SESSION_CACHE) >= SESSION_CACHE_MAX_ENTRIES:
+            _SESSION_CACHE.clear()
+    expires = min(
+        time.time() + SESSION_CACHE_TTL_SECONDS, float(data.get("expires", 0))
+    )
+    _SESSION_CACHE[session_id] = (expires, dict(data))
+    if SESSION_STORE_TYPE == "redis":
+        _start_session_invalidation_listener()
+
+
+def session_cache_invalidate(session_id: str, broadcast: bool = True):
+    if _SESSION_CACHE.pop(session_id, None) is not None:
+        _SESSION_CACHE_STATS["invalidations"] += 1
+        SESSION_CACHE_INVALIDATIONS.inc()
+    if broadcast and SESSION_STORE_TYPE == "redis":
+        try:
+            _get_redis_client().publish(SESSION_INVALIDATION_CHANNEL, session_id)
+        except Exception as e:
+            logger.warning("Session invalidation broadcast failed: %s", e)
+
+
+def _start_session_invalidation_listener():
+    """Drop cached sessions changed by other workers (Redis pub/sub, daemon thread)."""
+    global _session_listener_started
+    if _session_listener_started:
+        return
+    _session_listener_started = True
+
+    def listen():
+        try:
+            pubsub = _get_redis_client().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(SESSION_INVALIDATION_CHANNEL)
+            for message in pubsub.listen():
+                session_cache_invalidate(message["data"], broadcast=False)
+        except Exception as e:
+            # Cached entries still expire after SESSION_CACHE_TTL_SECONDS.
+            logger.warning("Session invalidation listener stopped: %s", e)
+
+    threading.Thread(target=listen, name="session-invalidation", daemon=True).start()
+
+
+def session_cache_stats() -> dict:
+    lookups = _SESSION_CACHE_STATS["hits"] + _SESSION_CACHE_STATS["misses"]
+    return {
+        **_SESSION_CACHE_STATS,
+        "entries": len(_SESSION_CACHE),
+        "hit_rate": (
+            round(_SESSION_CACHE_STATS["hits"] / lookups, 4) if lookups else 0.0
+        ),
+        "ttl_seconds": SESSION_CACHE_TTL_SECONDS,
+    }
 
 
 def session_store_set(session_id: str, data: dict):
+    session_cache_invalidate(session_id)
     expires = float(data.get("expires", 0))
 
     if SESSION_STORE_TYPE == "redis":
@@ -146,6 +938,16 @@ def session_store_set(session_id: str, data: dict):
 
 
 def session_store_get(session_id: str) -> Optional[dict]:
+    cached = _session_cache_get(session_id)
+    if cached is not None:
+        return cached
+    data = _session_store_read(session_id)
+    if data is not None:
+        _session_cache_put(session_id, data)
+    return data
+
+
+def _session_store_read(session_id: str) -> Optional[dict]:
     if SESSION_STORE_TYPE == "redis":
         client = _get_redis_client()
         raw = client.get(f"session:{session_id}")
@@ -156,29 +958,39 @@ def session_store_get(session_id: str) -> Optional[dict]:
         except Exception:
             client.delete(f"session:{session_id}")
             return None
-        if float(data.get("expires", 0)) < time.time():
+        # With sliding expiration the key TTL is authoritative; the stored
+        # "expires" only records the last write.
+        if SESSION_SLIDING_EXPIRATION:
+            expired = session_lifetime_end(data) <= time.time()
+        else:
+            expired = float(data.get("expires", 0)) < time.time()
+        if expired:
             client.delete(f"session:{session_id}")
             return None
         return data
 
-    with _db_connect() as conn:
-        row = conn.execute(
+    row = (
+        _get_read_connection()
+        .execute(
             "SELECT data, expires FROM sessions WHERE session_id = ?",
             (session_id,),
-        ).fetchone()
-        if not row:
-            return None
-        if float(row["expires"]) < time.time():
-            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
-            return None
-        try:
-            return json.loads(row["data"])
-        except Exception:
+        )
+        .fetchone()
+    )
+    if not row:
+        return None
+    if float(row["expires"]) < time.time():
+        return None  # the sweeper deletes it
+    try:
+        return json.loads(row["data"])
+    except Exception:
+        with _db_connect() as conn:
             conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
-            return None
+        return None
 
 
 def session_store_delete(session_id: str):
+    session_cache_invalidate(session_id)
     if SESSION_STORE_TYPE == "redis":
         client = _get_redis_client()
         client.delete(f"session:{session_id}")
@@ -188,61 +1000,772 @@ def session_store_delete(session_id: str):
         conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
 
 
-def session_store_cleanup_expired():
-    if SESSION_STORE_TYPE == "redis":
-        # Redis expires keys automatically.
+# ---- Async session API ----
+# Handlers use these so SQLite I/O runs off the event loop. Writes go through one
+# dedicated thread and are queued and flushed together in one transaction: while a
+# flush is running, new writes pile up and go out in the next one, so a login burst
+# costs a handful of commits rather than one fsync per user. Reads have their own
+# small pool with per-thread connections, so they never queue behind a flush.
+SESSION_READ_THREADS = int(os.getenv("SESSION_READ_THREADS", "4"))
+_SESSION_IO_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sessions")
+_SESSION_READ_EXECUTOR = ThreadPoolExecutor(
+    max_workers=max(1, SESSION_READ_THREADS), thread_name_prefix="session-reads"
+)
+_SESSION_WRITE_QUEUE: list[tuple] = []
+_SESSION_WRITES_IN_FLIGHT: list[tuple] = []  # the batch being committed
+_session_queue_lock = threading.Lock()
+_session_flush_pending = False
+
+
+def _flush_session_writes():
+    global _session_flush_pending
+    with _session_queue_lock:
+        batch = list(_SESSION_WRITE_QUEUE)
+        _SESSION_WRITE_QUEUE.clear()
+        _SESSION_WRITES_IN_FLIGHT[:] = batch
+        _session_flush_pending = False
+    if not batch:
         return
-
-    with _db_connect() as conn:
-        conn.execute("DELETE FROM sessions WHERE expires < ?", (time.time(),))
+    error = None
+    try:
+        with _db_connect() as conn:
+            for op, session_id, data, _, _ in batch:
+                if op == "set":
+                    conn.execute(
+                        "INSERT OR REPLACE INTO sessions (session_id, data, expires) VALUES (?, ?, ?)",
+                        (session_id, json.dumps(data), float(data.get("expires", 0))),
+                    )
+                else:
+                    conn.execute(
+                        "DELETE FROM sessions WHERE session_id = ?", (session_id,)
+                    )
+    except Exception as e:
+        logger.error("Session write batch of %d failed: %s", len(batch), e)
+        error = e
+    with _session_queue_lock:
+        _SESSION_WRITES_IN_FLIGHT.clear()
+    for _, _, _, loop, future in batch:
+        try:
+            loop.call_soon_threadsafe(_resolve_session_write, future, error)
+        except RuntimeError:
+            pass  # loop already closed; nobody is waiting
 
 
-def migrate_legacy_sessions():
-    if not os.path.exists(SESSIONS_FILE):
+def _resolve_session_write(future: asyncio.Future, error: Optional[Exception]):
+    if future.done():
         return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(None)
+
+
+def _pending_session_write(session_id: str) -> Optional[tuple[str, Optional[dict]]]:
+    """The newest uncommitted (op, data) for ``session_id``, if any.
+
+    Reads run beside the write thread, so a write that is still queued or in
+    the middle of its flush has to be served from here.
+    """
+    with _session_queue_lock:
+        pending = _SESSION_WRITES_IN_FLIGHT + _SESSION_WRITE_QUEUE
+        for op, queued_id, data, _, _ in reversed(pending):
+            if queued_id == session_id:
+                if op == "set" and float(data.get("expires", 0)) < time.time():
+                    return op, None
+                return op, (data if op == "set" else None)
+    return None
+
+
+async def _queue_session_write(op: str, session_id: str, data: Optional[dict] = None):
+    global _session_flush_pending
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    with _session_queue_lock:
+        _SESSION_WRITE_QUEUE.append((op, session_id, data, loop, future))
+        schedule = not _session_flush_pending
+        _session_flush_pending = True
+    if schedule:
+        _SESSION_IO_EXECUTOR.submit(_flush_session_writes)
+    await future
+
+
+async def asession_store_get(session_id: str) -> Optional[dict]:
+    started = time.perf_counter()
     try:
-        with open(SESSIONS_FILE, "r") as f:
-            legacy = json.load(f)
-    except Exception:
-        return
-    if not isinstance(legacy, dict):
-        return
-    for sid, data in legacy.items():
-        if isinstance(data, dict):
-            session_store_set(sid, data)
-    # Do not remove the legacy file automatically; keep it for audit and recovery.
+        return await _asession_store_get(session_id)
+    finally:
+        SESSION_STORE_SECONDS.observe(
+            time.perf_counter() - started, SESSION_STORE_TYPE, "get"
+        )
 
 
-init_session_store()
-migrate_legacy_sessions()
-session_store_cleanup_expired()
-# ---- Cookie signing ----
-SECRET_KEY = os.getenv("SECRET_KEY")
-if not SECRET_KEY:
-    if APP_ENV == "development":
-        SECRET_KEY = "dev-only-secret-change-me"
-        print("WARNING: SECRET_KEY is not set. Using an insecure development fallback.")
+async def _asession_store_get(session_id: str) -> Optional[dict]:
+    cached = _session_cache_get(session_id)
+    if cached is not None:
+        return cached
+    if SESSION_STORE_TYPE == "redis":
+        data = await _aredis_session_read(session_id)
     else:
-        raise RuntimeError("SECRET_KEY must be set when APP_ENV is not 'development'.")
-serializer = URLSafeSerializer(SECRET_KEY)
+        pending = _pending_session_write(session_id)
+        if pending is not None:
+            return pending[1]
+        data = await asyncio.get_running_loop().run_in_executor(
+            _SESSION_READ_EXECUTOR, _session_store_read, session_id
+        )
+    if data is not None:
+        _session_cache_put(session_id, data)
+    return data
 
-# ---- CORS ----
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:5173", "http://127.0.0.1:5173"],  # frontend
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
+async def asession_store_set(session_id: str, data: dict):
+    started = time.perf_counter()
+    if SESSION_STORE_TYPE == "redis":
+        ttl = max(1, int(float(data.get("expires", 0)) - time.time()))
+        await _aredis_session_write(session_id, json.dumps(data), ttl)
+    else:
+        session_cache_invalidate(session_id)
+        await _queue_session_write("set", session_id, data)
+    SESSION_STORE_SECONDS.observe(
+        time.perf_counter() - started, SESSION_STORE_TYPE, "set"
+    )
 
-@app.middleware("http")
-async def add_request_context(request: Request, call_next):
+
+async def asession_store_delete(session_id: str):
+    started = time.perf_counter()
+    if SESSION_STORE_TYPE == "redis":
+        await _aredis_session_write(session_id, None)
+    else:
+        session_cache_invalidate(session_id)
+        await _queue_session_write("delete", session_id)
+    SESSION_STORE_SECONDS.observe(
+        time.perf_counter() - started, SESSION_STORE_TYPE, "delete"
+    )
+
+
+async def _aredis_session_read(session_id: str) -> Optional[dict]:
+    """GET the session and, with sliding expiration, EXPIRE it in the same round trip."""
+    key = f"session:{session_id}"
+    async with _get_async_redis_client().pipeline(transaction=False) as pipe:
+        pipe.get(key)
+        if SESSION_SLIDING_EXPIRATION:
+            pipe.expire(key, SESSION_TTL_SECONDS)
+        raw = (await pipe.execute())[0]
+    if not raw:
+        return None
+    try:
+        data = json.loads(raw)
+    except Exception:
+        await _get_async_redis_client().delete(key)
+        return None
+    if SESSION_SLIDING_EXPIRATION:
+        now = time.time()
+        end = session_lifetime_end(data)
+        if end <= now:
+            await _get_async_redis_client().delete(key)
+            return None
+        if end < now + SESSION_TTL_SECONDS:
+            # Last stretch: the EXPIRE above must not outlive the absolute cap.
+            await _get_async_redis_client().expire(key, max(1, int(end - now)))
+        data["expires"] = max(
+            float(data.get("expires", 0)), min(end, now + SESSION_TTL_SECONDS)
+        )
+    elif float(data.get("expires", 0)) < time.time():
+        await _get_async_redis_client().delete(key)
+        return None
+    return data
+
+
+async def _aredis_session_write(session_id: str, raw: Optional[str], ttl: int = 0):
+    """SET (or DELETE when raw is None) and broadcast the cache invalidation together."""
+    session_cache_invalidate(session_id, broadcast=False)
+    key = f"session:{session_id}"
+    async with _get_async_redis_client().pipeline(transaction=False) as pipe:
+        if raw is None:
+            pipe.delete(key)
+        else:
+            pipe.set(key, raw, ex=ttl)
+        pipe.publish(SESSION_INVALIDATION_CHANNEL, session_id)
+        await pipe.execute()
+
+
+def session_store_cleanup_expired():
+    if SESSION_STORE_TYPE == "redis":
+        # Redis expires keys automatically.
+        return
+
+    while (
+        _delete_expired_session_batch(SESSION_SWEEP_BATCH_SIZE)
+        >= SESSION_SWEEP_BATCH_SIZE
+    ):
+        pass
+
+
+# ---- Expired-session sweeper ----
+# Deletes expired rows in bounded batches (one short transaction each, walking
+# idx_sessions_expires) so the table cannot grow without bound, and now and then
+# returns free pages to the filesystem. Only writes and sweeps share the session
+# writer thread, so batches interleave with queued writes; reads run on
+# _SESSION_READ_EXECUTOR and never wait for a sweep.
+SESSION_SWEEP_INTERVAL_SECONDS = float(
+    os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "300")
+)
+SESSION_SWEEP_BATCH_SIZE = int(os.getenv("SESSION_SWEEP_BATCH_SIZE", "500"))
+SESSION_VACUUM_EVERY_SWEEPS = 12
+SESSION_VACUUM_PAGES = 1000
+_SESSION_SWEEP_STATS = {
+    "sweeps": 0,
+    "rows_deleted": 0,
+    "batches": 0,
+    "vacuums": 0,
+    "seconds_total": 0.0,
+    "last_rows_deleted": 0,
+    "last_duration_ms": 0.0,
+    "last_run": None,
+}
+SESSION_SWEEPS = METRICS.counter(
+    "codescribe_session_sweeps_total", "Expired-session sweeps of the SQLite store."
+)
+SESSION_SWEEP_ROWS = METRICS.counter(
+    "codescribe_session_sweep_rows_deleted_total",
+    "Expired session rows removed by the sweeper.",
+)
+SESSION_SWEEP_SECONDS = METRICS.histogram(
+    "codescribe_session_sweep_duration_seconds",
+    "Time one sweep took, including its incremental vacuum.",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10),
+)
+
+
+def _delete_expired_session_batch(limit: int) -> int:
+    with _db_connect() as conn:
+        cur = conn.execute(
+            "DELETE FROM sessions WHERE rowid IN ("
+            "SELECT rowid FROM sessions WHERE expires < ? ORDER BY expires LIMIT ?)",
+            (time.time(), limit),
+        )
+        return cur.rowcount
+
+
+def _incremental_vacuum(pages: int):
+    with _db_lock:
+        # executescript steps the pragma to completion; execute() frees one page.
+        _get_db_connection().executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+
+
+async def sweep_expired_sessions() -> int:
+    """Run one sweep; returns the number of rows removed."""
+    if SESSION_STORE_TYPE == "redis":
+        return 0  # Redis expires keys itself.
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    removed = 0
+    while True:
+        deleted = await loop.run_in_executor(
+            _SESSION_IO_EXECUTOR,
+            _delete_expired_session_batch,
+            SESSION_SWEEP_BATCH_SIZE,
+        )
+        removed += deleted
+        _SESSION_SWEEP_STATS["batches"] += 1
+        if deleted < SESSION_SWEEP_BATCH_SIZE:
+            break
+    _SESSION_SWEEP_STATS["sweeps"] += 1
+    if _SESSION_SWEEP_STATS["sweeps"] % SESSION_VACUUM_EVERY_SWEEPS == 0:
+        await loop.run_in_executor(
+            _SESSION_IO_EXECUTOR, _incremental_vacuum, SESSION_VACUUM_PAGES
+        )
+        _SESSION_SWEEP_STATS["vacuums"] += 1
+    elapsed = time.perf_counter() - start
+    _SESSION_SWEEP_STATS["rows_deleted"] += removed
+    _SESSION_SWEEP_STATS["seconds_total"] += elapsed
+    _SESSION_SWEEP_STATS["last_rows_deleted"] = removed
+    _SESSION_SWEEP_STATS["last_duration_ms"] = round(elapsed * 1000, 2)
+    _SESSION_SWEEP_STATS["last_run"] = time.time()
+    SESSION_SWEEPS.inc()
+    SESSION_SWEEP_ROWS.inc(amount=removed)
+    SESSION_SWEEP_SECONDS.observe(elapsed)
+    if removed:
+        logger.info("Swept %d expired sessions in %.1fms", removed, elapsed * 1000)
+    return removed
+
+
+async def _session_sweeper_loop():
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL_SECONDS)
+        try:
+            await sweep_expired_sessions()
+        except Exception as e:
+            logger.warning("Session sweep failed: %s", e)
+
+
+def start_session_sweeper() -> Optional[asyncio.Task]:
+    if SESSION_STORE_TYPE == "redis" or SESSION_SWEEP_INTERVAL_SECONDS <= 0:
+        return None
+    return _schedule_background(_session_sweeper_loop())
+
+
+def session_sweep_stats() -> dict:
+    return {
+        **_SESSION_SWEEP_STATS,
+        "seconds_total": round(_SESSION_SWEEP_STATS["seconds_total"], 4),
+        "interval_seconds": SESSION_SWEEP_INTERVAL_SECONDS,
+    }
+
+
+def migrate_legacy_sessions():
+    if not os.path.exists(SESSIONS_FILE):
+        return
+    try:
+        with open(SESSIONS_FILE, "r") as f:
+            legacy = json.load(f)
+    except Exception:
+        return
+    if not isinstance(legacy, dict):
+        return
+    for sid, data in legacy.items():
+        if isinstance(data, dict):
+            session_store_set(sid, data)
+    # Do not remove the legacy file automatically; keep it for audit and recovery.
+
+
+# ---- Startup and readiness ----
+# Importing main does no I/O. Storage setup (schema or Redis connection, legacy
+# session migration, purge of expired rows) runs once, off the event loop. The
+# lifespan starts it in the background so the server binds and answers /health
+# at once; /ready answers 503 until it has finished and other requests wait for
+# it. Without a lifespan (bare TestClient, embedding) the first request runs it.
+_STARTUP_LOCK = threading.Lock()
+_STARTUP_STATE = {"ready": False, "error": None, "seconds": None}
+_STARTUP_EXEMPT_PATHS = {"/health", "/ready", "/metrics"}
+
+
+def initialize_storage():
+    """Run storage setup once per process; thread-safe, retried after a failure."""
+    if _STARTUP_STATE["ready"]:
+        return
+    with _STARTUP_LOCK:
+        if _STARTUP_STATE["ready"]:
+            return
+        started = time.perf_counter()
+        try:
+            init_session_store()
+            migrate_legacy_sessions()
+            session_store_cleanup_expired()
+        except Exception as e:
+            _STARTUP_STATE["error"] = str(e)
+            raise
+        _STARTUP_STATE.update(
+            ready=True, error=None, seconds=round(time.perf_counter() - started, 4)
+        )
+
+
+async def ensure_ready():
+    if not _STARTUP_STATE["ready"]:
+        await asyncio.to_thread(initialize_storage)
+
+
+async def _initialize_in_background():
+    try:
+        await ensure_ready()
+        logger.info("Storage ready in %ss", _STARTUP_STATE["seconds"])
+    except Exception as e:
+        logger.error("Storage initialization failed (retried per request): %s", e)
+
+
+# ---- Cookie signing ----
+SECRET_KEY = os.getenv("SECRET_KEY")
+if not SECRET_KEY:
+    if APP_ENV == "development":
+        SECRET_KEY = "dev-only-secret-change-me"
+        logger.warning("SECRET_KEY is not set. Using an insecure development fallback.")
+    else:
+        raise RuntimeError("SECRET_KEY must be set when APP_ENV is not 'development'.")
+serializer = URLSafeSerializer(SECRET_KEY)
+
+# ---- CORS ----
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["http://localhost:5173", "http://127.0.0.1:5173"],  # frontend
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=[
+        "X-Request-ID",
+        "Server-Timing",
+        "X-Profile-ID",
+        "X-Deadline-Exceeded",
+    ],
+)
+
+
+# ---- Traffic capture (opt-in, replayed by benchmarks/replay.py) ----
+# With TRAFFIC_CAPTURE_PATH set, capture_traffic appends one JSON line per sampled
+# request: the inbound method, path, query and body, the response status and
+# timings, and every upstream exchange made while serving it (status, a few
+# headers, body and timings). Upstream traffic is seen by a transport wrapped
+# around the app's httpx clients, so streamed responses still stream. Cookies and
+# auth headers are never written, and OAuth/session/debug routes are skipped.
+TRAFFIC_CAPTURE_PATH = os.getenv("TRAFFIC_CAPTURE_PATH", "")
+TRAFFIC_CAPTURE_SAMPLE_RATE = float(os.getenv("TRAFFIC_CAPTURE_SAMPLE_RATE", "1.0"))
+TRAFFIC_CAPTURE_MAX_BODY_BYTES = int(
+    os.getenv("TRAFFIC_CAPTURE_MAX_BODY_BYTES", "1048576")
+)
+_CAPTURE_SKIP_PREFIXES = ("/auth/", "/login/", "/logout", "/me", "/debug/", "/tasks/")
+_CAPTURE_REQUEST_HEADERS = ("accept", "content-type", "if-none-match")
+_CAPTURE_RESPONSE_HEADERS = (
+    "content-type",
+    "content-encoding",
+    "etag",
+    "last-modified",
+    "retry-after",
+    "x-ratelimit-remaining",
+    "x-ratelimit-reset",
+)
+_CAPTURE_REDACTED_PARAMS = {"code", "state", "token", "access_token", "client_secret"}
+_CURRENT_CAPTURE: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar(
+    "current_capture", default=None
+)
+
+
+def _redact_query(params) -> list[list[str]]:
+    return [
+        [k, "REDACTED" if k.lower() in _CAPTURE_REDACTED_PARAMS else v]
+        for k, v in params.multi_items()
+    ]
+
+
+def _capture_body(data: bytes, total_size: int) -> dict:
+    body = {"size": total_size, "truncated": total_size > len(data)}
+    try:
+        body["text"] = data.decode("utf-8")
+    except UnicodeDecodeError:
+        body["base64"] = base64.b64encode(data).decode("ascii")
+    return body
+
+
+def _upstream_target(url: httpx.URL) -> tuple[str, str]:
+    """Split an upstream URL into (service, path with query) for replay lookup."""
+    path = url.raw_path.decode("ascii")
+    origin = f"{url.scheme}://{url.netloc.decode('ascii')}"
+    for service, base in (
+        ("github", GITHUB_API_BASE),
+        ("ollama", OLLAMA_URL.rstrip("/")),
+    ):
+        if origin == base:
+            return service, path
+        if (origin + path).startswith(base + "/"):
+            return service, (origin + path)[len(base) :]
+    return "other", origin + path
+
+
+class _RecordingStream(httpx.AsyncByteStream):
+    def __init__(self, inner: httpx.AsyncByteStream, entry: dict, started: float):
+        self._inner = inner
+        self._entry = entry
+        self._started = started
+        self._chunks: list[bytes] = []
+        self._kept = 0
+        self._size = 0
+
+    async def __aiter__(self):
+        async for chunk in self._inner:
+            if self._size == 0:
+                self._entry["first_byte_ms"] = _elapsed_ms(self._started)
+            if self._kept < TRAFFIC_CAPTURE_MAX_BODY_BYTES:
+                piece = chunk[: TRAFFIC_CAPTURE_MAX_BODY_BYTES - self._kept]
+                self._chunks.append(piece)
+                self._kept += len(piece)
+            self._size += len(chunk)
+            yield chunk
+
+    async def aclose(self):
+        await self._inner.aclose()
+        if "duration_ms" not in self._entry:
+            self._entry["duration_ms"] = _elapsed_ms(self._started)
+            self._entry["body"] = _capture_body(b"".join(self._chunks), self._size)
+
+
+class _RecordingTransport(httpx.AsyncBaseTransport):
+    """Record each exchange into the current request's capture, if there is one."""
+
+    def __init__(self, inner: httpx.AsyncBaseTransport):
+        self._inner = inner
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        records = _CURRENT_CAPTURE.get()
+        if records is None:
+            return await self._inner.handle_async_request(request)
+        started = time.perf_counter()
+        service, target = _upstream_target(request.url)
+        entry = {"service": service, "method": request.method, "target": target}
+        if service == "ollama":
+            try:
+                entry["model"] = json.loads(request.content or b"{}").get("model")
+            except (ValueError, httpx.RequestNotRead):
+                pass
+        records.append(entry)
+        try:
+            response = await self._inner.handle_async_request(request)
+        except httpx.HTTPError as e:
+            entry["error"] = type(e).__name__
+            entry["duration_ms"] = _elapsed_ms(started)
+            raise
+        entry["status"] = response.status_code
+        entry["headers_ms"] = _elapsed_ms(started)
+        entry["headers"] = {
+            k: response.headers[k]
+            for k in _CAPTURE_RESPONSE_HEADERS
+            if k in response.headers
+        }
+        try:
+            content = response.content  # already in memory (e.g. mock transports)
+        except httpx.ResponseNotRead:
+            response.stream = _RecordingStream(response.stream, entry, started)
+        else:
+            entry["duration_ms"] = entry["headers_ms"]
+            entry["body"] = _capture_body(
+                content[:TRAFFIC_CAPTURE_MAX_BODY_BYTES], len(content)
+            )
+        return response
+
+    async def aclose(self):
+        await self._inner.aclose()
+
+
+def _capture_transport(
+    limits: Optional[httpx.Limits] = None,
+) -> Optional[httpx.AsyncBaseTransport]:
+    """Transport for upstream httpx clients; None (the default) unless capturing."""
+    if not TRAFFIC_CAPTURE_PATH:
+        return None
+    inner = httpx.AsyncHTTPTransport(limits=limits) if limits else None
+    return _RecordingTransport(inner or httpx.AsyncHTTPTransport())
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 3)
+
+
+async def _write_capture(entry: dict):
+    try:
+        await asyncio.to_thread(
+            _append_trace_line, TRAFFIC_CAPTURE_PATH, json.dumps(entry)
+        )
+    except Exception as e:
+        logger.warning("Traffic capture write failed: %s", e)
+
+
+@app.middleware("http")
+async def capture_traffic(request: Request, call_next):
+    if (
+        not TRAFFIC_CAPTURE_PATH
+        or request.url.path.startswith(_CAPTURE_SKIP_PREFIXES)
+        or random.random() >= TRAFFIC_CAPTURE_SAMPLE_RATE
+    ):
+        return await call_next(request)
+
+    body = await request.body()
+    trace = _CURRENT_TRACE.get()
+    entry = {
+        "request_id": trace.request_id if trace else None,
+        "recorded_at": time.time(),
+        "method": request.method,
+        "path": request.url.path,
+        "query": _redact_query(request.query_params),
+        "headers": {
+            k: request.headers[k]
+            for k in _CAPTURE_REQUEST_HEADERS
+            if k in request.headers
+        },
+        "body": _capture_body(body[:TRAFFIC_CAPTURE_MAX_BODY_BYTES], len(body)),
+        "upstream": [],
+    }
+    token = _CURRENT_CAPTURE.set(entry["upstream"])
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _CURRENT_CAPTURE.reset(token)
+    entry["status"] = response.status_code
+    entry["route"] = getattr(request.scope.get("route"), "path", None)
+    entry["headers_ms"] = _elapsed_ms(start)
+    body_iterator = response.body_iterator
+
+    async def body_then_write():
+        # Upstream calls made while streaming (SSE chat) still land in the entry.
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            entry["duration_ms"] = _elapsed_ms(start)
+            _schedule_background(_write_capture(entry))
+
+    response.body_iterator = body_then_write()
+    return response
+
+
+# ---- On-demand request profiling ----
+# A request is profiled when it carries X-Profile-Token matching PROFILE_ADMIN_TOKEN,
+# or by random sampling at PROFILE_SAMPLE_RATE. cProfile (and, when requested with
+# X-Profile-Memory: 1, tracemalloc) run only for that request and at most one
+# profile is taken at a time; the profiler is process-wide, so code of requests
+# running concurrently on the loop shows up too. Reports are built off the event
+# loop and the newest PROFILE_MAX_STORED are kept for download via /debug/profiles.
+# With no PROFILE_ADMIN_TOKEN set, profiling and the endpoints are disabled.
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_MAX_STORED = int(os.getenv("PROFILE_MAX_STORED", "20"))
+PROFILE_TOKEN_HEADER = "x-profile-token"
+PROFILE_TOP_FUNCTIONS = 40
+PROFILE_TOP_ALLOCATIONS = 25
+_PROFILES: "OrderedDict[str, dict]" = OrderedDict()
+_profile_active = False
+
+
+def _has_profile_token(request: Request) -> bool:
+    token = request.headers.get(PROFILE_TOKEN_HEADER, "")
+    return bool(PROFILE_ADMIN_TOKEN) and hmac.compare_digest(
+        token.encode(), PROFILE_ADMIN_TOKEN.encode()
+    )
+
+
+def _build_profile(
+    profile_id: str,
+    meta: dict,
+    profiler: cProfile.Profile,
+    snapshot: Optional[tracemalloc.Snapshot],
+    baseline: Optional[tracemalloc.Snapshot],
+) -> dict:
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.strip_dirs().sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+    allocations = []
+    if snapshot is not None:
+        diff = (
+            snapshot.compare_to(baseline, "lineno")
+            if baseline is not None
+            else snapshot.statistics("lineno")
+        )
+        for stat in diff[:PROFILE_TOP_ALLOCATIONS]:
+            frame = stat.traceback[0]
+            allocations.append(
+                {
+                    "location": f"{frame.filename}:{frame.lineno}",
+                    "size_bytes": getattr(stat, "size_diff", stat.size),
+                    "count": getattr(stat, "count_diff", stat.count),
+                }
+            )
+    return {
+        **meta,
+        "id": profile_id,
+        "report": out.getvalue(),
+        "allocations": allocations,
+        "pstats": marshal.dumps(profiler.stats),
+    }
+
+
+async def _store_profile(profile_id: str, meta: dict, profiler, snapshot, baseline):
+    try:
+        entry = await asyncio.to_thread(
+            _build_profile, profile_id, meta, profiler, snapshot, baseline
+        )
+    except Exception as e:
+        logger.warning("Building profile %s failed: %s", profile_id, e)
+        return
+    _PROFILES[profile_id] = entry
+    while len(_PROFILES) > PROFILE_MAX_STORED:
+        _PROFILES.popitem(last=False)
+
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    global _profile_active
+    wanted = _has_profile_token(request) or (
+        PROFILE_ADMIN_TOKEN
+        and PROFILE_SAMPLE_RATE > 0
+        and random.random() < PROFILE_SAMPLE_RATE
+    )
+    if not wanted or _profile_active or request.url.path.startswith("/debug/profiles"):
+        return await call_next(request)
+
+    _profile_active = True
+    with_memory = request.headers.get("x-profile-memory") == "1" and _has_profile_token(
+        request
+    )
+    started_tracemalloc = with_memory and not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start()
+    baseline = tracemalloc.take_snapshot() if with_memory else None
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        response = await call_next(request)
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot() if with_memory else None
+        if started_tracemalloc:
+            tracemalloc.stop()
+        _profile_active = False
+
+    profile_id = uuid4().hex[:12]
+    trace = _CURRENT_TRACE.get()
+    meta = {
+        "request_id": trace.request_id if trace else None,
+        "method": request.method,
+        "path": request.url.path,
+        "status": response.status_code,
+        "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+        "created": time.time(),
+        "sampled": not _has_profile_token(request),
+    }
+    _schedule_background(_store_profile(profile_id, meta, profiler, snapshot, baseline))
+    response.headers["X-Profile-ID"] = profile_id
+    return response
+
+
+@app.middleware("http")
+async def wait_until_ready(request: Request, call_next):
+    if not _STARTUP_STATE["ready"] and request.url.path not in _STARTUP_EXEMPT_PATHS:
+        try:
+            await ensure_ready()
+        except Exception as e:
+            return JSONResponse(
+                {"detail": f"Service is not ready: {e}"},
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def add_request_context(request: Request, call_next):
     req_id = request.headers.get("x-request-id") or str(uuid4())
+    trace = Trace(req_id, f"{request.method} {request.url.path}")
+    trace_token = _CURRENT_TRACE.set(trace)
+    budget = request_budget(request.headers.get(DEADLINE_HEADER))
+    request_deadline = Deadline(budget) if budget > 0 else None
+    deadline_token = _CURRENT_DEADLINE.set(request_deadline)
     start = time.perf_counter()
-    response = await call_next(request)
-    elapsed_ms = int((time.perf_counter() - start) * 1000)
+    try:
+        response = await call_next(request)
+    finally:
+        _CURRENT_DEADLINE.reset(deadline_token)
+        _CURRENT_TRACE.reset(trace_token)
+    elapsed = time.perf_counter() - start
+    elapsed_ms = int(elapsed * 1000)
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.observe(
+        elapsed,
+        request.method,
+        getattr(route, "path", "unmatched"),
+        str(response.status_code),
+    )
     response.headers["X-Request-ID"] = req_id
+    response.headers["Server-Timing"] = trace.server_timing(elapsed * 1000)
+    if request_deadline is not None and request_deadline.exceeded:
+        response.headers["X-Deadline-Exceeded"] = "1"
+    if TRACE_EXPORT_PATH or TRACE_EXPORT_URL:
+        _schedule_background(export_trace(trace))
     logger.info(
         "%s %s -> %s (%sms) req_id=%s",
         request.method,
@@ -254,6 +1777,137 @@ async def add_request_context(request: Request, call_next):
     return response
 
 
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    return JSONResponse(
+        {"detail": f"Request deadline exceeded during {exc.stage}"},
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+    )
+
+
+# ---- Response compression ----
+# Complete JSON/text bodies of COMPRESSION_MIN_BYTES or more are sent with brotli
+# (when installed and accepted) or gzip. Streamed responses (SSE, NDJSON, anything
+# without a Content-Length) pass through untouched so progress still arrives as it
+# is produced. Added after every other middleware so it wraps them all; large
+# bodies are compressed off the event loop.
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+COMPRESSION_THREAD_MIN_BYTES = 256 * 1024
+_COMPRESSIBLE_TYPES = ("application/json", "application/javascript", "text/")
+_STREAMING_TYPES = ("text/event-stream", "application/x-ndjson")
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick "br" or "gzip" from an Accept-Encoding header, honouring q=0."""
+    offered: dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        offered[name.strip()] = q
+    choices = (["br"] if brotli is not None else []) + ["gzip"]
+    ranked = [
+        (offered.get(c, offered.get("*", 0.0)), -i, c) for i, c in enumerate(choices)
+    ]
+    q, _, best = max(ranked)
+    return best if q > 0 else None
+
+
+def _compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers:
+        return False
+    media_type = headers.get("content-type", "").split(";")[0].strip().lower()
+    if media_type.startswith(_STREAMING_TYPES) or not (
+        media_type.startswith(_COMPRESSIBLE_TYPES) or media_type.endswith("+json")
+    ):
+        return False
+    try:
+        return int(headers.get("content-length", "")) >= COMPRESSION_MIN_BYTES
+    except ValueError:
+        return False  # no length: a stream
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+def _revalidated_start(start: dict, if_none_match: str) -> dict:
+    """Give a 304 the weak ETag the client got with its compressed 200."""
+    headers = MutableHeaders(raw=list(start["headers"]))
+    etag = headers.get("etag")
+    if not etag or etag.startswith("W/"):
+        return start
+    headers.add_vary_header("Accept-Encoding")
+    if f"W/{etag}" in {t.strip() for t in if_none_match.split(",")}:
+        headers["ETag"] = f"W/{etag}"
+    return {**start, "headers": headers.raw}
+
+
+class CompressionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[dict] = None
+        chunks: list[bytes] = []
+        if_none_match = Headers(scope=scope).get("if-none-match", "")
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                if message["status"] == 304:
+                    message = _revalidated_start(message, if_none_match)
+                elif _compressible(Headers(raw=message["headers"])):
+                    start = message  # held back until the body is complete
+                    return
+            elif start is not None and message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if message.get("more_body"):
+                    return
+                body = b"".join(chunks)
+                if len(body) >= COMPRESSION_THREAD_MIN_BYTES:
+                    packed = await asyncio.to_thread(_compress, body, encoding)
+                else:
+                    packed = _compress(body, encoding)
+                if len(packed) < len(body):
+                    headers = MutableHeaders(raw=list(start["headers"]))
+                    headers["Content-Encoding"] = encoding
+                    headers["Content-Length"] = str(len(packed))
+                    headers.add_vary_header("Accept-Encoding")
+                    etag = headers.get("etag")
+                    if etag and not etag.startswith("W/"):
+                        # Same content, different bytes: only weakly equal.
+                        headers["ETag"] = f"W/{etag}"
+                    start = {**start, "headers": headers.raw}
+                    body = packed
+                await send(start)
+                await send({"type": "http.response.body", "body": body})
+                return
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+
+app.add_middleware(CompressionMiddleware)
+
+
 # ---- Env vars ----
 GITHUB_CLIENT_ID = os.getenv("GITHUB_CLIENT_ID")
 GITHUB_CLIENT_SECRET = os.getenv("GITHUB_CLIENT_SECRET")
@@ -281,14 +1935,7 @@ def validate_oauth_state(request: Request, state: Optional[str]):
         raise HTTPException(status_code=400, detail="OAuth state mismatch")
 
 
-import math
-import re
-from collections import defaultdict
-from datetime import datetime, timedelta
-
 # ---------- NEW: tiny in-memory TTL cache for GitHub responses ----------
-from functools import lru_cache
-
 _CACHE: dict[str, tuple[float, dict | list | str | int]] = {}
 CACHE_TTL_SECONDS = 45  # short TTL to stay fresh
 _REPO_CONTEXT_CACHE: dict[str, tuple[float, dict]] = {}
@@ -297,40 +1944,331 @@ _OLLAMA_MODELS_CACHE: tuple[float, list[str]] | None = None
 OLLAMA_MODELS_TTL_SECONDS = 30
 
 # ---------- Circuit breaker / retry policy for upstream dependencies ----------
-_CIRCUIT_STATE: dict[str, dict[str, float | int]] = {
-    "github": {"failures": 0, "open_until": 0},
-    "ollama": {"failures": 0, "open_until": 0},
-}
-MAX_FAILURES_BEFORE_OPEN = 3
-CIRCUIT_BREAKER_COOLDOWN_SECONDS = 30
+# Each upstream has a breaker that opens when, over the last CIRCUIT_WINDOW_SECONDS,
+# at least CIRCUIT_MIN_REQUESTS calls were made and CIRCUIT_FAILURE_RATE of them
+# failed. It stays open for CIRCUIT_OPEN_SECONDS, doubling on every re-open up to
+# CIRCUIT_MAX_OPEN_SECONDS, then goes half-open: CIRCUIT_HALF_OPEN_PROBES requests
+# may test the upstream, and they must all succeed to close it; any failure
+# re-opens it. Rate limiting (429, or GitHub's 403 with no budget left) is not an
+# outage: it pauses calls until the advertised reset without touching the error
+# rate. With CIRCUIT_BREAKER_SHARED=true every worker pushes its counts to Redis
+# and pulls the combined window and breaker state every
+# CIRCUIT_SYNC_INTERVAL_SECONDS, so all workers open, probe (one worker holds the
+# probe lease) and close together.
+CIRCUIT_WINDOW_SECONDS = int(os.getenv("CIRCUIT_WINDOW_SECONDS", "30"))
+CIRCUIT_MIN_REQUESTS = int(os.getenv("CIRCUIT_MIN_REQUESTS", "5"))
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+CIRCUIT_MAX_OPEN_SECONDS = float(os.getenv("CIRCUIT_MAX_OPEN_SECONDS", "300"))
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "2"))
+CIRCUIT_RATE_LIMIT_SECONDS = 60  # pause when a 429 names no reset time
+CIRCUIT_BREAKER_SHARED = os.getenv("CIRCUIT_BREAKER_SHARED", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+CIRCUIT_SYNC_INTERVAL_SECONDS = float(os.getenv("CIRCUIT_SYNC_INTERVAL_SECONDS", "1"))
+_WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        window_seconds: int = CIRCUIT_WINDOW_SECONDS,
+        min_requests: int = CIRCUIT_MIN_REQUESTS,
+        failure_rate: float = CIRCUIT_FAILURE_RATE,
+        open_seconds: float = CIRCUIT_OPEN_SECONDS,
+        max_open_seconds: float = CIRCUIT_MAX_OPEN_SECONDS,
+        half_open_probes: int = CIRCUIT_HALF_OPEN_PROBES,
+    ):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_requests = min_requests
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = "closed"
+        self.open_until = 0.0
+        self.throttled_until = 0.0
+        self.trips = 0  # consecutive openings, for the back-off
+        self.changed_at = 0.0
+        # [second, successes, failures], oldest first
+        self._buckets: deque[list[int]] = deque()
+        self._probes: list[float] = []  # start times of probes in flight
+        self._probe_successes = 0
+        # Shared mode: counts not yet pushed, last combined window, probe lease.
+        self._unpushed: dict[int, list[int]] = {}
+        self._shared_counts: Optional[tuple[int, int]] = None
+        self._may_probe = True
+        self._dirty = False
+        self.worker_id = _WORKER_ID
+
+    # -- decisions --
+
+    @property
+    def throttled(self) -> bool:
+        return time.time() < self.throttled_until
+
+    @property
+    def is_open(self) -> bool:
+        """True while calls are being shed (open, or half-open without a probe)."""
+        now = time.time()
+        if self.state == "open":
+            return now < self.open_until
+        if self.state == "half_open":
+            return not self._may_probe or len(self._live_probes(now)) >= (
+                self.half_open_probes - self._probe_successes
+            )
+        return False
+
+    def allow(self) -> bool:
+        """Whether to call the upstream now; in half-open this takes a probe slot."""
+        now = time.time()
+        if now < self.throttled_until:
+            return False
+        if self.state == "open":
+            if now < self.open_until:
+                return False
+            self._transition("half_open", now)
+        if self.state == "half_open":
+            probes = self._live_probes(now)
+            wanted = self.half_open_probes - self._probe_successes
+            if not self._may_probe or len(probes) >= wanted:
+                return False
+            probes.append(now)
+        return True
+
+    def _live_probes(self, now: float) -> list[float]:
+        # A probe whose caller never reported back frees its slot eventually.
+        cutoff = now - max(self.open_seconds, 1.0)
+        self._probes[:] = [t for t in self._probes if t > cutoff]
+        return self._probes
+
+    # -- outcomes --
+
+    def record_success(self):
+        self._count(ok=1)
+        if self.state == "half_open":
+            if self._probes:
+                self._probes.pop(0)
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_probes:
+                self.trips = 0
+                self._buckets.clear()
+                self._shared_counts = None
+                self._transition("closed")
+
+    def record_failure(self):
+        self._count(fail=1)
+        if self.state == "half_open":
+            self._open()
+        elif self.state == "closed":
+            ok, fail = self.window_counts()
+            total = ok + fail
+            if total >= self.min_requests and fail / total >= self.failure_rate:
+                self._open()
+
+    def record_rate_limited(self, retry_after: Optional[float] = None):
+        delay = retry_after if retry_after is not None else CIRCUIT_RATE_LIMIT_SECONDS
+        self.throttled_until = max(self.throttled_until, time.time() + max(0, delay))
+        if self.state == "half_open" and self._probes:
+            self._probes.pop(0)  # inconclusive probe
+        self._dirty = True
+
+    def _open(self):
+        self.trips += 1
+        cooldown = min(self.open_seconds * 2 ** (self.trips - 1), self.max_open_seconds)
+        self.open_until = time.time() + cooldown
+        self._transition("open")
+
+    def _transition(self, state: str, now: Optional[float] = None):
+        self.state = state
+        self.changed_at = now or time.time()
+        self._probes.clear()
+        self._probe_successes = 0
+        self._may_probe = not CIRCUIT_BREAKER_SHARED
+        self._dirty = True
+
+    def _count(self, ok: int = 0, fail: int = 0):
+        sec = int(time.time())
+        if not self._buckets or self._buckets[-1][0] != sec:
+            self._buckets.append([sec, 0, 0])
+        self._buckets[-1][1] += ok
+        self._buckets[-1][2] += fail
+        if CIRCUIT_BREAKER_SHARED:
+            pending = self._unpushed.setdefault(sec, [0, 0])
+            pending[0] += ok
+            pending[1] += fail
+
+    def window_counts(self) -> tuple[int, int]:
+        """(successes, failures) in the window; all workers' when shared."""
+        horizon = int(time.time()) - self.window_seconds
+        while self._buckets and self._buckets[0][0] <= horizon:
+            self._buckets.popleft()
+        if self._shared_counts is not None:
+            ok, fail = self._shared_counts
+            for sec, (p_ok, p_fail) in self._unpushed.items():
+                if sec > horizon:
+                    ok, fail = ok + p_ok, fail + p_fail
+            return ok, fail
+        return (
+            sum(b[1] for b in self._buckets),
+            sum(b[2] for b in self._buckets),
+        )
+
+    def snapshot(self) -> dict:
+        ok, fail = self.window_counts()
+        now = time.time()
+        return {
+            "state": self.state,
+            "window_requests": ok + fail,
+            "window_failures": fail,
+            "open_for_seconds": round(max(0.0, self.open_until - now), 1),
+            "throttled_for_seconds": round(max(0.0, self.throttled_until - now), 1),
+            "trips": self.trips,
+        }
+
+    # -- Redis sharing --
+
+    async def sync(self, client):
+        """Push local counts and state to Redis and adopt the combined view."""
+        prefix = f"circuit:{self.name}"
+        now = time.time()
+        # Outcomes recorded while this runs land in the fresh dict and go out
+        # with the next sync.
+        unpushed, self._unpushed = self._unpushed, {}
+        try:
+            pipe = client.pipeline(transaction=False)
+            for sec, (ok, fail) in unpushed.items():
+                pipe.hincrby(f"{prefix}:w:{sec}", "ok", ok)
+                pipe.hincrby(f"{prefix}:w:{sec}", "fail", fail)
+                pipe.expire(f"{prefix}:w:{sec}", self.window_seconds * 2)
+            await pipe.execute()
+        except Exception:
+            for sec, (ok, fail) in unpushed.items():  # try again next round
+                pending = self._unpushed.setdefault(sec, [0, 0])
+                pending[0] += ok
+                pending[1] += fail
+            raise
+
+        pipe = client.pipeline(transaction=False)
+        first = int(now) - self.window_seconds + 1
+        for sec in range(first, int(now) + 1):
+            pipe.hmget(f"{prefix}:w:{sec}", "ok", "fail")
+        pipe.hgetall(f"{prefix}:state")
+        *buckets, remote = await pipe.execute()
+        self._shared_counts = (
+            sum(int(b[0] or 0) for b in buckets),
+            sum(int(b[1] or 0) for b in buckets),
+        )
+
+        remote_changed = float(remote.get("changed_at") or 0)
+        if remote and remote_changed > self.changed_at:
+            self.state = remote.get("state", "closed")
+            self.open_until = float(remote.get("open_until") or 0)
+            self.trips = int(remote.get("trips") or 0)
+            self.changed_at = remote_changed
+            self._probes.clear()
+            self._probe_successes = 0
+            self._may_probe = False
+        self.throttled_until = max(
+            self.throttled_until, float(remote.get("throttled_until") or 0)
+        )
+        if self._dirty or remote_changed < self.changed_at:
+            await client.hset(
+                f"{prefix}:state",
+                mapping={
+                    "state": self.state,
+                    "open_until": self.open_until,
+                    "trips": self.trips,
+                    "changed_at": self.changed_at,
+                    "throttled_until": self.throttled_until,
+                },
+            )
+            self._dirty = False
+
+        if self.state == "open" and now >= self.open_until:
+            self._transition("half_open", now)
+        if self.state == "half_open" and not self._may_probe:
+            # One worker at a time holds the probe lease for this half-open phase.
+            lease = f"{prefix}:probe:{self.open_until}"
+            ttl = max(1, int(self.open_seconds))
+            claimed = await client.set(lease, self.worker_id, nx=True, ex=ttl)
+            self._may_probe = bool(claimed) or (
+                await client.get(lease) == self.worker_id
+            )
 
 
-def _is_circuit_open(name: str) -> bool:
-    state = _CIRCUIT_STATE.get(name, {})
-    return time.time() < float(state.get("open_until", 0))
+CIRCUITS = {name: CircuitBreaker(name) for name in ("github", "ollama")}
 
 
-def _record_failure(name: str):
-    state = _CIRCUIT_STATE.setdefault(name, {"failures": 0, "open_until": 0})
-    state["failures"] = int(state.get("failures", 0)) + 1
-    if state["failures"] >= MAX_FAILURES_BEFORE_OPEN:
-        state["open_until"] = time.time() + CIRCUIT_BREAKER_COOLDOWN_SECONDS
+async def _circuit_sync_loop():
+    while True:
+        try:
+            client = _get_async_redis_client()
+            for breaker in CIRCUITS.values():
+                await breaker.sync(client)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Circuit breaker sync failed: %s", e)
+            for breaker in CIRCUITS.values():
+                breaker._shared_counts = None  # fall back to local counts
+                breaker._may_probe = True
+        await asyncio.sleep(CIRCUIT_SYNC_INTERVAL_SECONDS)
 
 
-def _record_success(name: str):
-    state = _CIRCUIT_STATE.setdefault(name, {"failures": 0, "open_until": 0})
-    state["failures"] = 0
-    state["open_until"] = 0
+def start_circuit_sync() -> Optional[asyncio.Task]:
+    if not CIRCUIT_BREAKER_SHARED:
+        return None
+    return _schedule_background(_circuit_sync_loop())
+
+
+def _retry_after_seconds(headers) -> Optional[float]:
+    """Seconds until a rate limit lifts, from Retry-After or X-RateLimit-Reset."""
+    try:
+        if headers.get("Retry-After"):
+            return float(headers["Retry-After"])
+        if headers.get("X-RateLimit-Reset"):
+            return float(headers["X-RateLimit-Reset"]) - time.time()
+    except ValueError:
+        pass
+    return None
+
+
+METRICS.gauge(
+    "codescribe_circuit_breaker_open",
+    "1 while the circuit breaker for an upstream is shedding calls.",
+    ("service",),
+    collect=lambda: {(n,): int(b.is_open) for n, b in CIRCUITS.items()},
+)
+METRICS.gauge(
+    "codescribe_circuit_breaker_failures",
+    "Failures in the circuit breaker's sliding window.",
+    ("service",),
+    collect=lambda: {(n,): b.window_counts()[1] for n, b in CIRCUITS.items()},
+)
+METRICS.gauge(
+    "codescribe_circuit_breaker_throttled",
+    "1 while calls to an upstream are paused for its rate limit.",
+    ("service",),
+    collect=lambda: {(n,): int(b.throttled) for n, b in CIRCUITS.items()},
+)
 
 
 def cache_get(key: str):
     hit = _CACHE.get(key)
     if not hit:
+        CACHE_LOOKUPS.inc("github", "miss")
         return None
     exp, val = hit
     if time.time() > exp:
         _CACHE.pop(key, None)
+        CACHE_LOOKUPS.inc("github", "miss")
         return None
+    CACHE_LOOKUPS.inc("github", "hit")
     return val
 
 
@@ -338,19 +2276,66 @@ def cache_set(key: str, val):
     _CACHE[key] = (time.time() + CACHE_TTL_SECONDS, val)
 
 
-# ---------- REPLACE: gh_get to use cache (drop-in safe) ----------
-async def gh_get(url: str):
-    if _is_circuit_open("github"):
-        return JSONResponse(
-            {
-                "reply": "GitHub service temporarily unavailable due to repeated errors. Try again shortly."
-            },
-            status_code=503,
+# ---------- Shared HTTP clients (one connection pool per event loop) ----------
+# httpx clients are bound to the loop they were first used on, so the API process,
+# each Celery worker loop and test loops all get their own pooled client.
+_HTTP_CLIENTS: (
+    "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]"
+) = weakref.WeakKeyDictionary()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _HTTP_CLIENTS.get(loop)
+    if client is None or client.is_closed:
+        limits = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(15.0),
+            limits=limits,
+            transport=_capture_transport(limits),
         )
+        _HTTP_CLIENTS[loop] = client
+    return client
+
 
+async def close_http_client():
+    client = _HTTP_CLIENTS.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+# Last rate-limit budget reported by GitHub; background jobs back off when low.
+_GITHUB_RATE_LIMIT: dict[str, float | None] = {"remaining": None, "reset": 0}
+
+
+def _note_github_rate_limit(headers):
+    remaining = headers.get("X-RateLimit-Remaining")
+    if remaining is None:
+        return
+    try:
+        _GITHUB_RATE_LIMIT["remaining"] = int(remaining)
+        _GITHUB_RATE_LIMIT["reset"] = float(headers.get("X-RateLimit-Reset") or 0)
+    except ValueError:
+        pass
+
+
+def github_budget_available(minimum: int) -> bool:
+    remaining = _GITHUB_RATE_LIMIT["remaining"]
+    if remaining is None or time.time() > float(_GITHUB_RATE_LIMIT["reset"] or 0):
+        return True  # unknown, or the window has reset since we last looked
+    return remaining >= minimum
+
+
+def _github_headers() -> dict[str, str]:
     headers = {"Accept": "application/vnd.github.v3+json"}
     if GITHUB_TOKEN:
         headers["Authorization"] = f"token {GITHUB_TOKEN}"
+    return headers
+
+
+# ---------- REPLACE: gh_get to use cache (drop-in safe) ----------
+async def gh_get(url: str):
+    headers = _github_headers()
 
     ck = f"gh:{url}"
     cached = cache_get(ck)
@@ -365,35 +2350,63 @@ async def gh_get(url: str):
 
         return _Resp()
 
-    # Retry transient failures with exponential backoff.
+    breaker = CIRCUITS["github"]
+    if not breaker.allow():
+        if breaker.throttled:
+            return _github_rate_limited_response()
+        return JSONResponse(
+            {
+                "reply": "GitHub service temporarily unavailable due to repeated errors. Try again shortly."
+            },
+            status_code=503,
+        )
+
+    # Retry transient failures with exponential backoff, unless that opened the
+    # breaker or the back-off would overrun the request deadline.
     last_exc = None
     for attempt in range(1, 4):
+        timeout = deadline_timeout(15.0, "github")
+        started = time.perf_counter()
         try:
-            async with httpx.AsyncClient(timeout=httpx.Timeout(15.0)) as c:
-                r = await c.get(url, headers=headers)
+            c = get_http_client()
+            with span(
+                "github",
+                path=url.removeprefix(GITHUB_API_BASE),
+                attempt=attempt,
+            ) as sp:
+                r = await c.get(url, headers=headers, timeout=timeout)
                 # If token is invalid/revoked, retry once without auth for public repos.
                 if r.status_code == 401 and GITHUB_TOKEN:
                     r = await c.get(
-                        url, headers={"Accept": "application/vnd.github.v3+json"}
+                        url,
+                        headers={"Accept": "application/vnd.github.v3+json"},
+                        timeout=deadline_timeout(15.0, "github"),
                     )
+                if sp is not None:
+                    sp["attrs"]["status"] = r.status_code
+            observe_upstream("github", started, r.status_code, retried=attempt > 1)
+            _note_github_rate_limit(r.headers)
 
             if r.status_code in (500, 502, 503, 504):
-                _record_failure("github")
-                if attempt < 3:
+                breaker.record_failure()
+                if (
+                    attempt < 3
+                    and not breaker.is_open
+                    and deadline_allows(0.5 * attempt)
+                ):
                     await asyncio.sleep(0.5 * attempt)
                     continue
                 r.raise_for_status()
 
-            # treat 429 as a transient failure but don't raise directly; allow caller to handle.
-            if r.status_code == 429:
-                _record_failure("github")
-                return JSONResponse(
-                    {"reply": "GitHub rate limit reached. Try again in a few minutes."},
-                    status_code=429,
-                )
+            # Rate limiting is not an outage: pause calls until the reset instead.
+            if r.status_code == 429 or (
+                r.status_code == 403 and r.headers.get("X-RateLimit-Remaining") == "0"
+            ):
+                breaker.record_rate_limited(_retry_after_seconds(r.headers))
+                return _github_rate_limited_response()
 
+            breaker.record_success()
             r.raise_for_status()
-            _record_success("github")
 
             try:
                 cache_set(ck, r.json())
@@ -402,9 +2415,13 @@ async def gh_get(url: str):
             return r
 
         except (httpx.ConnectError, httpx.ReadTimeout, httpx.TransportError) as e:
+            observe_upstream("github", started, "error", retried=attempt > 1)
+            if isinstance(e, httpx.TimeoutException) and deadline_expired():
+                # Our budget ran out, which says nothing about GitHub's health.
+                raise DeadlineExceeded("github") from e
             last_exc = e
-            _record_failure("github")
-            if attempt < 3:
+            breaker.record_failure()
+            if attempt < 3 and not breaker.is_open and deadline_allows(0.5 * attempt):
                 await asyncio.sleep(0.5 * attempt)
                 continue
             raise
@@ -415,11 +2432,86 @@ async def gh_get(url: str):
     raise RuntimeError("Unexpected error in gh_get")
 
 
+async def gh_download(url: str, max_bytes: int, timeout: float = 60.0) -> bytes:
+    """Stream a large, uncached GitHub response (a tarball) into memory.
+
+    Shares ``gh_get``'s breaker, deadline and retry rules. A refused call raises
+    429/503 and a body over ``max_bytes`` raises 413.
+    """
+    breaker = CIRCUITS["github"]
+    if not breaker.allow():
+        if breaker.throttled:
+            raise HTTPException(status_code=429, detail="Rate limited")
+        raise HTTPException(status_code=503, detail="GitHub temporarily unavailable")
+
+    for attempt in range(1, 4):
+        started = time.perf_counter()
+        chunks: list[bytes] = []
+        too_large = False
+        try:
+            with span(
+                "github", path=url.removeprefix(GITHUB_API_BASE), attempt=attempt
+            ):
+                async with get_http_client().stream(
+                    "GET",
+                    url,
+                    headers=_github_headers(),
+                    timeout=deadline_timeout(timeout, "github"),
+                    follow_redirects=True,
+                ) as r:
+                    if r.status_code < 400:
+                        received = 0
+                        async for chunk in r.aiter_bytes():
+                            received += len(chunk)
+                            if received > max_bytes:
+                                too_large = True
+                                break
+                            chunks.append(chunk)
+        except httpx.TransportError as e:
+            observe_upstream("github", started, "error", retried=attempt > 1)
+            if isinstance(e, httpx.TimeoutException) and deadline_expired():
+                raise DeadlineExceeded("github") from e
+            breaker.record_failure()
+            if attempt < 3 and not breaker.is_open and deadline_allows(0.5 * attempt):
+                await asyncio.sleep(0.5 * attempt)
+                continue
+            raise
+
+        observe_upstream("github", started, r.status_code, retried=attempt > 1)
+        _note_github_rate_limit(r.headers)
+        if r.status_code in (500, 502, 503, 504):
+            breaker.record_failure()
+            if attempt < 3 and not breaker.is_open and deadline_allows(0.5 * attempt):
+                await asyncio.sleep(0.5 * attempt)
+                continue
+            r.raise_for_status()
+        if r.status_code == 429 or (
+            r.status_code == 403 and r.headers.get("X-RateLimit-Remaining") == "0"
+        ):
+            breaker.record_rate_limited(_retry_after_seconds(r.headers))
+            raise HTTPException(status_code=429, detail="Rate limited")
+        breaker.record_success()
+        r.raise_for_status()
+        if too_large:
+            raise HTTPException(
+                status_code=413, detail="Repository is too large to snapshot"
+            )
+        return b"".join(chunks)
+    raise RuntimeError("Unexpected error in gh_download")
+
+
+def _github_rate_limited_response() -> JSONResponse:
+    return JSONResponse(
+        {"reply": "GitHub rate limit reached. Try again in a few minutes."},
+        status_code=429,
+    )
+
+
 # ---- Helper: Fetch GitHub user ----
 async def get_github_user(access_token: str) -> dict:
     async with httpx.AsyncClient() as client:
         response = await client.get(
-            "https://api.github.com/user",
+            f"{GITHUB_API_BASE}/user",
             headers={"Authorization": f"Bearer {access_token}"},
         )
         response.raise_for_status()
@@ -427,15 +2519,26 @@ async def get_github_user(access_token: str) -> dict:
 
 
 # ---- Auth middleware (cookie reader) ----
-def get_current_user(request: Request):
+async def get_current_user(request: Request, response: Response):
     cookie = request.cookies.get("session_id")
     if not cookie:
         raise HTTPException(status_code=401, detail="Not authenticated")
     try:
         session_id = serializer.loads(cookie)["session_id"]
-        session = session_store_get(session_id)
+        with span("session_lookup"):
+            session = await asession_store_get(session_id)
         if not session or session["expires"] < time.time():
             raise HTTPException(status_code=401, detail="Session expired")
+        if SESSION_SLIDING_EXPIRATION and SESSION_STORE_TYPE == "redis":
+            # Keep the cookie alive as long as the sliding Redis key.
+            response.set_cookie(
+                key="session_id",
+                value=cookie,
+                httponly=True,
+                samesite=COOKIE_SAMESITE,
+                secure=COOKIE_SECURE,
+                max_age=max(1, int(session["expires"] - time.time())),
+            )
         return session
     except HTTPException:
         raise
@@ -481,7 +2584,7 @@ async def github_login():
     ensure_github_oauth_config()
     state = os.urandom(16).hex()
     response = RedirectResponse(
-        f"https://github.com/login/oauth/authorize?"
+        f"{GITHUB_WEB_BASE}/login/oauth/authorize?"
         f"client_id={GITHUB_CLIENT_ID}&state={state}&scope=repo,user"
     )
     response.set_cookie(
@@ -502,7 +2605,7 @@ async def github_callback(request: Request, code: str, state: Optional[str] = No
 
     async with httpx.AsyncClient() as client:
         token_response = await client.post(
-            "https://github.com/login/oauth/access_token",
+            f"{GITHUB_WEB_BASE}/login/oauth/access_token",
             params={
                 "client_id": GITHUB_CLIENT_ID,
                 "client_secret": GITHUB_CLIENT_SECRET,
@@ -522,10 +2625,12 @@ async def github_callback(request: Request, code: str, state: Optional[str] = No
             "access_token": token_data["access_token"],
             "user": user_data["login"],
             "user_id": user_data["id"],
+            "issued_at": time.time(),
             "expires": time.time() + SESSION_TTL_SECONDS,
             "csrf_token": csrf_token,
         }
-        session_store_set(session_id, session_data)
+        await asession_store_set(session_id, session_data)
+        _schedule_background(warm_user_repos(user_data["login"]))
 
         signed_cookie = serializer.dumps({"session_id": session_id})
         response = RedirectResponse(url=FRONTEND_URL)
@@ -553,7 +2658,7 @@ async def github_callback(request: Request, code: str, state: Optional[str] = No
 
 
 async def get_repo_default_branch(owner: str, repo: str) -> str:
-    r = await gh_get(f"https://api.github.com/repos/{owner}/{repo}")
+    r = await gh_get(f"{GITHUB_API_BASE}/repos/{owner}/{repo}")
     if isinstance(r, JSONResponse):  # rate limited
         raise HTTPException(status_code=429, detail="Rate limited")
     return r.json()["default_branch"]
@@ -563,7 +2668,7 @@ async def count_all_files(owner: str, repo: str) -> int:
     # Use Git Trees API to count all blobs (files) recursively
     default_branch = await get_repo_default_branch(owner, repo)
     r = await gh_get(
-        f"https://api.github.com/repos/{owner}/{repo}/git/trees/{default_branch}?recursive=1"
+        f"{GITHUB_API_BASE}/repos/{owner}/{repo}/git/trees/{default_branch}?recursive=1"
     )
     if isinstance(r, JSONResponse):
         raise HTTPException(status_code=429, detail="Rate limited")
@@ -573,7 +2678,7 @@ async def count_all_files(owner: str, repo: str) -> int:
 
 
 async def fetch_root_contents(owner: str, repo: str):
-    r = await gh_get(f"https://api.github.com/repos/{owner}/{repo}/contents")
+    r = await gh_get(f"{GITHUB_API_BASE}/repos/{owner}/{repo}/contents")
     if isinstance(r, JSONResponse):
         raise HTTPException(status_code=429, detail="Rate limited")
     return r.json()
@@ -592,10 +2697,11 @@ async def get_readme_text(owner: str, repo: str) -> str | None:
     )
     if not readme:
         return None
-    async with httpx.AsyncClient(timeout=httpx.Timeout(15.0)) as c:
-        fr = await c.get(readme["download_url"])
-        fr.raise_for_status()
-        return fr.text[:4000]  # keep prompt small
+    fr = await get_http_client().get(
+        readme["download_url"], timeout=deadline_timeout(15.0, "github")
+    )
+    fr.raise_for_status()
+    return fr.text[:4000]  # keep prompt small
 
 
 # # Chat endpoint
@@ -706,14 +2812,14 @@ async def get_readme_text(owner: str, repo: str) -> str | None:
 
 # ---------- NEW: extra GitHub helpers ----------
 async def get_repo_meta(owner: str, repo: str) -> dict:
-    r = await gh_get(f"https://api.github.com/repos/{owner}/{repo}")
+    r = await gh_get(f"{GITHUB_API_BASE}/repos/{owner}/{repo}")
     if isinstance(r, JSONResponse):
         raise HTTPException(status_code=429, detail="Rate limited")
     return r.json()
 
 
 async def get_contributors(owner: str, repo: str) -> list[dict]:
-    r = await gh_get(f"https://api.github.com/repos/{owner}/{repo}/contributors")
+    r = await gh_get(f"{GITHUB_API_BASE}/repos/{owner}/{repo}/contributors")
     if isinstance(r, JSONResponse):
         raise HTTPException(status_code=429, detail="Rate limited")
     data = r.json()
@@ -721,7 +2827,7 @@ async def get_contributors(owner: str, repo: str) -> list[dict]:
 
 
 async def get_languages(owner: str, repo: str) -> dict[str, int]:
-    r = await gh_get(f"https://api.github.com/repos/{owner}/{repo}/languages")
+    r = await gh_get(f"{GITHUB_API_BASE}/repos/{owner}/{repo}/languages")
     if isinstance(r, JSONResponse):
         raise HTTPException(status_code=429, detail="Rate limited")
     data = r.json()
@@ -731,11 +2837,20 @@ async def get_languages(owner: str, repo: str) -> dict[str, int]:
 # ---------- NEW: build context to ground the LLM ----------
 async def build_repo_context(
     owner: str, repo: str, max_files: int = 12, include_readme: bool = False
+) -> dict:
+    with span("build_repo_context"):
+        return await _build_repo_context(owner, repo, max_files, include_readme)
+
+
+async def _build_repo_context(
+    owner: str, repo: str, max_files: int, include_readme: bool
 ) -> dict:
     ck = f"{owner}/{repo}:readme={int(include_readme)}:files={max_files}"
     cached = _REPO_CONTEXT_CACHE.get(ck)
     if cached and time.time() < cached[0]:
+        CACHE_LOOKUPS.inc("repo_context", "hit")
         return cached[1]
+    CACHE_LOOKUPS.inc("repo_context", "miss")
 
     context: dict = {
         "owner": owner,
@@ -746,50 +2861,780 @@ async def build_repo_context(
         "readme": "",
     }
 
-    tasks = [
-        fetch_root_contents(owner, repo),
-        get_languages(owner, repo),
-        get_repo_meta(owner, repo),
-        get_contributors(owner, repo),
-    ]
-    if include_readme:
-        tasks.append(get_readme_text(owner, repo))
+    tasks = [
+        fetch_root_contents(owner, repo),
+        get_languages(owner, repo),
+        get_repo_meta(owner, repo),
+        get_contributors(owner, repo),
+    ]
+    if include_readme:
+        tasks.append(get_readme_text(owner, repo))
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    # Parts cut off by the deadline are left out of this answer but not cached.
+    complete = not any(isinstance(r, DeadlineExceeded) for r in results)
+    items, langs, meta, contr = results[0], results[1], results[2], results[3]
+    readme = results[4] if include_readme and len(results) > 4 else None
+
+    if not isinstance(items, Exception):
+        files = [it["path"] for it in items if it.get("type") == "file"]
+        dirs = [it["path"] for it in items if it.get("type") == "dir"]
+        context["files"] = files[:max_files]
+        context["dirs"] = dirs[:max_files]
+
+    if not isinstance(langs, Exception):
+        total = sum(langs.values()) or 1
+        context["languages"] = {k: round(v * 100 / total, 2) for k, v in langs.items()}
+
+    if not isinstance(meta, Exception):
+        context["stars"] = meta.get("stargazers_count", 0)
+        lic = meta.get("license") or {}
+        context["license"] = lic.get("spdx_id") or lic.get("key") or ""
+        context["description"] = meta.get("description") or ""
+    else:
+        context["stars"] = 0
+        context["license"] = ""
+        context["description"] = ""
+
+    context["contributors_count"] = 0 if isinstance(contr, Exception) else len(contr)
+    context["readme"] = (
+        "" if isinstance(readme, Exception) or not readme else str(readme)[:1000]
+    )
+
+    if complete:
+        _REPO_CONTEXT_CACHE[ck] = (time.time() + REPO_CONTEXT_TTL_SECONDS, context)
+    return context
+
+
+async def get_repo_head_sha(owner: str, repo: str) -> str:
+    """Commit SHA at the tip of the default branch (small, cached ref lookup)."""
+    default_branch = await get_repo_default_branch(owner, repo)
+    r = await gh_get(
+        f"{GITHUB_API_BASE}/repos/{owner}/{repo}/git/ref/heads/{default_branch}"
+    )
+    if isinstance(r, JSONResponse):
+        raise HTTPException(status_code=429, detail="Rate limited")
+    return (r.json().get("object") or {}).get("sha", "")
+
+
+# ---------- Repository snapshots (full file contents at one tree SHA) ----------
+SNAPSHOT_MAX_FILE_BYTES = int(os.getenv("SNAPSHOT_MAX_FILE_BYTES", "200000"))
+SNAPSHOT_MAX_TARBALL_BYTES = int(
+    os.getenv("SNAPSHOT_MAX_TARBALL_BYTES", str(64 * 1024 * 1024))
+)
+SNAPSHOT_MEMORY_LIMIT = 4  # snapshots hold full file text, keep only a few
+_REPO_SNAPSHOTS: dict[str, dict] = {}
+_SNAPSHOT_DOWNLOADS: dict[str, asyncio.Task] = {}
+_BACKGROUND_TASKS: set[asyncio.Task] = set()
+
+
+def _schedule_background(coro) -> asyncio.Task:
+    """Run a coroutine in the background, keeping a reference until it finishes.
+
+    The task outlives the request that scheduled it, so it runs without its deadline.
+    """
+    context = contextvars.copy_context()
+    context.run(_CURRENT_DEADLINE.set, None)
+    task = asyncio.create_task(coro, context=context)
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+    return task
+
+
+async def join_inflight(inflight: dict, key: str, factory, stage: str):
+    """Await the in-flight job for ``key``, starting ``factory()`` if there is none.
+
+    Concurrent callers share one job. It runs in the background, so a caller that
+    gives up (cancelled, or its deadline ran out) leaves it running for the others
+    and for the cache.
+    """
+    task = inflight.get(key)
+    if task is None:
+        task = _schedule_background(factory())
+        inflight[key] = task
+        task.add_done_callback(lambda _t: inflight.pop(key, None))
+    done, _ = await asyncio.wait({task}, timeout=deadline_remaining())
+    if not done:
+        _CURRENT_DEADLINE.get().mark_exceeded()
+        raise DeadlineExceeded(stage)
+    return task.result()
+
+
+async def get_repo_tree(owner: str, repo: str) -> dict:
+    default_branch = await get_repo_default_branch(owner, repo)
+    r = await gh_get(
+        f"{GITHUB_API_BASE}/repos/{owner}/{repo}/git/trees/{default_branch}?recursive=1"
+    )
+    if isinstance(r, JSONResponse):
+        raise HTTPException(status_code=429, detail="Rate limited")
+    tree = dict(r.json())
+    tree["ref"] = default_branch
+    return tree
+
+
+def _extract_tarball(data: bytes, wanted: dict[str, str]) -> dict[str, str]:
+    files: dict[str, str] = {}
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as tar:
+        for member in tar:
+            if not member.isfile() or member.size > SNAPSHOT_MAX_FILE_BYTES:
+                continue
+            # Archive entries are prefixed with "<owner>-<repo>-<sha>/".
+            path = member.name.split("/", 1)[1] if "/" in member.name else ""
+            if path not in wanted:
+                continue
+            fh = tar.extractfile(member)
+            if fh is None:
+                continue
+            raw = fh.read()
+            if b"\0" in raw[:8000]:
+                continue  # binary file
+            files[path] = raw.decode("utf-8", errors="replace")
+    return files
+
+
+async def get_repo_snapshot(owner: str, repo: str, tree: dict | None = None) -> dict:
+    """Download the text files of the default branch in a single tarball request."""
+    tree = tree or await get_repo_tree(owner, repo)
+    key = f"{owner}/{repo}@{tree.get('sha')}"
+    cached = _REPO_SNAPSHOTS.get(key)
+    if cached:
+        return cached
+    return await join_inflight(
+        _SNAPSHOT_DOWNLOADS,
+        key,
+        lambda: _download_snapshot(owner, repo, tree, key),
+        "snapshot",
+    )
+
+
+async def _download_snapshot(owner: str, repo: str, tree: dict, key: str) -> dict:
+    blobs = {
+        t["path"]: t.get("sha", "")
+        for t in tree.get("tree", [])
+        if t.get("type") == "blob" and (t.get("size") or 0) <= SNAPSHOT_MAX_FILE_BYTES
+    }
+    url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/tarball/{tree['ref']}"
+    data = await gh_download(url, SNAPSHOT_MAX_TARBALL_BYTES)
+    files = await asyncio.to_thread(_extract_tarball, data, blobs)
+    snapshot = {
+        "owner": owner,
+        "repo": repo,
+        "ref": tree["ref"],
+        "tree_sha": tree.get("sha"),
+        "blobs": {p: blobs[p] for p in files},
+        "files": files,
+    }
+    while len(_REPO_SNAPSHOTS) >= SNAPSHOT_MEMORY_LIMIT:
+        _REPO_SNAPSHOTS.pop(next(iter(_REPO_SNAPSHOTS)))
+    _REPO_SNAPSHOTS[key] = snapshot
+    return snapshot
+
+
+def get_cached_snapshot(owner: str, repo: str, tree_sha: str) -> dict | None:
+    return _REPO_SNAPSHOTS.get(f"{owner}/{repo}@{tree_sha}")
+
+
+# ---------- BM25 lexical index over repository files ----------
+SEARCH_INDEX_DIR = os.getenv("SEARCH_INDEX_DIR", ".codescribe/index")
+SEARCH_INDEX_MEMORY_LIMIT = 16
+_SEARCH_INDEXES: dict[str, "BM25Index"] = {}
+_INDEX_BUILDS: dict[str, asyncio.Task] = {}
+# "owner/repo@<head commit>" -> tree SHA the indexes were keyed by.
+_INDEX_TREE_BY_HEAD: dict[str, str] = {}
+INDEX_HEAD_MEMO_LIMIT = 256
+
+_IDENT_RE = re.compile(r"[A-Za-z0-9_]+")
+_CAMEL_SPLIT_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def tokenize_code(text: str) -> list[str]:
+    """Split text into lowercase terms, keeping whole identifiers plus their
+    snake_case and camelCase parts (``getRepoFiles`` -> getrepofiles, get, repo, files).
+    """
+    tokens: list[str] = []
+    for ident in _IDENT_RE.findall(text):
+        if len(ident) > 64:
+            continue
+        whole = ident.lower()
+        if len(whole) > 1:
+            tokens.append(whole)
+        parts = [
+            p.lower()
+            for chunk in ident.split("_")
+            for p in _CAMEL_SPLIT_RE.findall(chunk)
+        ]
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if len(p) > 1 and p != whole)
+    return tokens
+
+
+def tokenize_path(path: str) -> list[str]:
+    segments = [s for s in re.split(r"[/.\-\s]+", path) if s]
+    return [s.lower() for s in segments] + tokenize_code(" ".join(segments))
+
+
+class BM25Index:
+    """Inverted index with BM25 scoring over the files of one repository snapshot.
+
+    Postings are stored as flat ``[doc_delta, tf, doc_delta, tf, ...]`` lists so the
+    gzip'd JSON form on disk stays small.
+    """
+
+    K1 = 1.2
+    B = 0.75
+    PATH_BOOST = 3  # a term in the path counts as this many occurrences in the body
+
+    def __init__(self, key: str, paths: list[str], lengths: list[int], postings: dict):
+        self.key = key
+        self.paths = paths
+        self.lengths = lengths
+        self.postings = postings
+        avg_len = (sum(lengths) / len(lengths)) if lengths else 1.0
+        # Per-document length normalisation, precomputed so queries only add.
+        self._norms = [
+            self.K1 * (1 - self.B + self.B * n / (avg_len or 1.0)) for n in lengths
+        ]
+
+    @classmethod
+    def build(cls, key: str, files: dict[str, str]) -> "BM25Index":
+        paths = sorted(files)
+        lengths: list[int] = []
+        postings: dict[str, list[int]] = defaultdict(list)
+        last_doc: dict[str, int] = {}
+        for doc_id, path in enumerate(paths):
+            counts: dict[str, int] = defaultdict(int)
+            for term in tokenize_code(files[path]):
+                counts[term] += 1
+            for term in tokenize_path(path):
+                counts[term] += cls.PATH_BOOST
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings[term].extend((doc_id - last_doc.get(term, 0), tf))
+                last_doc[term] = doc_id
+        return cls(key, paths, lengths, dict(postings))
+
+    def _idf(self, df: int) -> float:
+        n = len(self.paths)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, limit: int = 10) -> list[dict]:
+        terms = set(tokenize_code(query))
+        scores: dict[int, float] = defaultdict(float)
+        matched: dict[int, list[str]] = defaultdict(list)
+        norms = self._norms
+        for term in terms:
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            weight = self._idf(len(plist) // 2) * (self.K1 + 1)
+            doc_id = 0
+            for i in range(0, len(plist), 2):
+                doc_id += plist[i]
+                tf = plist[i + 1]
+                scores[doc_id] += weight * tf / (tf + norms[doc_id])
+                matched[doc_id].append(term)
+        top = heapq.nlargest(limit, scores.items(), key=lambda kv: kv[1])
+        return [
+            {
+                "path": self.paths[d],
+                "score": round(s, 4),
+                "terms": sorted(matched[d]),
+            }
+            for d, s in top
+        ]
+
+    def dump(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        payload = {
+            "v": 1,
+            "key": self.key,
+            "paths": self.paths,
+            "lengths": self.lengths,
+            "postings": self.postings,
+        }
+        tmp = f"{path}.tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump(payload, f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            payload = json.load(f)
+        return cls(
+            payload["key"], payload["paths"], payload["lengths"], payload["postings"]
+        )
+
+
+def _index_path(kind: str, key: str) -> str:
+    safe = re.sub(r"[^A-Za-z0-9_.-]+", "__", key)
+    return os.path.join(SEARCH_INDEX_DIR, f"{safe}.{kind}.json.gz")
+
+
+def find_snippet(text: str, terms: list[str]) -> tuple[int, str] | None:
+    """Return the first (1-based line number, stripped line) containing a query term."""
+    wanted = set(terms)
+    for lineno, line in enumerate(text.splitlines(), start=1):
+        if wanted.intersection(tokenize_code(line)):
+            return lineno, line.strip()[:200]
+    return None
+
+
+def attach_snippets(owner: str, repo: str, index: BM25Index, hits: list[dict]):
+    """Add ``line``/``snippet`` to hits when the snapshot is still in memory."""
+    snapshot = get_cached_snapshot(owner, repo, index.key.rsplit("@", 1)[1])
+    if snapshot:
+        for hit in hits:
+            snippet = find_snippet(snapshot["files"].get(hit["path"], ""), hit["terms"])
+            if snippet:
+                hit["line"], hit["snippet"] = snippet
+    return hits
+
+
+async def _get_repo_index(
+    owner: str, repo: str, kind: str, index_cls, cache: dict, build: bool
+):
+    """Return the ``index_cls`` index for the current default-branch tree.
+
+    Memory and disk are checked first; with ``build=False`` a missing index
+    returns None instead of downloading the repository. Once a head commit has
+    been mapped to its tree, lookups only need the small ref request rather than
+    the recursive tree.
+    """
+    head = await get_repo_head_sha(owner, repo)
+    tree_sha = _INDEX_TREE_BY_HEAD.get(f"{owner}/{repo}@{head}") if head else None
+    if tree_sha:
+        index = await _cached_repo_index(
+            kind, f"{owner}/{repo}@{tree_sha}", index_cls, cache
+        )
+        if index is not None:
+            return index
+
+    tree = await get_repo_tree(owner, repo)
+    key = f"{owner}/{repo}@{tree.get('sha')}"
+    if head:
+        while len(_INDEX_TREE_BY_HEAD) >= INDEX_HEAD_MEMO_LIMIT:
+            _INDEX_TREE_BY_HEAD.pop(next(iter(_INDEX_TREE_BY_HEAD)))
+        _INDEX_TREE_BY_HEAD[f"{owner}/{repo}@{head}"] = tree.get("sha")
+    index = await _cached_repo_index(kind, key, index_cls, cache)
+    if index is None:
+        if not build:
+            return None
+        index = await join_inflight(
+            _INDEX_BUILDS,
+            f"{kind}:{key}",
+            lambda: _build_repo_index(owner, repo, kind, index_cls, tree, key),
+            kind,
+        )
+
+    while len(cache) >= SEARCH_INDEX_MEMORY_LIMIT:
+        cache.pop(next(iter(cache)))
+    cache[key] = index
+    return index
+
+
+async def _cached_repo_index(kind: str, key: str, index_cls, cache: dict):
+    index = cache.get(key)
+    if index:
+        return index
+    disk_path = _index_path(kind, key)
+    if not os.path.exists(disk_path):
+        return None
+    try:
+        return await asyncio.to_thread(index_cls.load, disk_path)
+    except Exception as e:
+        logger.warning("Discarding unreadable %s index %s: %s", kind, disk_path, e)
+        return None
+
+
+async def _build_repo_index(
+    owner: str, repo: str, kind: str, index_cls, tree: dict, key: str
+):
+    snapshot = await get_repo_snapshot(owner, repo, tree)
+    index = await asyncio.to_thread(index_cls.build, key, snapshot["files"])
+    disk_path = _index_path(kind, key)
+    try:
+        await asyncio.to_thread(index.dump, disk_path)
+        await asyncio.to_thread(_prune_repo_indexes, owner, repo, kind, disk_path)
+    except OSError as e:
+        logger.warning("Could not persist %s index %s: %s", kind, disk_path, e)
+    return index
+
+
+def _prune_repo_indexes(owner: str, repo: str, kind: str, keep: str):
+    """Delete on-disk ``kind`` indexes of older trees of this repository."""
+    suffix = f".{kind}.json.gz"
+    prefix = os.path.basename(_index_path(kind, f"{owner}/{repo}@"))
+    pattern = re.compile(
+        re.escape(prefix.removesuffix(suffix)) + r"[0-9a-f]{40}" + re.escape(suffix)
+    )
+    directory = os.path.dirname(keep)
+    for name in os.listdir(directory or "."):
+        path = os.path.join(directory, name)
+        if pattern.fullmatch(name) and path != keep:
+            os.remove(path)
+
+
+async def get_search_index(
+    owner: str, repo: str, build: bool = True
+) -> BM25Index | None:
+    return await _get_repo_index(owner, repo, "bm25", BM25Index, _SEARCH_INDEXES, build)
+
+
+def _log_index_build_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Search index build failed: %s", task.exception())
+
+
+async def lexical_hits(owner: str, repo: str, query: str, limit: int = 5) -> list[dict]:
+    """Cheap first-pass retrieval for chat.
+
+    Uses an existing index only; when none exists yet, one is built in the
+    background so later questions benefit without delaying this one.
+    """
+    index = await get_search_index(owner, repo, build=False)
+    if index is None:
+        # Concurrent builds of the same tree are shared through _INDEX_BUILDS.
+        task = _schedule_background(get_search_index(owner, repo))
+        task.add_done_callback(_log_index_build_failure)
+        return []
+    return attach_snippets(owner, repo, index, index.search(query, limit=limit))
+
+
+# ---------- Symbol index (definitions, imports and call sites) ----------
+_SYMBOL_INDEXES: dict[str, "SymbolIndex"] = {}
+PY_EXTENSIONS = (".py", ".pyi")
+JS_EXTENSIONS = (".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx")
+
+_JS_KEYWORDS = {
+    "if",
+    "for",
+    "while",
+    "switch",
+    "catch",
+    "function",
+    "return",
+    "typeof",
+    "new",
+    "await",
+    "super",
+    "import",
+    "require",
+}
+_JS_DEF_PATTERNS = [
+    (
+        "function",
+        re.compile(
+            r"^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*([A-Za-z_$][\w$]*)"
+        ),
+    ),
+    (
+        "class",
+        re.compile(
+            r"^\s*(?:export\s+)?(?:default\s+)?(?:abstract\s+)?class\s+([A-Za-z_$][\w$]*)"
+        ),
+    ),
+    (
+        "function",
+        re.compile(
+            r"^\s*(?:export\s+)?(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*(?::[^=]+)?=\s*(?:async\s+)?(?:function\b|\([^)]*\)\s*(?::[^=]+)?=>|[A-Za-z_$][\w$]*\s*=>)"
+        ),
+    ),
+    ("variable", re.compile(r"^(?:export\s+)?(?:const|let|var)\s+([A-Za-z_$][\w$]*)")),
+    ("interface", re.compile(r"^\s*(?:export\s+)?interface\s+([A-Za-z_$][\w$]*)")),
+    (
+        "type",
+        re.compile(r"^\s*(?:export\s+)?type\s+([A-Za-z_$][\w$]*)\s*(?:<[^>]*>)?\s*="),
+    ),
+    ("enum", re.compile(r"^\s*(?:export\s+)?(?:const\s+)?enum\s+([A-Za-z_$][\w$]*)")),
+    (
+        "method",
+        re.compile(
+            r"^\s+(?:static\s+)?(?:async\s+)?([A-Za-z_$][\w$]*)\s*\([^)]*\)\s*(?::[^{]+)?\{\s*$"
+        ),
+    ),
+]
+_JS_IMPORT_RE = re.compile(r"^\s*import\s+(.+?)\s+from\s+['\"]([^'\"]+)['\"]")
+_JS_CALL_RE = re.compile(r"([A-Za-z_$][\w$]*)\s*\(")
+
+
+class _PySymbolVisitor(ast.NodeVisitor):
+    def __init__(self):
+        self.defs: list[tuple[str, str, int, str]] = []
+        self.calls: list[tuple[str, int, str]] = []
+        self._stack: list[tuple[str, str]] = []
+
+    def _container(self) -> str:
+        return ".".join(name for _, name in self._stack)
+
+    def visit_ClassDef(self, node):
+        self.defs.append((node.name, "class", node.lineno, self._container()))
+        self._stack.append(("class", node.name))
+        self.generic_visit(node)
+        self._stack.pop()
+
+    def _visit_function(self, node):
+        in_class = bool(self._stack) and self._stack[-1][0] == "class"
+        kind = "method" if in_class else "function"
+        self.defs.append((node.name, kind, node.lineno, self._container()))
+        self._stack.append(("function", node.name))
+        self.generic_visit(node)
+        self._stack.pop()
+
+    visit_FunctionDef = _visit_function
+    visit_AsyncFunctionDef = _visit_function
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            name = alias.asname or alias.name.split(".")[0]
+            self.defs.append((name, "import", node.lineno, alias.name))
+
+    def visit_ImportFrom(self, node):
+        module = "." * node.level + (node.module or "")
+        for alias in node.names:
+            self.defs.append(
+                (alias.asname or alias.name, "import", node.lineno, module)
+            )
+
+    def _visit_assign_targets(self, targets, lineno):
+        if self._stack:
+            return  # only module-level names are interesting definitions
+        for target in targets:
+            if isinstance(target, ast.Name):
+                self.defs.append((target.id, "variable", lineno, ""))
+
+    def visit_Assign(self, node):
+        self._visit_assign_targets(node.targets, node.lineno)
+        self.generic_visit(node)
+
+    def visit_AnnAssign(self, node):
+        self._visit_assign_targets([node.target], node.lineno)
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        func = node.func
+        name = (
+            func.id
+            if isinstance(func, ast.Name)
+            else func.attr if isinstance(func, ast.Attribute) else None
+        )
+        if name:
+            self.calls.append((name, node.lineno, self._container() or "<module>"))
+        self.generic_visit(node)
+
+
+def _parse_python_symbols(text: str):
+    visitor = _PySymbolVisitor()
+    try:
+        visitor.visit(ast.parse(text.lstrip("\ufeff")))
+    except (SyntaxError, ValueError, RecursionError):
+        pass
+    return visitor.defs, visitor.calls
+
+
+def _parse_js_symbols(text: str):
+    """Line-based JS/TS scan; good enough for top-level declarations and calls."""
+    defs: list[tuple[str, str, int, str]] = []
+    calls: list[tuple[str, int, str]] = []
+    current_fn = "<module>"
+    for lineno, line in enumerate(text.splitlines(), start=1):
+        stripped = line.strip()
+        if stripped.startswith(("//", "*", "/*")):
+            continue
+        m = _JS_IMPORT_RE.match(line)
+        if m:
+            clause, module = m.groups()
+            names = re.findall(r"(?:\bas\s+)?([A-Za-z_$][\w$]*)", clause)
+            for name in names:
+                if name not in ("as", "type"):
+                    defs.append((name, "import", lineno, module))
+            continue
+        defined = None
+        for kind, pat in _JS_DEF_PATTERNS:
+            dm = pat.match(line)
+            if dm and dm.group(1) not in _JS_KEYWORDS:
+                defined = dm.group(1)
+                defs.append((defined, kind, lineno, ""))
+                if kind in ("function", "method"):
+                    current_fn = defined
+                break
+        for cm in _JS_CALL_RE.finditer(line):
+            name = cm.group(1)
+            if name != defined and name not in _JS_KEYWORDS:
+                calls.append((name, lineno, current_fn))
+    return defs, calls
+
+
+class SymbolIndex:
+    """Definitions and call sites for one repository snapshot, keyed by name."""
+
+    def __init__(self, key: str, paths: list[str], defs: dict, calls: dict):
+        self.key = key
+        self.paths = paths
+        self.defs = defs  # name -> [[kind, path_idx, line, container], ...]
+        self.calls = calls  # name -> [[path_idx, line, caller], ...]
+        self._lower = {name.lower(): name for name in {*defs, *calls}}
+
+    @classmethod
+    def build(cls, key: str, files: dict[str, str]) -> "SymbolIndex":
+        paths: list[str] = []
+        defs: dict[str, list] = defaultdict(list)
+        calls: dict[str, list] = defaultdict(list)
+        for path in sorted(files):
+            if path.endswith(PY_EXTENSIONS):
+                file_defs, file_calls = _parse_python_symbols(files[path])
+            elif path.endswith(JS_EXTENSIONS):
+                file_defs, file_calls = _parse_js_symbols(files[path])
+            else:
+                continue
+            idx = len(paths)
+            paths.append(path)
+            for name, kind, line, container in file_defs:
+                defs[name].append([kind, idx, line, container])
+            for name, line, caller in file_calls:
+                calls[name].append([idx, line, caller])
+        return cls(key, paths, dict(defs), dict(calls))
+
+    def _resolve(self, name: str) -> str:
+        if name in self.defs or name in self.calls:
+            return name
+        return self._lower.get(name.lower(), name)
+
+    def definitions(self, name: str) -> list[dict]:
+        name = self._resolve(name)
+        return [
+            {
+                "name": name,
+                "kind": kind,
+                "path": self.paths[idx],
+                "line": line,
+                "container": container,
+            }
+            for kind, idx, line, container in self.defs.get(name, [])
+        ]
+
+    def callers(self, name: str) -> list[dict]:
+        name = self._resolve(name)
+        return [
+            {"name": name, "path": self.paths[idx], "line": line, "caller": caller}
+            for idx, line, caller in self.calls.get(name, [])
+        ]
 
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-    items, langs, meta, contr = results[0], results[1], results[2], results[3]
-    readme = results[4] if include_readme and len(results) > 4 else None
+    def dump(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        payload = {
+            "v": 1,
+            "key": self.key,
+            "paths": self.paths,
+            "defs": self.defs,
+            "calls": self.calls,
+        }
+        tmp = f"{path}.tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump(payload, f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "SymbolIndex":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            payload = json.load(f)
+        return cls(payload["key"], payload["paths"], payload["defs"], payload["calls"])
+
+
+async def get_symbol_index(
+    owner: str, repo: str, build: bool = True
+) -> SymbolIndex | None:
+    return await _get_repo_index(
+        owner, repo, "symbols", SymbolIndex, _SYMBOL_INDEXES, build
+    )
 
-    if not isinstance(items, Exception):
-        files = [it["path"] for it in items if it.get("type") == "file"]
-        dirs = [it["path"] for it in items if it.get("type") == "dir"]
-        context["files"] = files[:max_files]
-        context["dirs"] = dirs[:max_files]
 
-    if not isinstance(langs, Exception):
-        total = sum(langs.values()) or 1
-        context["languages"] = {k: round(v * 100 / total, 2) for k, v in langs.items()}
+# How users write a symbol: `backticked`, name(), snake_case, dotted.name,
+# camelCase or CamelCase. Plain words ("tests", "api") don't qualify, so ordinary
+# questions are not taken for symbol lookups.
+SYMBOL_SHAPE = (
+    r"(?<![\w$])(?:`[A-Za-z_$][\w$.]*`"
+    r"|[A-Za-z_$][\w$.]*\(\)"
+    r"|(?=[A-Za-z_$])[\w$]*_[\w$]+(?:\.[\w$]+)*"
+    r"|[A-Za-z_$][\w$]*(?:\.[A-Za-z_$][\w$]*)+"
+    r"|(?-i:[a-z][a-z0-9]*[A-Z][\w$]*|[A-Z][a-z0-9]+[A-Z][\w$]*))(?![\w$])"
+)
+_SYMBOL_KIND = r"(?:the\s+)?(?:function\s+|class\s+|method\s+|variable\s+)?"
+
+_SYMBOL_QUERY_RES = [
+    re.compile(rf"\bwhere\s+(?:is|are)\s+{_SYMBOL_KIND}({SYMBOL_SHAPE})", re.I),
+    re.compile(
+        r"\b(?:definition\s+of|callers?\s+of|calls|call|defines?|invokes|uses)\s+"
+        rf"{_SYMBOL_KIND}({SYMBOL_SHAPE})",
+        re.I,
+    ),
+]
 
-    if not isinstance(meta, Exception):
-        context["stars"] = meta.get("stargazers_count", 0)
-        lic = meta.get("license") or {}
-        context["license"] = lic.get("spdx_id") or lic.get("key") or ""
-        context["description"] = meta.get("description") or ""
-    else:
-        context["stars"] = 0
-        context["license"] = ""
-        context["description"] = ""
 
-    context["contributors_count"] = 0 if isinstance(contr, Exception) else len(contr)
-    context["readme"] = (
-        "" if isinstance(readme, Exception) or not readme else str(readme)[:1000]
-    )
+def extract_symbol(msg: str) -> str | None:
+    for pat in _SYMBOL_QUERY_RES:
+        m = pat.search(msg)
+        if m:
+            return m.group(1).strip("`").removesuffix("()").rstrip(".")
+    return None
 
-    _REPO_CONTEXT_CACHE[ck] = (time.time() + REPO_CONTEXT_TTL_SECONDS, context)
-    return context
+
+def answer_symbol_query(index: SymbolIndex, intent: str, symbol: str) -> ChatResponse:
+    """Deterministic answer for definition/caller questions, citing path:line."""
+    lookup = symbol.rsplit(".", 1)[-1]
+    if intent == "find_definition":
+        found = index.definitions(lookup)
+        # Prefer real definitions over the places that merely import the name.
+        defs = [d for d in found if d["kind"] != "import"] or found
+        if not defs:
+            return ChatResponse(
+                reply=f"I couldn't find a definition of `{symbol}` in this repository.",
+                meta={"grounded": True, "symbol": symbol, "matches": 0},
+            )
+        lines = []
+        for d in defs[:20]:
+            if d["kind"] == "import":
+                where = f"imported from {d['container']}"
+            elif d["container"]:
+                where = f"{d['kind']} in {d['container']}"
+            else:
+                where = d["kind"]
+            lines.append(f"- `{d['path']}:{d['line']}` ({where})")
+        return ChatResponse(
+            reply=f"`{symbol}` is defined in:\n" + "\n".join(lines),
+            sources=[f"{d['path']}:{d['line']}" for d in defs[:20]],
+            meta={"grounded": True, "symbol": symbol, "matches": len(defs)},
+        )
+
+    calls = index.callers(lookup)
+    if not calls:
+        return ChatResponse(
+            reply=f"I couldn't find any calls to `{symbol}` in this repository.",
+            meta={"grounded": True, "symbol": symbol, "matches": 0},
+        )
+    lines = [f"- `{c['path']}:{c['line']}` in {c['caller']}" for c in calls[:30]]
+    more = f"\n...and {len(calls) - 30} more." if len(calls) > 30 else ""
+    return ChatResponse(
+        reply=f"`{symbol}` is called from:\n" + "\n".join(lines) + more,
+        sources=[f"{c['path']}:{c['line']}" for c in calls[:30]],
+        meta={"grounded": True, "symbol": symbol, "matches": len(calls)},
+    )
 
 
 # ---------- NEW: smarter intent detection ----------
 INTENT_PATTERNS = [
+    (
+        "find_callers",
+        rf"\b(what|who|which \w+)\s+(calls|invokes|uses)\s+{_SYMBOL_KIND}{SYMBOL_SHAPE}"
+        rf"|\bcallers?\s+of\s+{_SYMBOL_KIND}{SYMBOL_SHAPE}"
+        rf"|\bwhere\s+(is|are)\s+{_SYMBOL_KIND}{SYMBOL_SHAPE}\s+(called|used|invoked)\b",
+    ),
+    (
+        "find_definition",
+        rf"\bwhere\s+(is|are)\s+{_SYMBOL_KIND}{SYMBOL_SHAPE}"
+        r"(\s+(function|class|method|variable))?\s+(defined|declared|implemented)\b"
+        rf"|\bdefinition\s+of\s+{_SYMBOL_KIND}{SYMBOL_SHAPE}",
+    ),
     ("summarize_file", r"\b(explain|summarize|describe|what does)\b.*\b(file|code)\b"),
     (
         "repo_structure",
@@ -808,12 +3653,281 @@ INTENT_PATTERNS = [
 ]
 
 
+class IntentEngine:
+    """Priority-ordered intent classifier with optional per-intent handlers.
+
+    All patterns are compiled into one regex of zero-width alternatives,
+    ``\\b(?=\\w)(?:(?=(?P<i0>p0))|(?=(?P<i1>p1))|...)``, scanned once over the
+    message: at each word start the first alternative that matches there is
+    reported, and the highest-priority intent seen wins (the scan stops early on
+    the top one). Patterns are keyword patterns and must match from the start of
+    a word, as the ``\\b``-anchored built-ins do. Matching ignores case; wrap a
+    part that must not in ``(?-i:...)``.
+    """
+
+    def __init__(self, default: str = "freeform"):
+        self.default = default
+        self._intents: dict[str, dict] = {}
+        self._matcher: Optional[re.Pattern] = None
+        self._groups: dict[str, tuple[int, str]] = {}
+        self._stats: dict[str, dict] = {}
+
+    def register(
+        self,
+        name: str,
+        pattern: Optional[str] = None,
+        handler: Optional[Callable] = None,
+        priority: Optional[int] = None,
+    ):
+        """Add or update an intent. Lower priority wins; ties keep registration order."""
+        entry = self._intents.setdefault(
+            name, {"pattern": None, "handler": None, "priority": 100}
+        )
+        entry.setdefault("order", len(self._intents))
+        if pattern is not None:
+            re.compile(pattern)  # fail at registration, not on the first message
+            entry["pattern"] = pattern
+        if handler is not None:
+            entry["handler"] = handler
+        if priority is not None:
+            entry["priority"] = priority
+        self._matcher = None
+
+    def intent(
+        self, name: str, pattern: Optional[str] = None, priority: Optional[int] = None
+    ):
+        """Decorator form of register() for handlers."""
+
+        def decorate(fn):
+            self.register(name, pattern, fn, priority)
+            return fn
+
+        return decorate
+
+    def patterns(self) -> list[tuple[str, str]]:
+        ordered = sorted(
+            self._intents.items(), key=lambda kv: (kv[1]["priority"], kv[1]["order"])
+        )
+        return [(name, e["pattern"]) for name, e in ordered if e["pattern"]]
+
+    def compile(self) -> re.Pattern:
+        alternatives = []
+        self._groups = {}
+        for i, (name, pattern) in enumerate(self.patterns()):
+            self._groups[f"i{i}"] = (i, name)
+            alternatives.append(f"(?=(?P<i{i}>{pattern}))")
+        self._matcher = re.compile(
+            r"\b(?=\w)(?:" + "|".join(alternatives) + ")" if alternatives else "(?!)",
+            re.I,
+        )
+        return self._matcher
+
+    def _record(self, name: str, field: str, seconds: float):
+        stat = self._stats.setdefault(
+            name,
+            {"count": 0, "classify_seconds": 0.0, "handled": 0, "handler_seconds": 0.0},
+        )
+        if field == "classify_seconds":
+            stat["count"] += 1
+        else:
+            stat["handled"] += 1
+        stat[field] += seconds
+
+    def classify(self, text: str) -> str:
+        start = time.perf_counter()
+        matcher = self._matcher or self.compile()
+        best = None
+        for m in matcher.finditer(text):
+            rank, name = self._groups[m.lastgroup]
+            if best is None or rank < best[0]:
+                best = (rank, name)
+                if rank == 0:
+                    break
+        name = best[1] if best else self.default
+        self._record(name, "classify_seconds", time.perf_counter() - start)
+        return name
+
+    async def dispatch(self, name: str, *args):
+        """Run the intent's handler; None when it has none or declines to answer."""
+        handler = self._intents.get(name, {}).get("handler")
+        if handler is None:
+            return None
+        start = time.perf_counter()
+        try:
+            with span(f"intent.{name}"):
+                return await handler(*args)
+        finally:
+            self._record(name, "handler_seconds", time.perf_counter() - start)
+
+    def stats(self) -> dict:
+        out = {}
+        for name, st in self._stats.items():
+            out[name] = {
+                "count": st["count"],
+                "avg_classify_us": (
+                    round(st["classify_seconds"] / st["count"] * 1e6, 2)
+                    if st["count"]
+                    else 0.0
+                ),
+                "handled": st["handled"],
+                "avg_handler_ms": (
+                    round(st["handler_seconds"] / st["handled"] * 1000, 2)
+                    if st["handled"]
+                    else 0.0
+                ),
+            }
+        return out
+
+
+INTENTS = IntentEngine()
+for _name, _pattern in INTENT_PATTERNS:
+    INTENTS.register(_name, _pattern)
+
+
 def detect_intent(msg: str) -> str:
-    text = msg.lower().strip()
-    for intent, pat in INTENT_PATTERNS:
-        if re.search(pat, text):
-            return intent
-    return "freeform"  # <â€” anything else goes to LLM (ChatGPT-like)
+    # Anything unmatched is "freeform" and goes to the LLM (ChatGPT-like).
+    return INTENTS.classify(msg.strip())
+
+
+# Structured intent handlers: (req, msg, generate) -> ChatResponse, or None to fall
+# through to the LLM path. generate(prompt) streams progress like call_llm.
+async def _answer_symbol_intent(intent: str, req: ChatRequest, msg: str):
+    symbol = extract_symbol(msg)
+    if not symbol:
+        return None
+    index = await get_symbol_index(req.github_user, req.repo)
+    reply = answer_symbol_query(index, intent, symbol)
+    # Nothing indexed under that name: let the normal generation path answer.
+    return reply if reply.meta["matches"] else None
+
+
+@INTENTS.intent("find_callers")
+async def _answer_find_callers(req: ChatRequest, msg: str, generate):
+    return await _answer_symbol_intent("find_callers", req, msg)
+
+
+@INTENTS.intent("find_definition")
+async def _answer_find_definition(req: ChatRequest, msg: str, generate):
+    return await _answer_symbol_intent("find_definition", req, msg)
+
+
+@INTENTS.intent("summarize_file")
+async def _answer_summarize_file(req: ChatRequest, msg: str, generate):
+    if not req.file_content:
+        return ChatResponse(
+            reply="[WARN] To explain a file, please select one first.",
+            meta={"grounded": False},
+        )
+
+    # Large files (especially notebooks) can time out local models.
+    max_chars = 12000
+    file_body = req.file_content[:max_chars]
+    truncated = len(req.file_content) > max_chars
+    prompt = (
+        "You are a helpful software assistant. "
+        "Explain the code below clearly and concisely. "
+        "Highlight its purpose, key functions, and overall structure.\n\n"
+        f"File: `{req.file}`\n\n"
+        f"Code:\n```\n{file_body}\n```\n\n"
+        + ("Note: The file content was truncated for speed.\n\n" if truncated else "")
+        + "Explanation:"
+    )
+    ans = await generate(prompt)
+    return ChatResponse(reply=ans, sources=[req.file], meta={"grounded": True})
+
+
+@INTENTS.intent("get_languages")
+async def _answer_languages(req: ChatRequest, msg: str, generate):
+    langs = await get_languages(req.github_user, req.repo)
+    if not langs:
+        return ChatResponse(reply="No language data found.")
+    total = sum(langs.values()) or 1
+    pct = {k: round(v * 100 / total, 2) for k, v in langs.items()}
+    breakdown = ", ".join(f"{k} ({v}%)" for k, v in pct.items())
+    return ChatResponse(
+        reply=f"Languages in {req.repo}: {breakdown}", meta={"languages": pct}
+    )
+
+
+@INTENTS.intent("repo_structure")
+async def _answer_repo_structure(req: ChatRequest, msg: str, generate):
+    items = await fetch_root_contents(req.github_user, req.repo)
+    files = [x["path"] for x in items if x.get("type") == "file"]
+    dirs = [x["path"] for x in items if x.get("type") == "dir"]
+    sample = (dirs[:12] + files[:12])[:20]
+    if not sample:
+        return ChatResponse(
+            reply=f"I could not find visible root items for {req.github_user}/{req.repo}."
+        )
+    listing = "\n".join(f"- {p}" for p in sample)
+    return ChatResponse(
+        reply=(
+            f"Root structure for {req.github_user}/{req.repo}:\n"
+            f"- Directories: {len(dirs)}\n"
+            f"- Files: {len(files)}\n"
+            f"{listing}"
+        ),
+        meta={"dirs": len(dirs), "files": len(files), "grounded": True},
+    )
+
+
+@INTENTS.intent("list_files")
+async def _answer_list_files(req: ChatRequest, msg: str, generate):
+    items = await fetch_root_contents(req.github_user, req.repo)
+    files = [x["path"] for x in items if x.get("type") == "file"]
+    if not files:
+        return ChatResponse(
+            reply=f"No root-level files found in {req.github_user}/{req.repo}.",
+            meta={"grounded": True},
+        )
+    listing = "\n".join(f"- {p}" for p in files[:40])
+    return ChatResponse(
+        reply=f"Root files in {req.github_user}/{req.repo}:\n{listing}",
+        meta={
+            "files_returned": min(len(files), 40),
+            "total_root_files": len(files),
+            "grounded": True,
+        },
+    )
+
+
+@INTENTS.intent("count_files")
+async def _answer_count_files(req: ChatRequest, msg: str, generate):
+    # count **all** files via git trees API (more impressive than root only)
+    try:
+        total = await count_all_files(req.github_user, req.repo)
+        return ChatResponse(reply=f"{req.repo} contains {total} files (all paths).")
+    except Exception:
+        # graceful fallback to root only
+        files = await fetch_root_contents(req.github_user, req.repo)
+        n = len([x for x in files if x.get("type") == "file"])
+        return ChatResponse(
+            reply=f"{req.repo} has {n} files in the root directory (full count unavailable)."
+        )
+
+
+@INTENTS.intent("get_stars")
+async def _answer_stars(req: ChatRequest, msg: str, generate):
+    meta = await get_repo_meta(req.github_user, req.repo)
+    stars = meta.get("stargazers_count", 0)
+    return ChatResponse(reply=f"{req.repo} has * {stars} stars.", meta={"stars": stars})
+
+
+@INTENTS.intent("get_repo_name")
+async def _answer_repo_name(req: ChatRequest, msg: str, generate):
+    return ChatResponse(reply=f"The name of this repository is **{req.repo}**.")
+
+
+@INTENTS.intent("get_contributors")
+async def _answer_contributors(req: ChatRequest, msg: str, generate):
+    contr = await get_contributors(req.github_user, req.repo)
+    return ChatResponse(
+        reply=f"{req.repo} has {len(contr)} contributors.",
+        meta={"contributors": len(contr)},
+    )
+
+
+INTENTS.compile()
 
 
 async def get_ollama_models() -> list[str]:
@@ -822,22 +3936,160 @@ async def get_ollama_models() -> list[str]:
         return _OLLAMA_MODELS_CACHE[1]
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as c:
-            res = await c.get(f"{OLLAMA_URL}/api/tags")
-            res.raise_for_status()
-            payload = res.json()
-            models = [
-                m.get("name", "") for m in payload.get("models", []) if m.get("name")
-            ]
-            _OLLAMA_MODELS_CACHE = (time.time() + OLLAMA_MODELS_TTL_SECONDS, models)
-            return models
+        res = await get_http_client().get(
+            f"{OLLAMA_URL}/api/tags", timeout=deadline_timeout(10.0, "ollama")
+        )
+        res.raise_for_status()
+        payload = res.json()
+        models = [m.get("name", "") for m in payload.get("models", []) if m.get("name")]
+        _OLLAMA_MODELS_CACHE = (time.time() + OLLAMA_MODELS_TTL_SECONDS, models)
+        return models
     except Exception:
         return []
 
 
 # ---------- NEW: robust LLM call with system-style instruction ----------
-async def call_llm(prompt: str, requested_model: Optional[str] = None) -> str:
-    if _is_circuit_open("ollama"):
+# One semaphore per event loop (like the HTTP clients) caps generations at
+# OLLAMA_MAX_CONCURRENCY for every caller on that loop.
+_OLLAMA_SLOTS: (
+    "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]"
+) = weakref.WeakKeyDictionary()
+
+
+def ollama_slots() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    slots = _OLLAMA_SLOTS.get(loop)
+    if slots is None:
+        slots = _OLLAMA_SLOTS[loop] = asyncio.Semaphore(max(1, OLLAMA_MAX_CONCURRENCY))
+    return slots
+
+
+@asynccontextmanager
+async def ollama_slot():
+    """Wait for a free generation slot, giving up when the deadline runs out."""
+    slots = ollama_slots()
+    try:
+        async with asyncio.timeout(deadline_remaining()):
+            await slots.acquire()
+    except TimeoutError as e:
+        if deadline_expired():
+            raise DeadlineExceeded("ollama") from e
+        raise
+    try:
+        yield
+    finally:
+        slots.release()
+
+
+async def _ollama_generate(
+    model_name: str, prompt: str, on_chunk: Optional[Callable[[str], None]] = None
+) -> tuple[int, str]:
+    """POST /api/generate and return (status code, response text).
+
+    With ``on_chunk`` the response is streamed and every text piece is passed to
+    the callback as it arrives. Under a request deadline the response is always
+    streamed, so when the budget runs out mid-answer the text so far is raised
+    with DeadlineExceeded instead of being thrown away. Every call holds one of the
+    process-wide OLLAMA_MAX_CONCURRENCY slots while it runs.
+    """
+    async with ollama_slot():
+        return await _ollama_generate_now(model_name, prompt, on_chunk)
+
+
+async def _ollama_generate_now(
+    model_name: str, prompt: str, on_chunk: Optional[Callable[[str], None]]
+) -> tuple[int, str]:
+    timeout = deadline_timeout(90.0, "ollama")
+    remaining = deadline_remaining()
+    stream = on_chunk is not None or remaining is not None
+    payload = {
+        "model": model_name,
+        "prompt": prompt,
+        "stream": stream,
+        "options": {"num_predict": 220, "temperature": 0.2},
+    }
+    client = get_http_client()
+    url = f"{OLLAMA_URL}/api/generate"
+    started = time.perf_counter()
+    status: int | str = "error"
+    try:
+        if not stream:
+            res = await client.post(url, json=payload, timeout=timeout)
+            status = res.status_code
+            if res.status_code >= 400:
+                return res.status_code, ""
+            return res.status_code, res.json().get("response") or ""
+
+        parts: list[str] = []
+        budget = asyncio.timeout(remaining)
+        try:
+            async with budget:
+                async with client.stream(
+                    "POST", url, json=payload, timeout=timeout
+                ) as res:
+                    status = res.status_code
+                    if res.status_code >= 400:
+                        return res.status_code, ""
+                    async for line in res.aiter_lines():
+                        if not line.strip():
+                            continue
+                        chunk = json.loads(line)
+                        piece = chunk.get("response") or ""
+                        if piece:
+                            parts.append(piece)
+                            if on_chunk is not None:
+                                on_chunk(piece)
+                        if chunk.get("done"):
+                            break
+        except (TimeoutError, httpx.TimeoutException) as e:
+            if not budget.expired() and not deadline_expired():
+                raise
+            _CURRENT_DEADLINE.get().mark_exceeded()
+            status = "deadline"
+            raise DeadlineExceeded("ollama", "".join(parts)) from e
+        return res.status_code, "".join(parts)
+    finally:
+        observe_upstream("ollama", started, status, model_name)
+
+
+LLM_CUT_SHORT_NOTE = "[Answer cut short: the request ran out of time.]"
+
+
+def _deadline_reply(partial: str) -> str:
+    """The best answer left when the deadline cut generation short."""
+    partial = partial.strip()
+    if partial:
+        return partial + "\n\n" + LLM_CUT_SHORT_NOTE
+    return (
+        "AI generation ran out of time before the model answered. "
+        "Try again, or allow a longer deadline."
+    )
+
+
+async def call_llm(
+    prompt: str,
+    requested_model: Optional[str] = None,
+    on_chunk: Optional[Callable[[str], None]] = None,
+    on_retry: Optional[Callable[[], None]] = None,
+) -> str:
+    """Generate an answer, retrying and falling back across models.
+
+    ``on_chunk`` receives streamed text pieces. ``on_retry`` is called before every
+    attempt after the first, so a streaming caller can drop the pieces of the
+    attempt that failed.
+    """
+    with span("call_llm"):
+        return await _call_llm(prompt, requested_model, on_chunk, on_retry)
+
+
+async def _call_llm(
+    prompt: str,
+    requested_model: Optional[str] = None,
+    on_chunk: Optional[Callable[[str], None]] = None,
+    on_retry: Optional[Callable[[], None]] = None,
+) -> str:
+    breaker = CIRCUITS["ollama"]
+    if not breaker.allow():
         return "AI backend temporarily unavailable due to repeated errors. Try again shortly."
 
     installed = await get_ollama_models()
@@ -851,60 +4103,81 @@ async def call_llm(prompt: str, requested_model: Optional[str] = None) -> str:
         candidates = [OLLAMA_MODEL]
 
     errors: list[str] = []
+    attempted = False
     for model_name in candidates:
+        if breaker.is_open:
+            break
         last_exc = None
         for attempt in range(1, 4):
+            if attempt > 1:
+                UPSTREAM_RETRIES.inc("ollama")
+            if attempted and on_retry is not None:
+                on_retry()
+            attempted = True
             try:
-                async with httpx.AsyncClient(timeout=90.0) as c:
-                    res = await c.post(
-                        f"{OLLAMA_URL}/api/generate",
-                        json={
-                            "model": model_name,
-                            "prompt": prompt,
-                            "stream": False,
-                            "options": {"num_predict": 220, "temperature": 0.2},
-                        },
+                with span("ollama", model=model_name, attempt=attempt) as sp:
+                    status_code, text = await _ollama_generate(
+                        model_name, prompt, on_chunk
                     )
-                if res.status_code == 404:
+                    if sp is not None:
+                        sp["attrs"]["status"] = status_code
+                if status_code == 404:
+                    breaker.record_success()  # Ollama is up; the model is missing
                     errors.append(f"{model_name}: not found")
                     break
-                if res.status_code in (500, 502, 503, 504):
-                    _record_failure("ollama")
-                    if attempt < 3:
+                if status_code == 429:
+                    breaker.record_rate_limited()
+                    errors.append(f"{model_name}: rate limited")
+                    break
+                if status_code in (500, 502, 503, 504):
+                    breaker.record_failure()
+                    if (
+                        attempt < 3
+                        and not breaker.is_open
+                        and deadline_allows(0.5 * attempt)
+                    ):
                         await asyncio.sleep(0.5 * attempt)
                         continue
-                    res.raise_for_status()
-
-                res.raise_for_status()
-                answer = (res.json().get("response") or "").strip()
+                    errors.append(f"{model_name}: HTTP {status_code}")
+                    break
+                if status_code >= 400:
+                    raise RuntimeError(f"HTTP {status_code}")
+                breaker.record_success()
+                answer = text.strip()
                 if answer:
-                    _record_success("ollama")
                     return answer
                 errors.append(f"{model_name}: empty response")
                 break
 
+            except DeadlineExceeded as e:
+                # Out of budget: no more retries or fallbacks, keep what we have.
+                return _deadline_reply(e.partial)
             except httpx.ReadTimeout as e:
                 last_exc = e
                 errors.append(f"{model_name}: timeout")
-                _record_failure("ollama")
-                if attempt < 3:
+                breaker.record_failure()
+                if (
+                    attempt < 3
+                    and not breaker.is_open
+                    and deadline_allows(0.5 * attempt)
+                ):
                     await asyncio.sleep(0.5 * attempt)
                     continue
                 break
             except httpx.ConnectError as e:
                 last_exc = e
-                _record_failure("ollama")
+                breaker.record_failure()
                 return f"Could not reach AI backend at {OLLAMA_URL}. Ensure Ollama is running."
             except Exception as e:
                 last_exc = e
                 errors.append(f"{model_name}: {repr(e)}")
-                _record_failure("ollama")
+                breaker.record_failure()
                 break
 
         # If we successfully got a response, return already happened.
         # Otherwise, try next model.
 
-    if _is_circuit_open("ollama"):
+    if breaker.is_open:
         return "AI backend temporarily unavailable due to repeated errors. Try again shortly."
 
     return "AI generation failed after model fallbacks: " + " | ".join(errors[:3])
@@ -934,138 +4207,487 @@ def format_context_block(ctx: dict) -> str:
     return "\n\n".join(lines)
 
 
-# ---------- REPLACE: the /api/chat endpoint with hybrid routing ----------
-@app.post("/api/chat", response_model=ChatResponse)
-async def chat(req: ChatRequest):
-    msg = (req.message or "").strip()
-    if not msg:
-        return ChatResponse(reply="")
+# ---------- Hierarchical file/directory/repository summaries ----------
+# Files are keyed by blob SHA and directories by their git tree SHA, so after a
+# push only the changed files and the directories above them are re-summarised.
+SUMMARIES_DB_PATH = os.getenv("SUMMARIES_DB_PATH", "summaries.db")
+SUMMARY_MAX_FILES = int(os.getenv("SUMMARY_MAX_FILES", "150"))
+SUMMARY_FILE_CHARS = 4000
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "1"))
+# Roll-ups built while some of their files could not be summarised are kept only
+# this long, so the next build after it retries the missing parts.
+SUMMARY_PARTIAL_TTL_SECONDS = float(os.getenv("SUMMARY_PARTIAL_TTL_SECONDS", "600"))
+SUMMARY_SOURCE_EXTENSIONS = (
+    *PY_EXTENSIONS,
+    *JS_EXTENSIONS,
+    ".go",
+    ".rs",
+    ".java",
+    ".kt",
+    ".rb",
+    ".php",
+    ".c",
+    ".h",
+    ".cpp",
+    ".cs",
+    ".swift",
+    ".md",
+    ".toml",
+    ".yml",
+    ".yaml",
+    ".json",
+)
+LLM_ERROR_PREFIXES = (
+    "AI backend temporarily unavailable",
+    "Could not reach AI backend",
+    "AI generation failed",
+    "AI generation ran out of time",
+)
+_SUMMARY_JOBS: dict[str, dict] = {}
+_summary_store_ready = False
 
-    intent = detect_intent(msg)
 
-    # 1) Structured intents -> GitHub API (deterministic answers)
-    try:
-        if intent == "summarize_file":
-            if not req.file_content:
-                return ChatResponse(
-                    reply="[WARN] To explain a file, please select one first.",
-                    meta={"grounded": False},
+def _summary_db_connect():
+    global _summary_store_ready
+    conn = sqlite3.connect(SUMMARIES_DB_PATH)
+    conn.row_factory = sqlite3.Row
+    if not _summary_store_ready:
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS summaries (
+                    key TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    expires REAL
                 )
+                """)
+            columns = {r["name"] for r in conn.execute("PRAGMA table_info(summaries)")}
+            if "expires" not in columns:
+                conn.execute("ALTER TABLE summaries ADD COLUMN expires REAL")
+        _summary_store_ready = True
+    return conn
 
-            # Large files (especially notebooks) can time out local models.
-            max_chars = 12000
-            file_body = req.file_content[:max_chars]
-            truncated = len(req.file_content) > max_chars
-            prompt = (
-                "You are a helpful software assistant. "
-                "Explain the code below clearly and concisely. "
-                "Highlight its purpose, key functions, and overall structure.\n\n"
-                f"File: `{req.file}`\n\n"
-                f"Code:\n```\n{file_body}\n```\n\n"
-                + (
-                    "Note: The file content was truncated for speed.\n\n"
-                    if truncated
-                    else ""
-                )
-                + "Explanation:"
-            )
-            ans = await call_llm(prompt, req.model)
-            return ChatResponse(reply=ans, sources=[req.file], meta={"grounded": True})
-
-        if intent == "get_languages":
-            langs = await get_languages(req.github_user, req.repo)
-            if not langs:
-                return ChatResponse(reply="No language data found.")
-            total = sum(langs.values()) or 1
-            pct = {k: round(v * 100 / total, 2) for k, v in langs.items()}
-            breakdown = ", ".join(f"{k} ({v}%)" for k, v in pct.items())
-            return ChatResponse(
-                reply=f"Languages in {req.repo}: {breakdown}", meta={"languages": pct}
-            )
 
-        if intent == "repo_structure":
-            items = await fetch_root_contents(req.github_user, req.repo)
-            files = [x["path"] for x in items if x.get("type") == "file"]
-            dirs = [x["path"] for x in items if x.get("type") == "dir"]
-            sample = (dirs[:12] + files[:12])[:20]
-            if not sample:
-                return ChatResponse(
-                    reply=f"I could not find visible root items for {req.github_user}/{req.repo}."
-                )
-            listing = "\n".join(f"- {p}" for p in sample)
-            return ChatResponse(
-                reply=(
-                    f"Root structure for {req.github_user}/{req.repo}:\n"
-                    f"- Directories: {len(dirs)}\n"
-                    f"- Files: {len(files)}\n"
-                    f"{listing}"
-                ),
-                meta={"dirs": len(dirs), "files": len(files), "grounded": True},
+def summary_store_get_entries(keys: list[str]) -> dict[str, dict]:
+    """Unexpired summaries by key, each as ``{"summary", "partial"}``."""
+    if not keys:
+        return {}
+    found: dict[str, dict] = {}
+    with _summary_db_connect() as conn:
+        for i in range(0, len(keys), 500):
+            batch = keys[i : i + 500]
+            rows = conn.execute(
+                f"SELECT key, summary, expires FROM summaries WHERE key IN ({','.join('?' * len(batch))})"
+                " AND (expires IS NULL OR expires > ?)",
+                [*batch, time.time()],
+            ).fetchall()
+            found.update(
+                {
+                    row["key"]: {
+                        "summary": row["summary"],
+                        "partial": row["expires"] is not None,
+                    }
+                    for row in rows
+                }
             )
+    return found
 
-        if intent == "list_files":
-            items = await fetch_root_contents(req.github_user, req.repo)
-            files = [x["path"] for x in items if x.get("type") == "file"]
-            if not files:
-                return ChatResponse(
-                    reply=f"No root-level files found in {req.github_user}/{req.repo}.",
-                    meta={"grounded": True},
-                )
-            listing = "\n".join(f"- {p}" for p in files[:40])
-            return ChatResponse(
-                reply=f"Root files in {req.github_user}/{req.repo}:\n{listing}",
-                meta={
-                    "files_returned": min(len(files), 40),
-                    "total_root_files": len(files),
-                    "grounded": True,
-                },
-            )
 
-        if intent == "count_files":
-            # count **all** files via git trees API (more impressive than root only)
-            try:
-                total = await count_all_files(req.github_user, req.repo)
-                return ChatResponse(
-                    reply=f"{req.repo} contains {total} files (all paths)."
+def summary_store_get_many(keys: list[str]) -> dict[str, str]:
+    return {k: e["summary"] for k, e in summary_store_get_entries(keys).items()}
+
+
+def summary_store_set(key: str, path: str, summary: str, partial: bool = False):
+    """Store a summary; partial ones expire after SUMMARY_PARTIAL_TTL_SECONDS."""
+    now = time.time()
+    expires = now + SUMMARY_PARTIAL_TTL_SECONDS if partial else None
+    with _summary_db_connect() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO summaries (key, path, summary, created, expires) VALUES (?, ?, ?, ?, ?)",
+            (key, path, summary, now, expires),
+        )
+
+
+def _is_llm_error(text: str) -> bool:
+    """True for error replies and for answers the deadline cut short."""
+    return (
+        not text
+        or text.startswith(LLM_ERROR_PREFIXES)
+        or text.endswith(LLM_CUT_SHORT_NOTE)
+    )
+
+
+async def _summarize_file(path: str, text: str, model: Optional[str]) -> str:
+    prompt = (
+        "Summarize what this file does in one or two sentences for a developer "
+        "new to the project. Mention key classes or functions only if central.\n\n"
+        f"File: {path}\n```\n{text[:SUMMARY_FILE_CHARS]}\n```\n\nSummary:"
+    )
+    return await call_llm(prompt, model)
+
+
+async def _summarize_children(
+    label: str, children: list[tuple[str, str]], model: Optional[str]
+) -> str:
+    listing = "\n".join(f"- {name}: {summary}" for name, summary in children)
+    prompt = (
+        f"Below are short summaries of the contents of {label}. Write a two or three "
+        "sentence summary of its overall purpose and how the parts fit together.\n\n"
+        f"{listing[:6000]}\n\nSummary:"
+    )
+    return await call_llm(prompt, model)
+
+
+def _select_summary_files(snapshot: dict) -> list[str]:
+    candidates = [
+        p
+        for p in snapshot["files"]
+        if p.endswith(SUMMARY_SOURCE_EXTENSIONS) and snapshot["files"][p].strip()
+    ]
+    # Shallow files describe a project better than deeply nested ones.
+    candidates.sort(key=lambda p: (p.count("/"), p))
+    return candidates[:SUMMARY_MAX_FILES]
+
+
+async def build_repo_summaries(owner: str, repo: str, model: Optional[str] = None):
+    """Summarise files, roll them up per directory, then into one repo summary."""
+    job = _SUMMARY_JOBS.setdefault(f"{owner}/{repo}", {})
+    tree = await get_repo_tree(owner, repo)
+    repo_key = f"tree:{tree.get('sha')}"
+    if await asyncio.to_thread(summary_store_get_many, [repo_key]):
+        job.update({"state": "done", "tree_sha": tree.get("sha")})
+        return
+
+    snapshot = await get_repo_snapshot(owner, repo, tree)
+    paths = _select_summary_files(snapshot)
+    file_keys = {p: f"blob:{snapshot['blobs'][p]}" for p in paths}
+    dir_shas = {
+        t["path"]: t.get("sha", "")
+        for t in tree.get("tree", [])
+        if t.get("type") == "tree"
+    }
+    summaries = await asyncio.to_thread(
+        summary_store_get_many, list(file_keys.values())
+    )
+    pending = [p for p in paths if file_keys[p] not in summaries]
+    job.update(
+        {
+            "state": "summarizing_files",
+            "tree_sha": tree.get("sha"),
+            "files_total": len(paths),
+            "files_cached": len(paths) - len(pending),
+            "files_done": 0,
+        }
+    )
+
+    sem = asyncio.Semaphore(max(1, SUMMARY_CONCURRENCY))
+    # Directories (and "" for the repository) missing part of their contents.
+    incomplete: set[str] = set()
+
+    def mark_incomplete(path: str):
+        while path:
+            path = path.rpartition("/")[0]
+            incomplete.add(path)
+
+    async def summarize(path: str):
+        async with sem:
+            text = await _summarize_file(path, snapshot["files"][path], model)
+        if _is_llm_error(text):
+            mark_incomplete(path)
+            return
+        summaries[file_keys[path]] = text
+        await asyncio.to_thread(summary_store_set, file_keys[path], path, text)
+        job["files_done"] += 1
+
+    await asyncio.gather(*(summarize(p) for p in pending))
+
+    # Roll up deepest directories first so parents can use their children.
+    job["state"] = "summarizing_directories"
+    children: dict[str, list[tuple[str, str]]] = defaultdict(list)
+    for path in paths:
+        if file_keys[path] in summaries:
+            parent, _, name = path.rpartition("/")
+            children[parent].append((name, summaries[file_keys[path]]))
+
+    dirs = sorted(dir_shas, key=lambda d: d.count("/"), reverse=True)
+    cached_dirs = await asyncio.to_thread(
+        summary_store_get_entries, [f"dir:{dir_shas[d]}" for d in dirs]
+    )
+    for d in dirs:
+        key = f"dir:{dir_shas[d]}"
+        cached = cached_dirs.get(key)
+        summary = cached["summary"] if cached else None
+        if cached and cached["partial"]:
+            mark_incomplete(d)
+        if summary is None and children.get(d):
+            if len(children[d]) == 1:
+                summary = children[d][0][1]
+            else:
+                summary = await _summarize_children(
+                    f"directory {d}/", children[d], model
                 )
-            except Exception:
-                # graceful fallback to root only
-                files = await fetch_root_contents(req.github_user, req.repo)
-                n = len([x for x in files if x.get("type") == "file"])
-                return ChatResponse(
-                    reply=f"{req.repo} has {n} files in the root directory (full count unavailable)."
+                if _is_llm_error(summary):
+                    mark_incomplete(d)
+                    continue
+                await asyncio.to_thread(
+                    summary_store_set, key, d, summary, d in incomplete
                 )
+        if summary:
+            parent, _, name = d.rpartition("/")
+            children[parent].append((f"{name}/", summary))
 
-        if intent == "get_stars":
-            meta = await get_repo_meta(req.github_user, req.repo)
-            stars = meta.get("stargazers_count", 0)
-            return ChatResponse(
-                reply=f"{req.repo} has * {stars} stars.", meta={"stars": stars}
-            )
+    if not children.get(""):
+        job["state"] = "failed"
+        return
+    job["state"] = "summarizing_repository"
+    summary = await _summarize_children(
+        f"the repository {owner}/{repo}", children[""], model
+    )
+    if _is_llm_error(summary):
+        job["state"] = "failed"
+        return
+    await asyncio.to_thread(summary_store_set, repo_key, "", summary, "" in incomplete)
+    job.update({"state": "done", "partial": "" in incomplete})
 
-        if intent == "get_repo_name":
-            return ChatResponse(reply=f"The name of this repository is **{req.repo}**.")
 
-        if intent == "get_contributors":
-            contr = await get_contributors(req.github_user, req.repo)
-            return ChatResponse(
-                reply=f"{req.repo} has {len(contr)} contributors.",
-                meta={"contributors": len(contr)},
-            )
+async def _build_repo_summaries_in_background(owner: str, repo: str, model=None):
+    job = _SUMMARY_JOBS.get(f"{owner}/{repo}")
+    if job and job.get("state", "done") not in ("done", "failed"):
+        return
+    _SUMMARY_JOBS[f"{owner}/{repo}"] = {"state": "queued"}
+    try:
+        await build_repo_summaries(owner, repo, model)
+    except Exception as e:
+        logger.warning("Summary pipeline failed for %s/%s: %s", owner, repo, e)
+        _SUMMARY_JOBS[f"{owner}/{repo}"]["state"] = "failed"
+
+
+async def get_cached_repo_summaries(owner: str, repo: str) -> dict | None:
+    """Repository summary plus top-level directory summaries, if already computed."""
+    tree = await get_repo_tree(owner, repo)
+    top_dirs = {
+        t["path"]: f"dir:{t.get('sha')}"
+        for t in tree.get("tree", [])
+        if t.get("type") == "tree" and "/" not in t["path"]
+    }
+    repo_key = f"tree:{tree.get('sha')}"
+    found = await asyncio.to_thread(
+        summary_store_get_entries, [repo_key, *top_dirs.values()]
+    )
+    if repo_key not in found:
+        return None
+    return {
+        "tree_sha": tree.get("sha"),
+        "repository": found[repo_key]["summary"],
+        "partial": found[repo_key]["partial"],
+        "directories": {
+            d: found[k]["summary"] for d, k in top_dirs.items() if k in found
+        },
+    }
+
+
+# ---------- Repository warm-up (prefetch caches before the first question) ----------
+# Warm-ups run one at a time from an in-process queue, with a pause between
+# GitHub calls, and are skipped when the remaining GitHub budget is low so
+# interactive requests always win.
+WARMUP_MIN_RATE_REMAINING = int(os.getenv("WARMUP_MIN_RATE_REMAINING", "500"))
+WARMUP_STEP_DELAY_SECONDS = float(os.getenv("WARMUP_STEP_DELAY_SECONDS", "0.2"))
+WARMUP_INDEXES = os.getenv("WARMUP_INDEXES", "false").lower() == "true"
+WARMUP_ON_LOGIN_REPOS = int(os.getenv("WARMUP_ON_LOGIN_REPOS", "1"))
+# Per-repo state is an LRU of at most WARMUP_STATE_LIMIT repos. Finished states
+# are forgotten WARMUP_STATE_TTL_SECONDS after the warm-up ends; queued and
+# running ones never expire, so no warm-up outlives its own state.
+WARMUP_STATE_LIMIT = int(os.getenv("WARMUP_STATE_LIMIT", "256"))
+WARMUP_STATE_TTL_SECONDS = float(os.getenv("WARMUP_STATE_TTL_SECONDS", "600"))
+_WARMUP_ACTIVE = ("queued", "running")
+_WARMUP_QUEUE: deque[tuple[str, str, bool]] = deque()
+_WARMUP_STATE: "OrderedDict[str, tuple[str, float]]" = OrderedDict()
+_warmup_drainer: asyncio.Task | None = None
+
+
+def _set_warmup_state(name: str, state: str):
+    _WARMUP_STATE[name] = (state, time.time())
+    _WARMUP_STATE.move_to_end(name)
+    if len(_WARMUP_STATE) > WARMUP_STATE_LIMIT:
+        finished = [
+            n for n, (st, _) in _WARMUP_STATE.items() if st not in _WARMUP_ACTIVE
+        ]
+        for n in finished[: len(_WARMUP_STATE) - WARMUP_STATE_LIMIT]:
+            del _WARMUP_STATE[n]
+
+
+def warmup_state(name: str) -> Optional[str]:
+    entry = _WARMUP_STATE.get(name)
+    if entry is None:
+        return None
+    state, updated = entry
+    if state not in _WARMUP_ACTIVE and time.time() - updated > WARMUP_STATE_TTL_SECONDS:
+        del _WARMUP_STATE[name]
+        return None
+    return state
+
+
+async def warm_repo(owner: str, repo: str, include_indexes: bool = False):
+    steps = [
+        lambda: get_repo_default_branch(owner, repo),
+        lambda: get_repo_tree(owner, repo),
+        lambda: build_repo_context(owner, repo, include_readme=True),
+        lambda: build_repo_context(owner, repo, include_readme=False),
+    ]
+    if include_indexes:
+        steps += [
+            lambda: get_search_index(owner, repo, build=True),
+            lambda: get_symbol_index(owner, repo, build=True),
+        ]
+    for step in steps:
+        if not github_budget_available(WARMUP_MIN_RATE_REMAINING):
+            logger.info("Warm-up of %s/%s stopped: GitHub budget low", owner, repo)
+            return False
+        await step()
+        await asyncio.sleep(WARMUP_STEP_DELAY_SECONDS)
+    return True
+
+
+async def _drain_warmup_queue():
+    while _WARMUP_QUEUE:
+        owner, repo, include_indexes = _WARMUP_QUEUE.popleft()
+        name = f"{owner}/{repo}"
+        _set_warmup_state(name, "running")
+        try:
+            done = await warm_repo(owner, repo, include_indexes)
+            _set_warmup_state(name, "done" if done else "skipped")
+        except Exception as e:
+            logger.warning("Warm-up of %s failed: %s", name, e)
+            _set_warmup_state(name, "failed")
+
+
+def enqueue_warmup(owner: str, repo: str, include_indexes: bool = False) -> bool:
+    """Queue a warm-up unless the repo is already queued or running, or the
+    queue already holds WARMUP_STATE_LIMIT repos."""
+    global _warmup_drainer
+    name = f"{owner}/{repo}"
+    if warmup_state(name) in _WARMUP_ACTIVE or len(_WARMUP_QUEUE) >= WARMUP_STATE_LIMIT:
+        return False
+    _set_warmup_state(name, "queued")
+    _WARMUP_QUEUE.append((owner, repo, include_indexes))
+    if _warmup_drainer is None or _warmup_drainer.done():
+        _warmup_drainer = _schedule_background(_drain_warmup_queue())
+    return True
+
+
+async def warm_user_repos(login: str):
+    """After login, warm the user's most recently pushed repositories."""
+    if WARMUP_ON_LOGIN_REPOS <= 0:
+        return
+    try:
+        r = await gh_get(
+            f"{GITHUB_API_URL}/{login}/repos?sort=pushed&per_page={WARMUP_ON_LOGIN_REPOS}"
+        )
+        if isinstance(r, JSONResponse):
+            return
+        for item in r.json()[:WARMUP_ON_LOGIN_REPOS]:
+            enqueue_warmup(login, item["name"], WARMUP_INDEXES)
+    except Exception as e:
+        logger.warning("Login warm-up for %s failed: %s", login, e)
+
+
+# ---------- REPLACE: the /api/chat endpoint with hybrid routing ----------
+@app.post("/api/chat", response_model=ChatResponse)
+async def chat(req: ChatRequest):
+    return await run_chat_pipeline(req)
+
+
+async def run_chat_pipeline(
+    req: ChatRequest, progress: Optional[Callable[[str, str], None]] = None
+) -> ChatResponse:
+    """Intent routing, context building and generation shared by /api/chat and
+    the Celery worker. ``progress(stage, partial_output)`` is called as the request
+    moves through fetching_context and generating.
+    """
+    msg = (req.message or "").strip()
+    if not msg:
+        return ChatResponse(reply="")
+
+    def report(stage: str, partial: str = ""):
+        if progress is not None:
+            progress(stage, partial)
+
+    async def generate(prompt: str) -> str:
+        report("generating")
+        if progress is None:
+            return await call_llm(prompt, req.model)
+        parts: list[str] = []
 
+        def on_chunk(piece: str):
+            parts.append(piece)
+            report("generating", "".join(parts))
+
+        def on_retry():
+            parts.clear()  # the failed attempt's text is not part of the answer
+            report("generating")
+
+        return await call_llm(prompt, req.model, on_chunk=on_chunk, on_retry=on_retry)
+
+    with span("detect_intent") as sp:
+        intent = detect_intent(msg)
+        if sp is not None:
+            sp["attrs"] = {"intent": intent}
+    report("fetching_context")
+
+    # 1) Structured intents -> registered handlers (deterministic answers)
+    try:
+        reply = await INTENTS.dispatch(intent, req, msg, generate)
+        if reply is not None:
+            return reply
     except HTTPException as e:
         if e.status_code == 429:
             return ChatResponse(
                 reply="[WARN] GitHub rate limit reached. Please try again later."
             )
         return ChatResponse(reply=f"[WARN] GitHub error: {e.detail}")
+    except DeadlineExceeded:
+        return ChatResponse(
+            reply="[WARN] Ran out of time fetching repository data. "
+            "Try again, or allow a longer deadline."
+        )
     except Exception as e:
         # Do not block; still try LLM with context
         pass
 
     # 2) Repo-related open questions -> LLM grounded with context
     if intent == "summarize_repo":
-        ctx = await build_repo_context(req.github_user, req.repo, include_readme=True)
+        try:
+            summaries = await get_cached_repo_summaries(req.github_user, req.repo)
+        except Exception:
+            summaries = None
+        if summaries:
+            dir_lines = "\n".join(
+                f"- {d}/: {text}" for d, text in summaries["directories"].items()
+            )
+            prompt = (
+                "You are a helpful software assistant. Answer the question using the "
+                "precomputed repository summaries below.\n\n"
+                f"User question:\n{msg}\n\n"
+                f"Repository summary:\n{summaries['repository']}\n\n"
+                + (f"Top-level directories:\n{dir_lines}\n\n" if dir_lines else "")
+                + "Answer clearly and concisely."
+            )
+            ans = await generate(prompt)
+            return ChatResponse(
+                reply=ans,
+                sources=[f"{d}/" for d in summaries["directories"]],
+                meta={"grounded": True, "summaries": summaries["tree_sha"]},
+            )
+        _schedule_background(
+            _build_repo_summaries_in_background(req.github_user, req.repo, req.model)
+        )
+
+        # Leave part of the budget for generation, whatever GitHub does.
+        with deadline(deadline_share(CONTEXT_DEADLINE_SHARE)):
+            ctx = await build_repo_context(
+                req.github_user, req.repo, include_readme=True
+            )
         ctx_block = format_context_block(ctx)
         prompt = (
             "You are a helpful software assistant. Use the provided repository context when relevant. "
@@ -1074,22 +4696,38 @@ async def chat(req: ChatRequest):
             f"Repository context:\n{ctx_block}\n\n"
             "Answer clearly and concisely."
         )
-        ans = await call_llm(prompt, req.model)
+        ans = await generate(prompt)
         return ChatResponse(reply=ans, sources=[], meta={"grounded": True})
 
     # 3) Anything else (general world questions, arbitrary chat) -> ChatGPT-like
     #    Still include repo context in case it helps, but do not force it.
-    ctx = await build_repo_context(req.github_user, req.repo, include_readme=False)
+    with deadline(deadline_share(CONTEXT_DEADLINE_SHARE)):
+        ctx = await build_repo_context(req.github_user, req.repo, include_readme=False)
+    try:
+        hits = await lexical_hits(req.github_user, req.repo, msg)
+    except Exception:
+        hits = []
     repo_signal = re.search(
         r"\b(repo|repository|project|file|folder|directory|codebase|this repo)\b",
         msg.lower(),
     )
-    if repo_signal and not (ctx.get("files") or ctx.get("dirs") or ctx.get("readme")):
+    if repo_signal and not (
+        ctx.get("files") or ctx.get("dirs") or ctx.get("readme") or hits
+    ):
         return ChatResponse(
             reply=f"I couldn't fetch repository context for {req.github_user}/{req.repo} right now, so I can't give a grounded answer yet.",
             meta={"grounded": False},
         )
     ctx_block = format_context_block(ctx)
+    if hits:
+        ctx_block += "\n\nFiles matching the question (lexical search):\n" + "\n".join(
+            (
+                f"- {h['path']}:{h['line']}: {h['snippet']}"
+                if "line" in h
+                else f"- {h['path']}"
+            )
+            for h in hits
+        )
     prompt = (
         "You are a helpful assistant. If the question is about the repository, you MUST use the repository context below. "
         "Do not give generic textbook answers when repository context exists. Mention concrete files/directories from context. "
@@ -1098,8 +4736,204 @@ async def chat(req: ChatRequest):
         f"Repository context (optional):\n{ctx_block}\n\n"
         "Answer:"
     )
-    ans = await call_llm(prompt, req.model)
-    return ChatResponse(reply=ans, sources=[], meta={"grounded": False})
+    ans = await generate(prompt)
+    return ChatResponse(
+        reply=ans,
+        sources=[h["path"] for h in hits],
+        meta={"grounded": bool(hits)},
+    )
+
+
+# ---------- Batch questions with bounded parallel generation ----------
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+BATCH_FETCH_CONCURRENCY = int(os.getenv("BATCH_FETCH_CONCURRENCY", "8"))
+# Each generation gets its own budget; the request deadline would otherwise cut
+# off every item still queued when it runs out.
+BATCH_ITEM_DEADLINE_SECONDS = float(os.getenv("BATCH_ITEM_DEADLINE_SECONDS", "60"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", "600"))
+_LLM_CACHE: dict[str, tuple[float, str]] = {}
+
+
+class BatchItem(BaseModel):
+    message: str
+    file: Optional[str] = None
+    file_content: Optional[str] = None
+
+
+class ChatBatchRequest(BaseModel):
+    repo: str
+    github_user: str
+    items: list[BatchItem]
+    model: Optional[str] = None
+    concurrency: Optional[int] = None
+
+
+async def fetch_file_text(owner: str, repo: str, path: str) -> tuple[str, bool]:
+    """File text from the GitHub contents API, returning (text, served_from_cache)."""
+    ck = f"file:{owner}/{repo}:{path}"
+    cached = cache_get(ck)
+    if cached is not None:
+        return cached, True
+    try:
+        r = await gh_get(
+            f"{GITHUB_API_BASE}/repos/{owner}/{repo}/contents/{quote(path)}"
+        )
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+            raise HTTPException(status_code=404, detail=f"File not found: {path}")
+        raise
+    if isinstance(r, JSONResponse):
+        raise HTTPException(
+            status_code=r.status_code, detail=json.loads(r.body)["reply"]
+        )
+    data = r.json()
+    if not isinstance(data, dict) or data.get("type") != "file":
+        raise HTTPException(status_code=400, detail=f"Not a file: {path}")
+    if data.get("encoding") != "base64":
+        # The contents API leaves out the body of files over 1 MB.
+        raise HTTPException(status_code=413, detail=f"File too large: {path}")
+    text = base64.b64decode(data.get("content") or "").decode("utf-8", "replace")
+    cache_set(ck, text)
+    return text, False
+
+
+async def cached_call_llm(prompt: str, model: Optional[str]) -> tuple[str, bool]:
+    """call_llm with a short-lived answer cache; error replies are not cached."""
+    ck = hashlib.sha256(f"{model or ''}\0{prompt}".encode("utf-8")).hexdigest()
+    hit = _LLM_CACHE.get(ck)
+    if hit and hit[0] > time.time():
+        return hit[1], True
+    answer = await call_llm(prompt, model)
+    if not _is_llm_error(answer):
+        _LLM_CACHE[ck] = (time.time() + LLM_CACHE_TTL_SECONDS, answer)
+    return answer, False
+
+
+def _batch_prompt(item: BatchItem, body: str, ctx_block: str) -> str:
+    if item.file:
+        max_chars = 12000
+        return (
+            "You are a helpful software assistant. Answer the question about the file "
+            "below, using the repository context where relevant.\n\n"
+            f"Repository context:\n{ctx_block}\n\n"
+            f"File: `{item.file}`\n\nCode:\n```\n{body[:max_chars]}\n```\n\n"
+            f"Question: {item.message}\n\nAnswer:"
+        )
+    return (
+        "You are a helpful software assistant. Use the repository context below.\n\n"
+        f"Repository context:\n{ctx_block}\n\n"
+        f"Question: {item.message}\n\nAnswer:"
+    )
+
+
+@app.post("/api/chat-batch")
+async def chat_batch(req: ChatBatchRequest):
+    """Answer many question/file pairs against one repository.
+
+    Repository context is fetched once; file fetches run at most
+    BATCH_FETCH_CONCURRENCY at a time and generations share the process-wide
+    OLLAMA_MAX_CONCURRENCY slots with all other chat traffic. Each generation has
+    BATCH_ITEM_DEADLINE_SECONDS; an answer cut short counts as a failure and is
+    not cached. Results stream back
+    as NDJSON lines in completion order, followed by a manifest line with cache
+    hits and failures.
+    """
+    if not req.items:
+        raise HTTPException(status_code=400, detail="No items supplied")
+    if len(req.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400, detail=f"At most {BATCH_MAX_ITEMS} items per batch"
+        )
+
+    ctx = await build_repo_context(req.github_user, req.repo, include_readme=True)
+    ctx_block = format_context_block(ctx)
+    limit = max(
+        1, min(req.concurrency or OLLAMA_MAX_CONCURRENCY, OLLAMA_MAX_CONCURRENCY)
+    )
+    # Generations also wait for the process-wide Ollama slots; this only narrows
+    # the batch further when the client asks for less.
+    sem = asyncio.Semaphore(limit)
+    fetch_sem = asyncio.Semaphore(max(1, BATCH_FETCH_CONCURRENCY))
+
+    async def run_item(index: int, item: BatchItem) -> dict:
+        start = time.perf_counter()
+        out = {"type": "result", "index": index, "message": item.message}
+        if item.file:
+            out["file"] = item.file
+        try:
+            body, file_cached = item.file_content or "", bool(item.file_content)
+            if item.file and not item.file_content:
+                async with fetch_sem:
+                    body, file_cached = await fetch_file_text(
+                        req.github_user, req.repo, item.file
+                    )
+            async with sem:
+                with deadline(BATCH_ITEM_DEADLINE_SECONDS):
+                    reply, llm_cached = await cached_call_llm(
+                        _batch_prompt(item, body, ctx_block), req.model
+                    )
+            if _is_llm_error(reply):
+                out["error"] = reply
+            else:
+                out["reply"] = reply
+            out["cached"] = llm_cached
+            out["file_cached"] = file_cached if item.file else None
+        except HTTPException as e:
+            out["error"] = str(e.detail)
+        except Exception as e:
+            out["error"] = repr(e)
+        out["elapsed_ms"] = int((time.perf_counter() - start) * 1000)
+        return out
+
+    async def stream():
+        started = time.perf_counter()
+        # Items run under their own budgets, not the request deadline.
+        context = contextvars.copy_context()
+        context.run(_CURRENT_DEADLINE.set, None)
+        tasks = [
+            asyncio.create_task(run_item(i, it), context=context.copy())
+            for i, it in enumerate(req.items)
+        ]
+        manifest = {
+            "type": "manifest",
+            "total": len(tasks),
+            "succeeded": 0,
+            "cache_hits": [],
+            "failures": [],
+            "concurrency": limit,
+        }
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                out = await next_done
+                if "error" in out:
+                    manifest["failures"].append(
+                        {"index": out["index"], "error": out["error"]}
+                    )
+                else:
+                    manifest["succeeded"] += 1
+                if out.get("cached"):
+                    manifest["cache_hits"].append(out["index"])
+                yield json.dumps(out) + "\n"
+            manifest["cache_hits"].sort()
+            manifest["elapsed_ms"] = int((time.perf_counter() - started) * 1000)
+            yield json.dumps(manifest) + "\n"
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@app.get("/ready")
+async def ready(response: Response):
+    """Readiness probe: 503 until storage initialization has finished."""
+    if not _STARTUP_STATE["ready"]:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {
+        "ready": _STARTUP_STATE["ready"],
+        "error": _STARTUP_STATE["error"],
+        "startup_seconds": _STARTUP_STATE["seconds"],
+    }
 
 
 @app.get("/health")
@@ -1107,7 +4941,7 @@ async def health():
     probs = []
     # Check GitHub
     try:
-        r = await gh_get("https://api.github.com/rate_limit")
+        r = await gh_get(f"{GITHUB_API_BASE}/rate_limit")
         if isinstance(r, JSONResponse):
             probs.append("github: rate limited")
     except Exception as e:
@@ -1122,6 +4956,105 @@ async def health():
     return {"ok": len(probs) == 0, "problems": probs}
 
 
+CELERY_QUEUE_DEPTH = METRICS.gauge(
+    "codescribe_celery_queue_depth",
+    "Messages waiting in the Celery broker queue (Redis brokers only).",
+    ("queue",),
+)
+
+
+async def _refresh_celery_queue_depth():
+    # Only deployments that configured a Redis broker have a queue to measure.
+    broker = os.getenv("CELERY_BROKER_URL", "")
+    if not broker.startswith(("redis://", "rediss://")) or _redis_module() is None:
+        return
+    try:
+        # Don't import Celery just for this; an unconfigured app uses "celery".
+        conf = _celery_app.conf if _celery_app is not None else None
+        queue = (conf and conf.task_default_queue) or "celery"
+        depth = await asyncio.wait_for(
+            _get_async_redis_client(broker).llen(queue), timeout=0.5
+        )
+        CELERY_QUEUE_DEPTH.set(depth, queue)
+    except Exception as e:
+        logger.debug("Celery queue depth unavailable: %s", e)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of the in-process metrics registry."""
+    await _refresh_celery_queue_depth()
+    return Response(
+        content=METRICS.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+def require_profile_admin(request: Request):
+    if not PROFILE_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if not _has_profile_token(request):
+        raise HTTPException(status_code=403, detail="Invalid profile token")
+
+
+@app.get("/debug/profiles", dependencies=[Depends(require_profile_admin)])
+async def list_profiles():
+    return [
+        {k: v for k, v in p.items() if k not in ("report", "pstats", "allocations")}
+        for p in reversed(_PROFILES.values())
+    ]
+
+
+@app.get("/debug/profiles/{profile_id}", dependencies=[Depends(require_profile_admin)])
+async def get_profile(profile_id: str):
+    """Text report (top functions by cumulative time) plus allocation hot spots."""
+    profile = _PROFILES.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return {k: v for k, v in profile.items() if k != "pstats"}
+
+
+@app.get(
+    "/debug/profiles/{profile_id}/pstats",
+    dependencies=[Depends(require_profile_admin)],
+)
+async def download_profile(profile_id: str):
+    """Raw cProfile data, loadable with pstats.Stats(path) or snakeviz."""
+    profile = _PROFILES.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(
+        content=profile["pstats"],
+        media_type="application/octet-stream",
+        headers={
+            "Content-Disposition": f'attachment; filename="profile-{profile_id}.prof"'
+        },
+    )
+
+
+@app.get("/debug/loop-blocks", dependencies=[Depends(require_profile_admin)])
+async def loop_blocks():
+    """Recent event-loop stalls with the stack that was running on the loop."""
+    return {
+        "threshold_ms": LOOP_BLOCK_THRESHOLD_SECONDS * 1000,
+        "max_lag_ms": round(_loop_monitor_state["max_lag"] * 1000, 1),
+        "blocks": list(reversed(_LOOP_BLOCK_REPORTS)),
+    }
+
+
+@app.get("/api/intent-stats")
+async def intent_stats():
+    return {"intents": INTENTS.stats()}
+
+
+@app.get("/api/cache-stats")
+async def cache_stats():
+    return {
+        "session_cache": session_cache_stats(),
+        "session_sweeper": session_sweep_stats(),
+        "circuits": {name: b.snapshot() for name, b in CIRCUITS.items()},
+    }
+
+
 @app.get("/api/ai-status")
 async def ai_status():
     models = await get_ollama_models()
@@ -1138,16 +5071,97 @@ async def ai_status():
 async def get_me(user=Depends(get_current_user)):
     async with httpx.AsyncClient() as client:
         r = await client.get(
-            "https://api.github.com/user",
+            f"{GITHUB_API_BASE}/user",
             headers={"Authorization": f"Bearer {user['access_token']}"},
         )
         r.raise_for_status()
         return r.json()
 
 
+# ---------- HTTP caching for read endpoints ----------
+# Strong ETags come from git object SHAs where the resource has one (tree SHA for
+# listings, blob SHA for file content) and from a digest of the payload otherwise.
+# Responses pinned to a full commit SHA via ?ref= never change, so they get a long
+# max-age; everything else revalidates after HTTP_CACHE_MAX_AGE seconds. With a
+# server GITHUB_TOKEN, responses may include private repos, so they are marked
+# private and never stored by shared caches.
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "60"))
+HTTP_CACHE_IMMUTABLE_MAX_AGE = 31536000
+_COMMIT_SHA_RE = re.compile(r"[0-9a-f]{40}")
+
+
+def git_blob_sha(content: bytes) -> str:
+    """The SHA git assigns to a blob with this content."""
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+
+def _payload_digest(payload) -> str:
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _http_date(iso: Optional[str]) -> Optional[str]:
+    if not iso:
+        return None
+    try:
+        dt = datetime.fromisoformat(iso.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return format_datetime(dt, usegmt=True)
+
+
+def _is_not_modified(request: Request, etag: str, last_modified: Optional[str]) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        if if_none_match.strip() == "*":
+            return True
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        return etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(
+                if_modified_since
+            )
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def cacheable_response(
+    request: Request,
+    content,
+    etag: str,
+    pinned: bool = False,
+    last_modified: Optional[str] = None,
+    media_type: Optional[str] = None,
+) -> Response:
+    """JSON (or media_type) response with validators; 304 when the client is current."""
+    visibility = "private" if GITHUB_TOKEN else "public"
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": (
+            f"{visibility}, max-age={HTTP_CACHE_IMMUTABLE_MAX_AGE}, immutable"
+            if pinned
+            else f"{visibility}, max-age={HTTP_CACHE_MAX_AGE}, must-revalidate"
+        ),
+    }
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+    if _is_not_modified(request, headers["ETag"], last_modified):
+        return Response(status_code=304, headers=headers)
+    if media_type is None:
+        return FastJSONResponse(content, headers=headers)
+    return Response(content=content, media_type=media_type, headers=headers)
+
+
+def _is_commit_sha(ref: Optional[str]) -> bool:
+    return bool(ref and _COMMIT_SHA_RE.fullmatch(ref))
+
+
 @app.get("/repos/{username}")
-async def get_github_repos(username: str):
-    async with httpx.AsyncClient() as client:
+async def get_github_repos(username: str, request: Request):
+    async with httpx.AsyncClient(transport=_capture_transport()) as client:
         response = await client.get(f"{GITHUB_API_URL}/{username}/repos")
 
         if response.status_code == 404:
@@ -1157,12 +5171,19 @@ async def get_github_repos(username: str):
                 status_code=response.status_code, detail="Error fetching repositories"
             )
 
-        return response.json()  # âœ… send everything back
+        repos = response.json()  # âœ… send everything back
+        pushed = [r.get("pushed_at") or "" for r in repos if isinstance(r, dict)]
+        return cacheable_response(
+            request,
+            repos,
+            _payload_digest(repos),
+            last_modified=_http_date(max(pushed, default="")),
+        )
 
 
 @app.get("/repos/{owner}/{repo}/languages")
-async def get_repo_languages(owner: str, repo: str):
-    url = f"https://api.github.com/repos/{owner}/{repo}/languages"
+async def get_repo_languages(owner: str, repo: str, request: Request):
+    url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/languages"
     try:
         r = await gh_get(url)
         if isinstance(r, JSONResponse):  # rate limited
@@ -1170,91 +5191,179 @@ async def get_repo_languages(owner: str, repo: str):
         data = r.json()
         total = sum(data.values())
         if total == 0:
-            return {"languages": {}, "percentages": {}}
-        percentages = {
-            lang: round((size / total) * 100, 2) for lang, size in data.items()
-        }
-        return {"languages": data, "percentages": percentages}
+            payload = {"languages": {}, "percentages": {}}
+        else:
+            percentages = {
+                lang: round((size / total) * 100, 2) for lang, size in data.items()
+            }
+            payload = {"languages": data, "percentages": percentages}
+        return cacheable_response(request, payload, _payload_digest(payload))
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch languages: {e}")
 
 
+def normalize_tree(tree: list[dict], path: str = "") -> list[dict]:
+    """Turn git tree entries into file listing rows relative to ``path``."""
+    base = (path or "").strip("/")
+    normalized = []
+    for item in tree:
+        item_path = (item.get("path") or "").strip("/")
+        if not item_path:
+            continue
+        if base and not (item_path == base or item_path.startswith(base + "/")):
+            continue
+        out_path = (
+            item_path[len(base) + 1 :]
+            if base and item_path.startswith(base + "/")
+            else item_path
+        )
+        if not out_path:
+            continue
+        if item.get("type") == "tree":
+            out_type = "dir"
+        elif item.get("type") == "blob":
+            out_type = "file"
+        else:
+            continue
+        normalized.append(
+            {
+                "type": out_type,
+                "path": out_path,
+                "size": item.get("size"),
+                "download_url": None,
+            }
+        )
+    return normalized
+
+
+def columnar_listing(rows: list[dict]) -> dict:
+    """Pack listing rows into parallel arrays with shared directory prefixes.
+
+    Row i lives at ``prefixes[prefix[i]] + "/" + name[i]`` (just ``name[i]`` for
+    the "" prefix), has type ``types[type[i]]`` and size ``size[i]``.
+    ``download_url`` is present only when some row has one. expand_columnar
+    turns the payload back into rows.
+    """
+    prefixes: dict[str, int] = {}
+    types: dict[str, int] = {}
+    prefix, name, kind, size, urls = [], [], [], [], []
+    for row in rows:
+        parent, _, base = (row.get("path") or "").rpartition("/")
+        prefix.append(prefixes.setdefault(parent, len(prefixes)))
+        name.append(base)
+        kind.append(types.setdefault(row.get("type"), len(types)))
+        size.append(row.get("size"))
+        urls.append(row.get("download_url"))
+    payload = {
+        "format": "columnar",
+        "prefixes": list(prefixes),
+        "types": list(types),
+        "prefix": prefix,
+        "name": name,
+        "type": kind,
+        "size": size,
+    }
+    if any(urls):
+        payload["download_url"] = urls
+    return payload
+
+
+def expand_columnar(payload: dict) -> list[dict]:
+    prefixes, types = payload["prefixes"], payload["types"]
+    urls = payload.get("download_url") or [None] * len(payload["name"])
+    return [
+        {
+            "type": types[t],
+            "path": f"{prefixes[p]}/{n}" if prefixes[p] else n,
+            "size": size,
+            "download_url": url,
+        }
+        for p, n, t, size, url in zip(
+            payload["prefix"], payload["name"], payload["type"], payload["size"], urls
+        )
+    ]
+
+
+def _listing_response(
+    request: Request,
+    rows: list[dict],
+    etag: str,
+    pinned: bool,
+    layout: str,
+    last_modified: Optional[str] = None,
+) -> Response:
+    if layout == "columnar":
+        return cacheable_response(
+            request, columnar_listing(rows), f"{etag}-columnar", pinned, last_modified
+        )
+    return cacheable_response(request, rows, etag, pinned, last_modified)
+
+
 @app.get("/repos/{owner}/{repo}/files")
 async def get_repo_files(
-    owner: str, repo: str, path: str = "", recursive: bool = False
+    owner: str,
+    repo: str,
+    request: Request,
+    path: str = "",
+    recursive: bool = False,
+    ref: Optional[str] = None,
+    format: Literal["rows", "columnar"] = "rows",
 ):
     """
     Fetch the file/directory structure of a repository.
-    By default, lists the root. You can pass ?path=subdir to drill deeper.
+    By default, lists the root. You can pass ?path=subdir to drill deeper,
+    ?ref=<branch, tag or commit SHA> to read another revision, and
+    ?format=columnar for the compact layout of columnar_listing (worth it for
+    large recursive trees).
     """
+    pinned = _is_commit_sha(ref)
     if recursive:
         try:
-            default_branch = await get_repo_default_branch(owner, repo)
+            tree_ref = ref or await get_repo_default_branch(owner, repo)
             r = await gh_get(
-                f"https://api.github.com/repos/{owner}/{repo}/git/trees/{default_branch}?recursive=1"
+                f"{GITHUB_API_BASE}/repos/{owner}/{repo}/git/trees/{tree_ref}?recursive=1"
             )
             if isinstance(r, JSONResponse):
                 raise HTTPException(status_code=429, detail="GitHub rate limit reached")
             payload = r.json()
             tree = payload.get("tree", [])
 
-            base = (path or "").strip("/")
-            normalized = []
-            for item in tree:
-                item_path = (item.get("path") or "").strip("/")
-                if not item_path:
-                    continue
-                if base and not (item_path == base or item_path.startswith(base + "/")):
-                    continue
-                out_path = (
-                    item_path[len(base) + 1 :]
-                    if base and item_path.startswith(base + "/")
-                    else item_path
-                )
-                if not out_path:
-                    continue
-                if item.get("type") == "tree":
-                    out_type = "dir"
-                elif item.get("type") == "blob":
-                    out_type = "file"
-                else:
-                    continue
-                normalized.append(
-                    {
-                        "type": out_type,
-                        "path": out_path,
-                        "size": item.get("size"),
-                        "download_url": None,
-                    }
-                )
-            return normalized
+            normalized = normalize_tree(tree, path)
+            etag = payload.get("sha") or _payload_digest(normalized)
+            return _listing_response(request, normalized, etag, pinned, format)
         except HTTPException:
             raise
         except Exception:
             # Graceful fallback to root listing if recursive tree API fails.
             pass
 
-    url = f"https://api.github.com/repos/{owner}/{repo}/contents/{path}"
+    url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/contents/{path}"
+    params = {"ref": ref} if ref else None
     headers = {"Accept": "application/vnd.github.v3+json"}
     if GITHUB_TOKEN:
         headers["Authorization"] = f"token {GITHUB_TOKEN}"
 
     try:
-        async with httpx.AsyncClient(timeout=httpx.Timeout(15.0)) as client:
-            r = await client.get(url, headers=headers)
+        async with httpx.AsyncClient(
+            timeout=httpx.Timeout(deadline_timeout(15.0, "github")),
+            transport=_capture_transport(),
+        ) as client:
+            r = await client.get(url, headers=headers, params=params)
             # Retry unauthenticated when token is bad.
             if r.status_code == 401 and GITHUB_TOKEN:
                 r = await client.get(
-                    url, headers={"Accept": "application/vnd.github.v3+json"}
+                    url,
+                    headers={"Accept": "application/vnd.github.v3+json"},
+                    params=params,
                 )
 
         if r.status_code == 403 and r.headers.get("X-RateLimit-Remaining") == "0":
             raise HTTPException(status_code=429, detail="GitHub rate limit reached")
         if r.status_code == 409:
             # Empty repository on GitHub
-            return []
+            return columnar_listing([]) if format == "columnar" else []
         if r.status_code == 404:
             raise HTTPException(status_code=404, detail="Repository or path not found")
         if r.status_code >= 400:
@@ -1269,6 +5378,7 @@ async def get_repo_files(
             )
 
         data = r.json()
+        items = data if isinstance(data, list) else [data]
         tree = [
             {
                 "type": item.get("type"),
@@ -1276,15 +5386,78 @@ async def get_repo_files(
                 "size": item.get("size"),
                 "download_url": item.get("download_url"),
             }
-            for item in (data if isinstance(data, list) else [data])
+            for item in items
         ]
-        return tree
-    except HTTPException:
+        # A listing changes exactly when one of its entries' object SHAs does.
+        etag = hashlib.sha1(
+            "\n".join(f"{item.get('sha')} {item.get('path')}" for item in items).encode(
+                "utf-8"
+            )
+        ).hexdigest()
+        return _listing_response(
+            request, tree, etag, pinned, format, r.headers.get("Last-Modified")
+        )
+    except (HTTPException, DeadlineExceeded):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch repo files: {e}")
 
 
+@app.get("/repos/{owner}/{repo}/search")
+async def search_repo(owner: str, repo: str, q: str, limit: int = 10):
+    """BM25 search over file paths and contents of the default branch.
+
+    The first call for a new commit downloads the repository and builds the index;
+    later calls are answered from memory or the on-disk index.
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Query must not be empty")
+    try:
+        index = await get_search_index(owner, repo, build=True)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Failed to build index: {e}")
+
+    start = time.perf_counter()
+    results = index.search(q, limit=max(1, min(limit, 100)))
+    took_ms = round((time.perf_counter() - start) * 1000, 3)
+    return {
+        "query": q,
+        "results": attach_snippets(owner, repo, index, results),
+        "documents": len(index.paths),
+        "took_ms": took_ms,
+    }
+
+
+@app.post("/repos/{owner}/{repo}/summaries", status_code=status.HTTP_202_ACCEPTED)
+async def start_repo_summaries(owner: str, repo: str, model: Optional[str] = None):
+    """Start (or join) the background summary pipeline for the default branch."""
+    _schedule_background(_build_repo_summaries_in_background(owner, repo, model))
+    return {"job": _SUMMARY_JOBS.get(f"{owner}/{repo}", {"state": "queued"})}
+
+
+@app.get("/repos/{owner}/{repo}/summaries")
+async def get_repo_summaries(owner: str, repo: str):
+    try:
+        summaries = await get_cached_repo_summaries(owner, repo)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Failed to read summaries: {e}")
+    return {
+        "summaries": summaries,
+        "job": _SUMMARY_JOBS.get(f"{owner}/{repo}"),
+    }
+
+
+@app.post("/repos/{owner}/{repo}/warmup", status_code=status.HTTP_202_ACCEPTED)
+async def warmup_repo(owner: str, repo: str, indexes: Optional[bool] = None):
+    """Prefetch repository metadata (and optionally indexes) at low priority."""
+    queued = enqueue_warmup(owner, repo, WARMUP_INDEXES if indexes is None else indexes)
+    return {"queued": queued, "state": warmup_state(f"{owner}/{repo}")}
+
+
 @app.post("/logout")
 async def logout(request: Request, user=Depends(get_current_user)):
     session_id = None
@@ -1296,7 +5469,7 @@ async def logout(request: Request, user=Depends(get_current_user)):
         pass
 
     if session_id:
-        session_store_delete(session_id)
+        await asession_store_delete(session_id)
 
     # Clear cookie
     response = JSONResponse({"message": "Logged out"})
@@ -1305,9 +5478,12 @@ async def logout(request: Request, user=Depends(get_current_user)):
 
 
 @app.get("/repos/{owner}/{repo}/file-content")
-async def get_file_content(owner: str, repo: str, path: str):
+async def get_file_content(
+    owner: str, repo: str, path: str, request: Request, ref: Optional[str] = None
+):
     """Fetches the raw content of a specific file from a GitHub repository."""
-    url = f"https://api.github.com/repos/{owner}/{repo}/contents/{path}"
+    url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/contents/{path}"
+    params = {"ref": ref} if ref else None
     headers = {"Accept": "application/vnd.github.v3.raw"}
 
     # Add your GitHub token for authentication and higher rate limits
@@ -1315,12 +5491,17 @@ async def get_file_content(owner: str, repo: str, path: str):
         headers["Authorization"] = f"token {GITHUB_TOKEN}"
 
     try:
-        async with httpx.AsyncClient(timeout=httpx.Timeout(20.0)) as client:
-            res = await client.get(url, headers=headers)
+        async with httpx.AsyncClient(
+            timeout=httpx.Timeout(deadline_timeout(20.0, "github")),
+            transport=_capture_transport(),
+        ) as client:
+            res = await client.get(url, headers=headers, params=params)
             # Retry without auth if token is invalid/revoked; works for public repos.
             if res.status_code == 401 and GITHUB_TOKEN:
                 res = await client.get(
-                    url, headers={"Accept": "application/vnd.github.v3.raw"}
+                    url,
+                    headers={"Accept": "application/vnd.github.v3.raw"},
+                    params=params,
                 )
 
         if res.status_code == 404:
@@ -1338,16 +5519,23 @@ async def get_file_content(owner: str, repo: str, path: str):
                 detail=detail or "Failed to fetch file content.",
             )
 
-        return Response(content=res.text, media_type="text/plain")
+        return cacheable_response(
+            request,
+            res.text,
+            git_blob_sha(res.content),
+            _is_commit_sha(ref),
+            res.headers.get("Last-Modified"),
+            media_type="text/plain",
+        )
     except httpx.HTTPStatusError as e:
-        print(f"Error fetching file content: {e}")
+        logger.warning("Error fetching file content: %s", e)
         raise HTTPException(
             status_code=e.response.status_code,
             detail="File not found or access denied.",
         )
     except httpx.RequestError as e:
         # Handle other httpx request errors (e.g., network issues)
-        print(f"Error fetching file content: {e}")
+        logger.warning("Error fetching file content: %s", e)
         raise HTTPException(status_code=500, detail="Failed to connect to GitHub API.")
 
 
@@ -1360,71 +5548,424 @@ class ChatQuery(BaseModel):
     file: Optional[str] = None
     file_content: Optional[str] = None
     model: Optional[str] = None
+    idempotency_key: Optional[str] = None
+
+
+# Identical submissions (same normalised request against the same commit) map to
+# one task for this long; retries and double-clicks get the existing task ID.
+CHAT_ASYNC_REUSE_SECONDS = int(os.getenv("CHAT_ASYNC_REUSE_SECONDS", "600"))
+IDEMPOTENCY_HEADER_NAME = "idempotency-key"
+# key -> (expires, task ID, request fingerprint); used when Redis is unavailable.
+_IDEMPOTENCY_KEYS: dict[str, tuple[float, str, str]] = {}
+_IDEMPOTENCY_LOCK = threading.Lock()
+_task_redis_client = None
+
+
+def _get_task_redis_client():
+    """Redis client for task bookkeeping, or None when the result backend isn't Redis."""
+    global _task_redis_client
+    if _task_redis_client is not None:
+        return _task_redis_client
+    backend = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
+    if not backend.startswith(("redis://", "rediss://")):
+        return None
+    redis = _redis_module()
+    if redis is None:
+        return None
+    _task_redis_client = redis.from_url(backend, decode_responses=True)
+    return _task_redis_client
+
+
+async def _session_login(request: Request) -> str:
+    """GitHub login of the caller's session, or "" when not signed in."""
+    cookie = request.cookies.get("session_id")
+    if not cookie:
+        return ""
+    try:
+        session = await asession_store_get(serializer.loads(cookie)["session_id"])
+    except Exception:
+        return ""
+    if not session or session["expires"] < time.time():
+        return ""
+    return session.get("user") or ""
+
+
+def _chat_query_digest(query: ChatQuery, commit: str = "") -> str:
+    normalized = {
+        "message": " ".join(query.message.split()),
+        "repo": query.repo.lower(),
+        "github_user": query.github_user.lower(),
+        "file": query.file or "",
+        "file_content": hashlib.sha256(
+            (query.file_content or "").encode("utf-8")
+        ).hexdigest(),
+        "model": query.model or "",
+        "commit": commit,
+    }
+    return hashlib.sha256(
+        json.dumps(normalized, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+async def chat_idempotency_key(
+    query: ChatQuery, supplied: Optional[str], login: str = ""
+) -> tuple[str, str]:
+    """Return (key, fingerprint of the request body) for an async chat submission.
+
+    A client-supplied key is scoped to the signed-in user and the target repo, so
+    two callers picking the same key never share a task.
+    """
+    fingerprint = _chat_query_digest(query)
+    if supplied:
+        scope = json.dumps(
+            [login.lower(), query.github_user.lower(), query.repo.lower(), supplied]
+        )
+        digest = hashlib.sha256(scope.encode("utf-8")).hexdigest()
+        return f"chat-async:client:{digest}", fingerprint
+    try:
+        commit = await get_repo_head_sha(query.github_user, query.repo)
+    except Exception:
+        commit = ""
+    return f"chat-async:{_chat_query_digest(query, commit)}", fingerprint
+
+
+def claim_idempotency_key(
+    key: str, task_id: str, fingerprint: str = "", replace: bool = False
+) -> tuple[str, str] | None:
+    """Bind ``key`` to ``task_id`` unless already bound.
+
+    Returns the existing (task ID, request fingerprint) when the key is taken.
+    Blocking: call it from a worker thread.
+    """
+    value = f"{task_id}|{fingerprint}"
+    client = _get_task_redis_client()
+    if client is not None:
+        try:
+            if client.set(key, value, nx=not replace, ex=CHAT_ASYNC_REUSE_SECONDS):
+                return None
+            existing = client.get(key)
+            if existing is not None:
+                task, _, stored = existing.partition("|")
+                return task, stored
+            return None
+        except Exception as e:
+            logger.warning("Idempotency store unavailable, using local map: %s", e)
+
+    now = time.time()
+    with _IDEMPOTENCY_LOCK:
+        hit = _IDEMPOTENCY_KEYS.get(key)
+        if hit and hit[0] > now and not replace:
+            return hit[1], hit[2]
+        _IDEMPOTENCY_KEYS[key] = (now + CHAT_ASYNC_REUSE_SECONDS, task_id, fingerprint)
+        for k in [k for k, hit in _IDEMPOTENCY_KEYS.items() if hit[0] <= now]:
+            _IDEMPOTENCY_KEYS.pop(k, None)
+    return None
+
+
+def release_idempotency_key(key: str, task_id: str):
+    client = _get_task_redis_client()
+    if client is not None:
+        try:
+            if (client.get(key) or "").partition("|")[0] == task_id:
+                client.delete(key)
+            return
+        except Exception:
+            pass
+    with _IDEMPOTENCY_LOCK:
+        if _IDEMPOTENCY_KEYS.get(key, (0, None, ""))[1] == task_id:
+            _IDEMPOTENCY_KEYS.pop(key, None)
+
+
+def _task_state(task_id: str) -> str:
+    return get_celery_app().AsyncResult(task_id).state
 
 
 @app.post("/api/chat-async", status_code=status.HTTP_202_ACCEPTED)
-async def chat_async(query: ChatQuery):
+async def chat_async(query: ChatQuery, request: Request):
     # This is the endpoint that the frontend calls
-    print(f"Received query: '{query.message}' for repo: {query.repo}")
+    logger.info("Received async query for repo %s/%s", query.github_user, query.repo)
+
+    key, fingerprint = await chat_idempotency_key(
+        query,
+        request.headers.get(IDEMPOTENCY_HEADER_NAME) or query.idempotency_key,
+        await _session_login(request),
+    )
+    task_id = str(uuid4())
+    # Redis and the Celery result backend are blocking clients: keep them off the loop.
+    existing = await asyncio.to_thread(claim_idempotency_key, key, task_id, fingerprint)
+    if existing:
+        existing_id, existing_fingerprint = existing
+        if existing_fingerprint and existing_fingerprint != fingerprint:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used for a different request",
+            )
+        state = await asyncio.to_thread(_task_state, existing_id)
+        if state not in ("FAILURE", "REVOKED"):
+            return {"task_id": existing_id, "deduplicated": True}
+        # The earlier attempt failed; let this submission run again.
+        await asyncio.to_thread(claim_idempotency_key, key, task_id, fingerprint, True)
 
     try:
-        task = process_chat_query.delay(
-            query.message, query.repo, query.github_user, query.file, query.file_content
+        get_chat_task().apply_async(
+            args=[
+                query.message,
+                query.repo,
+                query.github_user,
+                query.file,
+                query.file_content,
+                query.model,
+            ],
+            task_id=task_id,
         )
-        return {"task_id": task.id}
+        return {"task_id": task_id, "deduplicated": False}
     except Exception as e:
+        await asyncio.to_thread(release_idempotency_key, key, task_id)
         raise HTTPException(status_code=503, detail=f"Async worker unavailable: {e}")
 
 
 # --- Celery Configuration ---
-# Celery instance that will be used to run tasks
-celery_app = Celery(
-    "tasks",
-    broker=os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0"),
-    backend=os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0"),
-)
+# The Celery app (and the celery package) is created on first use: web workers
+# only need it to submit or look up tasks. ``celery -A main:celery_app`` and
+# ``main.celery_app`` / ``main.process_chat_query`` resolve through the module
+# __getattr__ below.
+_celery_app = None
+
+
+def get_celery_app():
+    global _celery_app, celery_app, process_chat_query
+    if _celery_app is None:
+        from celery import Celery
+        from celery.signals import worker_process_shutdown
+
+        app_ = Celery(
+            "tasks",
+            broker=os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0"),
+            backend=os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0"),
+        )
+        worker_process_shutdown.connect(_close_worker_loop)
+        process_chat_query = app_.task(name="process_chat_query", bind=True)(
+            _process_chat_query
+        )
+        celery_app = _celery_app = app_
+    return _celery_app
+
+
+def get_chat_task():
+    """The registered process_chat_query task."""
+    get_celery_app()
+    return process_chat_query
+
+
+def __getattr__(name: str):
+    if name in ("celery_app", "process_chat_query"):
+        get_celery_app()
+        return globals()[name]
+    if name == "redis":
+        return _redis_module()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # --- Celery Task Definition ---
 # This is the function that the Celery worker will run in the background.
-@celery_app.task(name="process_chat_query")
-def process_chat_query(message, repo, github_user, file, file_content):
-    """
-    Simulates a long-running RAG process.
-    """
-    print(f"Starting to process query: '{message}' in the background...")
-    # Simulate a long-running task, like a RAG process
-    time.sleep(30)
-    print("Finished processing.")
+# Each worker process keeps one event loop alive across tasks so the pooled
+# HTTP client (and its keep-alive connections) is reused instead of rebuilt.
+TASK_PROGRESS_INTERVAL_SECONDS = 0.5
+_worker_loop: asyncio.AbstractEventLoop | None = None
 
-    # In a real implementation, you would:
-    # 1. Use the RAG pipeline to get a response and source docs.
-    # 2. Return the result.
 
-    # Mocking a response for now
-    reply = f"Thank you for asking about `{message}`. I've processed your query for the repository `{repo}`. The answer will be available soon."
+def run_in_worker_loop(coro):
+    global _worker_loop
+    if _worker_loop is None or _worker_loop.is_closed():
+        _worker_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_worker_loop)
+    return _worker_loop.run_until_complete(coro)
 
-    # Simulate source docs
-    sources = [{"file_path": file, "line_numbers": "1-10"}] if file else []
 
-    return {"reply": reply, "sources": sources}
+def _close_worker_loop(**kwargs):
+    if _worker_loop is not None and not _worker_loop.is_closed():
+        _worker_loop.run_until_complete(close_http_client())
+        _worker_loop.close()
 
 
-# --- Polling Endpoint ---
-# This endpoint allows the frontend to check on the status of a Celery task.
-@app.get("/tasks/{task_id}/status")
-async def get_task_status(task_id: str):
-    task_result = celery_app.AsyncResult(task_id)
+TASK_EVENT_INTERVAL_SECONDS = 0.1
+TASK_EVENTS_MAX_SECONDS = int(os.getenv("TASK_EVENTS_MAX_SECONDS", "600"))
+TASK_EVENTS_HEARTBEAT_SECONDS = 15
+TASK_TERMINAL_STATES = ("SUCCESS", "FAILURE", "REVOKED")
+
+
+def _task_events_channel(task_id: str) -> str:
+    return f"task-events:{task_id}"
+
+
+def publish_task_event(task_id: str, payload: dict):
+    """Push a status payload to SSE subscribers (best effort)."""
+    client = _get_task_redis_client()
+    if client is None:
+        return
+    try:
+        client.publish(_task_events_channel(task_id), json.dumps(payload))
+    except Exception as e:
+        logger.debug("Could not publish task event for %s: %s", task_id, e)
+
+
+def _process_chat_query(
+    self, message, repo, github_user, file=None, file_content=None, model=None
+):
+    """
+    Runs the same pipeline as /api/chat, reporting PROGRESS states with the
+    current stage (fetching_context, generating) and any partial output.
+    """
+    task_id = self.request.id
+    last_stored = last_published = 0.0
+
+    def progress(stage: str, partial: str = ""):
+        nonlocal last_stored, last_published
+        if not task_id:
+            return  # executed eagerly, nobody to report to
+        now = time.monotonic()
+        payload = {"status": "PROGRESS", "stage": stage, "partial": partial}
+        # Streaming tokens arrive fast; pub/sub gets frequent updates while the
+        # result backend (read by polling clients) is written less often.
+        if not partial or now - last_published >= TASK_EVENT_INTERVAL_SECONDS:
+            last_published = now
+            publish_task_event(task_id, payload)
+        if not partial or now - last_stored >= TASK_PROGRESS_INTERVAL_SECONDS:
+            last_stored = now
+            self.update_state(
+                state="PROGRESS", meta={"stage": stage, "partial": partial}
+            )
+
+    req = ChatRequest(
+        message=message,
+        repo=repo,
+        github_user=github_user,
+        file=file,
+        file_content=file_content,
+        model=model,
+    )
+    try:
+        result = run_in_worker_loop(run_chat_pipeline(req, progress))
+    except Exception as e:
+        if task_id:
+            publish_task_event(task_id, {"status": "FAILURE", "error": str(e)})
+        raise
+    output = {**result.model_dump(), "stage": "done"}
+    if task_id:
+        publish_task_event(task_id, {"status": "SUCCESS", "result": output})
+    return output
+
+
+def _task_status_payload(task_result) -> dict:
     if task_result.state == "PENDING":
         return {"status": "PENDING"}
     elif task_result.state == "FAILURE":
         return {"status": "FAILURE", "error": str(task_result.info)}
     elif task_result.state == "SUCCESS":
         return {"status": "SUCCESS", "result": task_result.result}
+    elif task_result.state == "PROGRESS":
+        info = task_result.info if isinstance(task_result.info, dict) else {}
+        return {
+            "status": "PROGRESS",
+            "stage": info.get("stage"),
+            "partial": info.get("partial", ""),
+        }
     else:
         return {"status": task_result.state}
 
 
+# --- Polling Endpoint ---
+# This endpoint allows the frontend to check on the status of a Celery task.
+def _read_task_status(task_id: str) -> dict:
+    return _task_status_payload(get_celery_app().AsyncResult(task_id))
+
+
+async def read_task_status(task_id: str) -> dict:
+    # AsyncResult reads the result backend with a blocking client.
+    return await asyncio.to_thread(_read_task_status, task_id)
+
+
+@app.get("/tasks/{task_id}/status")
+async def get_task_status(task_id: str):
+    return await read_task_status(task_id)
+
+
+def _sse(payload: dict) -> str:
+    event = {"SUCCESS": "done", "FAILURE": "error"}.get(payload["status"], "progress")
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+async def _task_events_from_pubsub(task_id: str, pubsub):
+    """Yield task payloads pushed by the worker until a terminal state arrives."""
+    await pubsub.subscribe(_task_events_channel(task_id))
+    # Subscribe before reading the stored state so no transition is missed.
+    current = await read_task_status(task_id)
+    yield current
+    if current["status"] in TASK_TERMINAL_STATES:
+        return
+    deadline = time.monotonic() + TASK_EVENTS_MAX_SECONDS
+    while time.monotonic() < deadline:
+        message = await pubsub.get_message(
+            ignore_subscribe_messages=True, timeout=TASK_EVENTS_HEARTBEAT_SECONDS
+        )
+        if message is None:
+            yield None  # heartbeat
+            continue
+        payload = json.loads(message["data"])
+        yield payload
+        if payload["status"] in TASK_TERMINAL_STATES:
+            return
+
+
+async def _task_events_from_polling(task_id: str):
+    """Fallback when pub/sub is unavailable: poll the result backend server-side."""
+    deadline = time.monotonic() + TASK_EVENTS_MAX_SECONDS
+    last = None
+    while time.monotonic() < deadline:
+        current = await read_task_status(task_id)
+        if current != last:
+            yield current
+            last = current
+        if current["status"] in TASK_TERMINAL_STATES:
+            return
+        await asyncio.sleep(1.0)
+
+
+@app.get("/tasks/{task_id}/events")
+async def stream_task_events(task_id: str):
+    """Server-Sent Events stream of task state changes and partial output.
+
+    Emits ``progress`` events while the task runs and a final ``done`` or
+    ``error`` event, replacing client-side polling of /tasks/{task_id}/status.
+    """
+    backend = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
+
+    async def stream():
+        redis = (
+            _redis_module() if backend.startswith(("redis://", "rediss://")) else None
+        )
+        if redis is not None:
+            # The pub/sub connection is borrowed from the shared pool and returned
+            # when the stream ends.
+            pubsub = _get_async_redis_client(backend).pubsub()
+            try:
+                async for payload in _task_events_from_pubsub(task_id, pubsub):
+                    yield ": keep-alive\n\n" if payload is None else _sse(payload)
+                return
+            except redis.RedisError as e:
+                logger.warning("Task event pub/sub unavailable: %s", e)
+            finally:
+                await pubsub.aclose()
+        async for payload in _task_events_from_polling(task_id):
+            yield _sse(payload)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # --- Git Integration (OAuth and Repositories) ---
 # The blueprint mentions using python-gitlab for GitLab integration[cite: 63, 64].
 # A similar library, PyGithub, is recommended for GitHub integration[cite: 87].
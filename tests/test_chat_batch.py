@@ -0,0 +1,187 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import httpx
+from fastapi.testclient import TestClient
+
+import main
+
+
+class ChatBatchTests(unittest.TestCase):
+    def setUp(self):
+        main._LLM_CACHE.clear()
+        self.active = 0
+        self.peak = 0
+
+        async def fake_llm(prompt, model=None):
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            await asyncio.sleep(0.01)
+            self.active -= 1
+            if "broken.py" in prompt:
+                return "AI generation failed after model fallbacks: boom"
+            return "answer"
+
+        self.context = AsyncMock(return_value={"files": ["main.py"]})
+        self._patchers = [
+            patch("main.build_repo_context", self.context),
+            patch("main.call_llm", side_effect=fake_llm),
+            patch("main.fetch_file_text", AsyncMock(return_value=("print(1)", False))),
+        ]
+        for p in self._patchers:
+            p.start()
+        self.client = TestClient(main.app)
+
+    def tearDown(self):
+        self.client.close()
+        for p in self._patchers:
+            p.stop()
+
+    def _post(self, items, **extra):
+        res = self.client.post(
+            "/api/chat-batch",
+            json={"repo": "r", "github_user": "o", "items": items, **extra},
+        )
+        self.assertEqual(res.status_code, 200)
+        return [json.loads(line) for line in res.text.splitlines() if line]
+
+    def test_streams_results_and_manifest(self):
+        items = [{"message": "explain", "file": f"src/m{i}.py"} for i in range(5)]
+        items.append({"message": "explain", "file": "broken.py"})
+        lines = self._post(items, concurrency=50)
+        results, manifest = lines[:-1], lines[-1]
+        self.assertEqual(len(results), 6)
+        self.assertEqual(manifest["type"], "manifest")
+        self.assertEqual(manifest["succeeded"], 5)
+        self.assertEqual([f["index"] for f in manifest["failures"]], [5])
+        self.assertLessEqual(self.peak, main.OLLAMA_MAX_CONCURRENCY)
+        self.context.assert_awaited_once()
+
+    def test_repeated_items_hit_the_answer_cache(self):
+        items = [{"message": "explain", "file": "a.py"}]
+        self._post(items)
+        manifest = self._post(items)[-1]
+        self.assertEqual(manifest["cache_hits"], [0])
+
+    def test_rejects_empty_batch(self):
+        res = self.client.post(
+            "/api/chat-batch", json={"repo": "r", "github_user": "o", "items": []}
+        )
+        self.assertEqual(res.status_code, 400)
+
+
+class BatchDeadlineTests(unittest.TestCase):
+    """Batch generations against a streaming Ollama stand-in."""
+
+    def setUp(self):
+        main._LLM_CACHE.clear()
+
+        async def body():
+            yield b'{"response": "Partial answer"}\n'
+            await asyncio.sleep(0.4)
+            yield b'{"response": " finished"}\n'
+            yield b'{"done": true}\n'
+
+        self.ollama = httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda r: httpx.Response(200, content=body()))
+        )
+        self._patchers = [
+            patch("main.build_repo_context", AsyncMock(return_value={})),
+            patch("main.get_ollama_models", AsyncMock(return_value=[])),
+            patch("main.get_http_client", return_value=self.ollama),
+            patch.dict(main.CIRCUITS, {"ollama": main.CircuitBreaker("test")}),
+        ]
+        for p in self._patchers:
+            p.start()
+        self.client = TestClient(main.app)
+
+    def tearDown(self):
+        self.client.close()
+        for p in self._patchers:
+            p.stop()
+        asyncio.run(self.ollama.aclose())
+        main._LLM_CACHE.clear()
+
+    def _post(self, n):
+        items = [{"message": f"q{i}"} for i in range(n)]
+        res = self.client.post(
+            "/api/chat-batch", json={"repo": "r", "github_user": "o", "items": items}
+        )
+        return [json.loads(line) for line in res.text.splitlines() if line]
+
+    def test_items_are_not_bound_by_the_request_deadline(self):
+        with (
+            patch("main.REQUEST_DEADLINE_SECONDS", 0.2),
+            patch("main.BATCH_ITEM_DEADLINE_SECONDS", 5.0),
+        ):
+            *results, manifest = self._post(2)
+        self.assertEqual(manifest["succeeded"], 2)
+        self.assertEqual(manifest["failures"], [])
+        self.assertEqual([r["reply"] for r in results], ["Partial answer finished"] * 2)
+
+    def test_answers_cut_short_are_failures_and_not_cached(self):
+        with patch("main.BATCH_ITEM_DEADLINE_SECONDS", 0.2):
+            *results, manifest = self._post(3)
+        self.assertEqual(manifest["succeeded"], 0)
+        self.assertEqual(len(manifest["failures"]), 3)
+        for out in results:
+            self.assertIn("Partial answer", out["error"])
+            self.assertTrue(out["error"].endswith(main.LLM_CUT_SHORT_NOTE))
+        self.assertEqual(main._LLM_CACHE, {})
+
+
+class OllamaSlotTests(unittest.TestCase):
+    def test_generations_share_one_process_wide_limit(self):
+        active = peak = 0
+
+        async def handler(request):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.02)
+            active -= 1
+            return httpx.Response(200, json={"response": "ok"})
+
+        async def go():
+            async with httpx.AsyncClient(
+                transport=httpx.MockTransport(handler)
+            ) as client:
+                with patch("main.get_http_client", return_value=client):
+                    # e.g. two batches plus plain chat requests at once
+                    await asyncio.gather(
+                        *(main._ollama_generate("m", f"q{i}") for i in range(6))
+                    )
+
+        with patch("main.OLLAMA_MAX_CONCURRENCY", 2):
+            asyncio.run(go())
+        self.assertEqual(peak, 2)
+
+
+class FetchFileTextTests(unittest.TestCase):
+    def test_goes_through_gh_get_with_quoted_path(self):
+        body = {"type": "file", "encoding": "base64", "content": "cHJpbnQoMSk=\n"}
+        response = httpx.Response(200, json=body)
+        with (
+            patch("main.cache_get", return_value=None),
+            patch("main.cache_set"),
+            patch("main.gh_get", AsyncMock(return_value=response)) as gh_get,
+        ):
+            text, cached = asyncio.run(main.fetch_file_text("o", "r", "a b/#1.py"))
+        self.assertEqual((text, cached), ("print(1)", False))
+        self.assertTrue(gh_get.await_args.args[0].endswith("/contents/a%20b/%231.py"))
+
+    def test_open_breaker_is_reported_not_bypassed(self):
+        refused = main.JSONResponse({"reply": "unavailable"}, status_code=503)
+        with (
+            patch("main.cache_get", return_value=None),
+            patch("main.gh_get", AsyncMock(return_value=refused)),
+        ):
+            with self.assertRaises(main.HTTPException) as raised:
+                asyncio.run(main.fetch_file_text("o", "r", "a.py"))
+        self.assertEqual(raised.exception.status_code, 503)
+
+
+if __name__ == "__main__":
+    unittest.main()
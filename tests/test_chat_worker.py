@@ -0,0 +1,215 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+from fastapi.testclient import TestClient
+
+import main
+
+
+async def _fake_llm(prompt, model=None, on_chunk=None, on_retry=None):
+    for piece in ("Hello", " world"):
+        if on_chunk:
+            on_chunk(piece)
+    return f"Hello world ({model})"
+
+
+class ChatWorkerTests(unittest.TestCase):
+    def setUp(self):
+        self._patchers = [
+            patch("main.build_repo_context", AsyncMock(return_value={"files": ["a"]})),
+            patch("main.lexical_hits", AsyncMock(return_value=[])),
+            patch("main.call_llm", side_effect=_fake_llm),
+        ]
+        for p in self._patchers:
+            p.start()
+
+    def tearDown(self):
+        for p in self._patchers:
+            p.stop()
+
+    def test_pipeline_reports_stages_and_partial_output(self):
+        events = []
+        req = main.ChatRequest(
+            message="hi there", repo="r", github_user="o", model="m1"
+        )
+        res = asyncio.run(
+            main.run_chat_pipeline(req, lambda s, p: events.append((s, p)))
+        )
+        self.assertEqual(res.reply, "Hello world (m1)")
+        stages = [s for s, _ in events]
+        self.assertEqual(stages[0], "fetching_context")
+        self.assertIn(("generating", "Hello world"), events)
+
+    def test_worker_task_runs_pipeline_with_model(self):
+        result = main.process_chat_query.run("hi there", "r", "o", None, None, "m2")
+        self.assertEqual(result["reply"], "Hello world (m2)")
+        self.assertEqual(result["stage"], "done")
+        # A second task reuses the same worker loop.
+        loop = main._worker_loop
+        main.process_chat_query.run("hi again", "r", "o")
+        self.assertIs(main._worker_loop, loop)
+
+    def test_chat_async_forwards_model(self):
+        apply_async = MagicMock()
+        with (
+            patch.object(main.process_chat_query, "apply_async", apply_async),
+            patch("main._get_task_redis_client", return_value=None),
+            patch("main.get_repo_head_sha", AsyncMock(return_value="c1")),
+        ):
+            client = TestClient(main.app)
+            res = client.post(
+                "/api/chat-async",
+                json={"message": "m", "repo": "r", "github_user": "o", "model": "x"},
+            )
+            client.close()
+        self.assertEqual(res.json()["task_id"], apply_async.call_args.kwargs["task_id"])
+        self.assertEqual(apply_async.call_args.kwargs["args"][-1], "x")
+
+
+class ChatAsyncIdempotencyTests(unittest.TestCase):
+    def setUp(self):
+        main._IDEMPOTENCY_KEYS.clear()
+        self.apply_async = MagicMock()
+        self.head_sha = AsyncMock(return_value="c1")
+        self._patchers = [
+            patch.object(main.process_chat_query, "apply_async", self.apply_async),
+            patch("main._get_task_redis_client", return_value=None),
+            patch("main.get_repo_head_sha", self.head_sha),
+            patch.object(
+                main.celery_app,
+                "AsyncResult",
+                return_value=SimpleNamespace(state="SUCCESS"),
+            ),
+        ]
+        for p in self._patchers:
+            p.start()
+        self.client = TestClient(main.app)
+
+    def tearDown(self):
+        self.client.close()
+        for p in self._patchers:
+            p.stop()
+
+    def _post(self, message="explain  this repo", headers=None, github_user="o"):
+        return self.client.post(
+            "/api/chat-async",
+            json={"message": message, "repo": "R", "github_user": github_user},
+            headers=headers or {},
+        )
+
+    def _submit(self, message="explain  this repo", headers=None, github_user="o"):
+        return self._post(message, headers, github_user).json()
+
+    def test_duplicate_submission_returns_existing_task(self):
+        first = self._submit()
+        second = self._submit(message=" explain this repo ")
+        self.assertEqual(second["task_id"], first["task_id"])
+        self.assertTrue(second["deduplicated"])
+        self.assertEqual(self.apply_async.call_count, 1)
+
+    def test_new_commit_gets_new_task(self):
+        first = self._submit()
+        self.head_sha.return_value = "c2"
+        second = self._submit()
+        self.assertNotEqual(second["task_id"], first["task_id"])
+
+    def test_client_supplied_key(self):
+        first = self._submit(message="a", headers={"Idempotency-Key": "k1"})
+        second = self._submit(message="a", headers={"Idempotency-Key": "k1"})
+        self.assertEqual(second["task_id"], first["task_id"])
+
+    def test_client_key_reused_for_another_body_is_rejected(self):
+        self._submit(message="a", headers={"Idempotency-Key": "k1"})
+        res = self._post(message="b", headers={"Idempotency-Key": "k1"})
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(self.apply_async.call_count, 1)
+
+    def test_client_key_is_scoped_to_user_and_repo(self):
+        headers = {"Idempotency-Key": "k1"}
+        first = self._submit(message="a", headers=headers)
+        other_repo_owner = self._submit(message="a", headers=headers, github_user="x")
+        with patch("main._session_login", AsyncMock(return_value="mallory")):
+            other_login = self._submit(message="a", headers=headers)
+        ids = {first["task_id"], other_repo_owner["task_id"], other_login["task_id"]}
+        self.assertEqual(len(ids), 3)
+        self.assertFalse(other_login["deduplicated"])
+
+    def test_failed_task_is_resubmitted(self):
+        first = self._submit()
+        with patch.object(
+            main.celery_app,
+            "AsyncResult",
+            return_value=SimpleNamespace(state="FAILURE"),
+        ):
+            second = self._submit()
+        self.assertNotEqual(second["task_id"], first["task_id"])
+        self.assertEqual(self.apply_async.call_count, 2)
+
+
+class StreamingCallLLMTests(unittest.TestCase):
+    def test_call_llm_streams_chunks(self):
+        body = b'{"response":"Hel"}\n{"response":"lo"}\n{"response":"","done":true}\n'
+
+        def handler(request):
+            if request.url.path == "/api/tags":
+                return httpx.Response(200, json={"models": []})
+            return httpx.Response(200, content=body)
+
+        async def run():
+            client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            pieces = []
+            with patch("main.get_http_client", return_value=client):
+                main._OLLAMA_MODELS_CACHE = None
+                answer = await main.call_llm("p", "m", on_chunk=pieces.append)
+            await client.aclose()
+            return answer, pieces
+
+        answer, pieces = asyncio.run(run())
+        self.assertEqual(answer, "Hello")
+        self.assertEqual(pieces, ["Hel", "lo"])
+
+    def test_failed_attempt_output_is_dropped_before_retry(self):
+        attempts = []
+
+        async def body(first):
+            yield b'{"response":"Stale "}\n'
+            if first:
+                raise httpx.ReadTimeout("stalled")
+            yield b'{"response":"answer","done":true}\n'
+
+        def handler(request):
+            if request.url.path != "/api/generate":
+                return httpx.Response(200, json={"models": []})
+            attempts.append(request)
+            return httpx.Response(200, content=body(len(attempts) == 1))
+
+        async def run():
+            client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            events = []
+            with (
+                patch("main.get_http_client", return_value=client),
+                patch("main.build_repo_context", AsyncMock(return_value={})),
+                patch("main.lexical_hits", AsyncMock(return_value=[])),
+            ):
+                main._OLLAMA_MODELS_CACHE = None
+                req = main.ChatRequest(message="hi", repo="r", github_user="o")
+                reply = await main.run_chat_pipeline(
+                    req, lambda s, p: events.append((s, p))
+                )
+            await client.aclose()
+            return reply, events
+
+        with patch.dict(main.CIRCUITS, {"ollama": main.CircuitBreaker("test")}):
+            reply, events = asyncio.run(run())
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(reply.reply, "Stale answer")
+        self.assertEqual(events[-1], ("generating", "Stale answer"))
+        self.assertIn(("generating", ""), events)
+        self.assertNotIn(("generating", "Stale Stale "), events)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,203 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import main
+
+
+class FakeAsyncRedis:
+    """Just enough of redis.asyncio for CircuitBreaker.sync, shared between workers."""
+
+    def __init__(self):
+        self.hashes = {}
+        self.strings = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update({k: str(v) for k, v in mapping.items()})
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.strings:
+            return None
+        self.strings[key] = value
+        return True
+
+    async def get(self, key):
+        return self.strings.get(key)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self._redis = redis
+        self._ops = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self._ops.append((name, args))
+
+    async def execute(self):
+        results = []
+        for name, args in self._ops:
+            h = self._redis.hashes.setdefault(args[0], {})
+            if name == "hincrby":
+                h[args[1]] = str(int(h.get(args[1], 0)) + args[2])
+                results.append(int(h[args[1]]))
+            elif name == "hmget":
+                results.append([h.get(f) for f in args[1:]])
+            elif name == "hgetall":
+                results.append(dict(h))
+            else:
+                results.append(True)
+        return results
+
+
+def _breaker(**kwargs):
+    defaults = dict(
+        window_seconds=30,
+        min_requests=4,
+        failure_rate=0.5,
+        open_seconds=10,
+        max_open_seconds=60,
+        half_open_probes=2,
+    )
+    return main.CircuitBreaker("test", **{**defaults, **kwargs})
+
+
+class CircuitBreakerTests(unittest.TestCase):
+    def test_opens_on_error_rate_not_on_a_few_failures(self):
+        b = _breaker()
+        for _ in range(3):
+            b.record_failure()
+        self.assertEqual(b.state, "closed")  # below min_requests
+        b.record_success()
+        b.record_failure()
+        self.assertEqual(b.state, "open")
+        self.assertFalse(b.allow())
+
+    def test_low_error_rate_stays_closed(self):
+        b = _breaker()
+        for _ in range(6):
+            b.record_success()
+        for _ in range(3):
+            b.record_failure()
+        self.assertEqual(b.state, "closed")
+        self.assertTrue(b.allow())
+
+    def test_rate_limit_pauses_without_counting_as_failure(self):
+        b = _breaker()
+        b.record_rate_limited(retry_after=30)
+        self.assertTrue(b.throttled)
+        self.assertFalse(b.allow())
+        self.assertEqual(b.window_counts(), (0, 0))
+        self.assertEqual(b.state, "closed")
+
+    def test_half_open_allows_limited_probes_then_closes(self):
+        b = _breaker()
+        b._open()
+        b.open_until = time.time() - 1
+        self.assertTrue(b.allow())
+        self.assertTrue(b.allow())
+        self.assertFalse(b.allow())  # both probe slots taken
+        self.assertEqual(b.state, "half_open")
+        b.record_success()
+        b.record_success()
+        self.assertEqual(b.state, "closed")
+        self.assertEqual(b.trips, 0)
+
+    def test_failed_probe_reopens_with_longer_cooldown(self):
+        b = _breaker()
+        b._open()
+        first = b.open_until - time.time()
+        b.open_until = time.time() - 1
+        self.assertTrue(b.allow())
+        b.record_failure()
+        self.assertEqual(b.state, "open")
+        self.assertAlmostEqual(b.open_until - time.time(), first * 2, delta=1)
+
+
+class SharedCircuitBreakerTests(unittest.TestCase):
+    def setUp(self):
+        self._patcher = patch("main.CIRCUIT_BREAKER_SHARED", True)
+        self._patcher.start()
+        self.redis = FakeAsyncRedis()
+
+    def tearDown(self):
+        self._patcher.stop()
+
+    def test_workers_see_each_others_failures_and_state(self):
+        a, b = _breaker(), _breaker()
+        for _ in range(2):
+            a.record_failure()
+            b.record_failure()
+        asyncio.run(a.sync(self.redis))
+        asyncio.run(b.sync(self.redis))
+        self.assertEqual(b.window_counts(), (0, 4))
+        b.record_failure()  # 5 failures across both workers -> open
+        self.assertEqual(b.state, "open")
+        asyncio.run(b.sync(self.redis))
+        asyncio.run(a.sync(self.redis))
+        self.assertEqual(a.state, "open")
+        self.assertFalse(a.allow())
+
+    def test_outcomes_recorded_during_a_sync_are_pushed_next_time(self):
+        a, b = _breaker(), _breaker()
+        a.record_failure()
+        execute = FakePipeline.execute
+
+        async def record_while_pending(pipe):
+            if not self.redis.hashes:  # first round trip: the push
+                a.record_failure()
+                a.record_failure()
+            return await execute(pipe)
+
+        with patch.object(FakePipeline, "execute", record_while_pending):
+            asyncio.run(a.sync(self.redis))
+        self.assertEqual(a.window_counts(), (0, 3))
+        asyncio.run(a.sync(self.redis))
+        asyncio.run(b.sync(self.redis))
+        self.assertEqual(b.window_counts(), (0, 3))
+
+    def test_only_one_worker_holds_the_probe_lease(self):
+        a, b = _breaker(), _breaker()
+        b.worker_id = "other-host:1"
+        a._open()
+        asyncio.run(a.sync(self.redis))
+        asyncio.run(b.sync(self.redis))
+        expired = time.time() - 1
+        for w in (a, b):
+            w.open_until = expired
+        asyncio.run(a.sync(self.redis))
+        asyncio.run(b.sync(self.redis))
+        self.assertEqual([a.state, b.state], ["half_open", "half_open"])
+        self.assertTrue(a.allow())
+        self.assertFalse(b.allow())
+
+
+class GithubRateLimitTests(unittest.TestCase):
+    def test_403_without_budget_is_throttling_not_failure(self):
+        response = MagicMock(status_code=403)
+        response.headers = {
+            "X-RateLimit-Remaining": "0",
+            "X-RateLimit-Reset": str(time.time() + 120),
+        }
+        client = MagicMock()
+        client.get = AsyncMock(return_value=response)
+        breaker = _breaker()
+        with (
+            patch.dict(main.CIRCUITS, {"github": breaker}),
+            patch.dict(main._GITHUB_RATE_LIMIT),
+            patch("main.get_http_client", return_value=client),
+        ):
+            first = asyncio.run(main.gh_get("https://api.test/repos/o/throttled"))
+            second = asyncio.run(main.gh_get("https://api.test/repos/o/other"))
+        self.assertEqual(first.status_code, 429)
+        self.assertEqual(second.status_code, 429)
+        self.assertEqual(client.get.await_count, 1)  # paused until the reset
+        self.assertEqual(breaker.window_counts(), (0, 0))
+        self.assertGreater(breaker.throttled_until, time.time() + 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
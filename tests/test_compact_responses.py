@@ -0,0 +1,141 @@
+import gzip
+import json
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+import main
+from benchmarks.micro import synthetic_tree
+
+
+def _tree_response(entries):
+    class _TreeResponse:
+        status_code = 200
+        headers = {}
+
+        def json(self):
+            return {"sha": "c" * 40, "tree": synthetic_tree(entries)}
+
+    return _TreeResponse()
+
+
+class ColumnarListingTests(unittest.TestCase):
+    def test_round_trip_and_shared_prefixes(self):
+        rows = main.normalize_tree(synthetic_tree(500))
+        packed = main.columnar_listing(rows)
+        self.assertEqual(main.expand_columnar(packed), rows)
+        self.assertLess(len(packed["prefixes"]), len(rows))
+        self.assertNotIn("download_url", packed)  # all None in tree listings
+
+    def test_download_urls_kept_when_present(self):
+        rows = [
+            {"type": "file", "path": "README.md", "size": 3, "download_url": "u1"},
+            {"type": "dir", "path": "src", "size": 0, "download_url": None},
+        ]
+        packed = main.columnar_listing(rows)
+        self.assertEqual(packed["prefixes"], [""])
+        self.assertEqual(main.expand_columnar(packed), rows)
+
+    def test_files_endpoint_serves_columnar_with_its_own_etag(self):
+        with (
+            patch("main.get_repo_default_branch", AsyncMock(return_value="main")),
+            patch("main.gh_get", AsyncMock(return_value=_tree_response(300))),
+            TestClient(main.app) as client,
+        ):
+            rows = client.get("/repos/o/r/files?recursive=true")
+            packed = client.get("/repos/o/r/files?recursive=true&format=columnar")
+            bad = client.get("/repos/o/r/files?recursive=true&format=xml")
+        self.assertEqual(main.expand_columnar(packed.json()), rows.json())
+        self.assertNotEqual(packed.headers["etag"], rows.headers["etag"])
+        self.assertLess(len(packed.content), len(rows.content) / 2)
+        self.assertEqual(bad.status_code, 422)
+
+
+class FastJSONResponseTests(unittest.TestCase):
+    def test_renders_same_data_as_stdlib(self):
+        content = {"a": [1, 2.5, None, True], "é": "ü", "n": {"x": "y"}}
+        fast = main.FastJSONResponse(content).body
+        self.assertEqual(json.loads(fast), json.loads(JSONResponse(content).body))
+
+    def test_falls_back_for_values_orjson_rejects(self):
+        body = main.FastJSONResponse({"big": 2**70}).body
+        self.assertEqual(json.loads(body), {"big": 2**70})
+
+
+class CompressionTests(unittest.TestCase):
+    def setUp(self):
+        app = FastAPI()
+        app.add_middleware(main.CompressionMiddleware)
+
+        @app.get("/big")
+        def big():
+            return JSONResponse({"rows": ["x" * 20] * 500}, headers={"ETag": '"abc"'})
+
+        @app.get("/small")
+        def small():
+            return {"ok": True}
+
+        @app.get("/validated")
+        def validated(request: Request):
+            return main.cacheable_response(request, {"rows": ["x" * 20] * 500}, "v1")
+
+        @app.get("/stream")
+        def stream():
+            lines = (json.dumps({"i": i}) + "\n" for i in range(500))
+            return StreamingResponse(lines, media_type="application/x-ndjson")
+
+        self.client = TestClient(app)
+
+    def test_large_json_is_gzipped_with_weak_etag(self):
+        res = self.client.get("/big", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(res.headers["content-encoding"], "gzip")
+        self.assertEqual(res.headers["etag"], 'W/"abc"')
+        self.assertIn("Accept-Encoding", res.headers["vary"])
+        self.assertEqual(len(res.json()["rows"]), 500)  # httpx decodes
+
+    def test_304_repeats_the_validator_of_the_compressed_200(self):
+        gzip_only = {"Accept-Encoding": "gzip"}
+        first = self.client.get("/validated", headers=gzip_only)
+        self.assertEqual(first.headers["etag"], 'W/"v1"')
+        again = self.client.get(
+            "/validated", headers={**gzip_only, "If-None-Match": first.headers["etag"]}
+        )
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.headers["etag"], 'W/"v1"')
+        self.assertIn("Accept-Encoding", again.headers["vary"])
+        plain = self.client.get(
+            "/validated", headers={"Accept-Encoding": "identity"}
+        ).headers["etag"]
+        strong = self.client.get(
+            "/validated", headers={**gzip_only, "If-None-Match": plain}
+        )
+        self.assertEqual(strong.status_code, 304)
+        self.assertEqual(strong.headers["etag"], '"v1"')
+
+    def test_small_streamed_and_unaccepted_bodies_pass_through(self):
+        for path, encoding in (
+            ("/small", "gzip"),
+            ("/stream", "gzip"),
+            ("/big", "identity"),
+            ("/big", "gzip;q=0"),
+        ):
+            with self.subTest(path=path, encoding=encoding):
+                res = self.client.get(path, headers={"Accept-Encoding": encoding})
+                self.assertNotIn("content-encoding", res.headers)
+
+    def test_brotli_preferred_when_installed(self):
+        fake = SimpleNamespace(compress=lambda body, quality: gzip.compress(body))
+        with patch("main.brotli", fake):
+            self.assertEqual(main.negotiate_encoding("gzip, br"), "br")
+            self.assertEqual(main.negotiate_encoding("gzip, br;q=0"), "gzip")
+        with patch("main.brotli", None):
+            self.assertEqual(main.negotiate_encoding("br"), None)
+            self.assertEqual(main.negotiate_encoding("*"), "gzip")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,187 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+from fastapi.testclient import TestClient
+
+import main
+
+
+def _breaker():
+    return main.CircuitBreaker(
+        "test",
+        window_seconds=30,
+        min_requests=4,
+        failure_rate=0.5,
+        open_seconds=10,
+        max_open_seconds=60,
+        half_open_probes=1,
+    )
+
+
+class DeadlineHelperTests(unittest.TestCase):
+    def test_client_hint_only_shortens_and_is_capped(self):
+        with (
+            patch("main.REQUEST_DEADLINE_SECONDS", 60.0),
+            patch("main.REQUEST_DEADLINE_MAX_SECONDS", 120.0),
+        ):
+            self.assertEqual(main.request_budget(None), 60.0)
+            self.assertEqual(main.request_budget("5"), 5.0)
+            self.assertEqual(main.request_budget("600"), 120.0)
+            self.assertEqual(main.request_budget("soon"), 60.0)
+            self.assertEqual(main.request_budget("-1"), 60.0)
+
+    def test_nested_deadline_never_extends_outer(self):
+        with main.deadline(1.0) as outer:
+            with main.deadline(30.0) as inner:
+                self.assertLessEqual(inner.remaining(), 1.0)
+                inner.mark_exceeded()
+            self.assertTrue(outer.exceeded)
+        self.assertIsNone(main.deadline_remaining())
+
+    def test_timeout_trimmed_then_refused(self):
+        self.assertEqual(main.deadline_timeout(15.0, "github"), 15.0)
+        with main.deadline(2.0):
+            self.assertLessEqual(main.deadline_timeout(15.0, "github"), 2.0)
+        with main.deadline(0.0), self.assertRaises(main.DeadlineExceeded):
+            main.deadline_timeout(15.0, "github")
+
+
+class GithubDeadlineTests(unittest.TestCase):
+    def _run(self, budget, client):
+        async def go():
+            with main.deadline(budget):
+                return await main.gh_get("https://api.test/repos/o/deadline")
+
+        breaker = _breaker()
+        with (
+            patch.dict(main.CIRCUITS, {"github": breaker}),
+            patch("main.get_http_client", return_value=client),
+            patch("main.cache_get", return_value=None),
+        ):
+            return asyncio.run(go()), breaker
+
+    def test_no_call_once_budget_is_spent(self):
+        client = MagicMock()
+        client.get = AsyncMock()
+        with self.assertRaises(main.DeadlineExceeded):
+            self._run(0.0, client)
+        client.get.assert_not_awaited()
+
+    def test_no_backoff_retry_that_would_overrun(self):
+        client = MagicMock()
+        client.get = AsyncMock(
+            return_value=httpx.Response(
+                502, request=httpx.Request("GET", "https://api.test/")
+            )
+        )
+        with self.assertRaises(httpx.HTTPStatusError):
+            self._run(0.3, client)
+        self.assertEqual(client.get.await_count, 1)
+        self.assertLessEqual(client.get.await_args.kwargs["timeout"], 0.3)
+
+    def test_timeout_from_our_budget_is_not_a_github_failure(self):
+        async def slow(*args, **kwargs):
+            await asyncio.sleep(kwargs["timeout"])
+            raise httpx.ReadTimeout("slow")
+
+        client = MagicMock()
+        client.get = slow
+        with self.assertRaises(main.DeadlineExceeded) as raised:
+            self._run(0.05, client)
+        self.assertEqual(raised.exception.stage, "github")
+
+
+class LLMDeadlineTests(unittest.TestCase):
+    def _client(self, handler):
+        return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    def _call(self, handler, budget, on_chunk=None):
+        async def go():
+            async with self._client(handler) as client:
+                with (
+                    patch("main.get_http_client", return_value=client),
+                    main.deadline(budget),
+                ):
+                    return await main.call_llm("q", "m1", on_chunk=on_chunk)
+
+        with (
+            patch.dict(main.CIRCUITS, {"ollama": _breaker()}),
+            patch("main.get_ollama_models", AsyncMock(return_value=["m2", "m3"])),
+        ):
+            return asyncio.run(go())
+
+    def test_partial_answer_kept_when_budget_runs_out(self):
+        async def body():
+            yield b'{"response": "The entry point"}\n'
+            yield b'{"response": " is main.py"}\n'
+            await asyncio.sleep(5)
+            yield b'{"done": true}\n'
+
+        def handler(request):
+            return httpx.Response(200, content=body())
+
+        started = time.perf_counter()
+        reply = self._call(handler, 0.3)
+        self.assertLess(time.perf_counter() - started, 2)
+        self.assertTrue(reply.startswith("The entry point is main.py"))
+        self.assertIn("ran out of time", reply)
+
+    def test_model_fallbacks_stop_at_the_deadline(self):
+        calls = []
+
+        async def handler(request):
+            calls.append(request)
+            await asyncio.sleep(0.2)
+            return httpx.Response(404)
+
+        started = time.perf_counter()
+        reply = self._call(handler, 0.3)
+        self.assertLess(time.perf_counter() - started, 1)
+        self.assertLess(len(calls), 3)
+        self.assertIn("ran out of time", reply)
+
+    def test_no_deadline_keeps_non_streaming_request(self):
+        def handler(request):
+            self.assertIn(b'"stream":false', request.content.replace(b" ", b""))
+            return httpx.Response(200, json={"response": "ok"})
+
+        async def go():
+            async with self._client(handler) as client:
+                with patch("main.get_http_client", return_value=client):
+                    return await main.call_llm("q", "m1")
+
+        with (
+            patch.dict(main.CIRCUITS, {"ollama": _breaker()}),
+            patch("main.get_ollama_models", AsyncMock(return_value=[])),
+        ):
+            self.assertEqual(asyncio.run(go()), "ok")
+
+
+class DeadlineMiddlewareTests(unittest.TestCase):
+    def test_exhausted_budget_returns_504_with_header(self):
+        with TestClient(main.app) as client:
+            res = client.get(
+                "/repos/o/r/file-content",
+                params={"path": "README.md"},
+                headers={main.DEADLINE_HEADER: "0.000001"},
+            )
+        self.assertEqual(res.status_code, 504)
+        self.assertEqual(res.headers["X-Deadline-Exceeded"], "1")
+
+    def test_background_work_runs_without_the_request_deadline(self):
+        async def remaining():
+            return main.deadline_remaining()
+
+        async def go():
+            with main.deadline(5.0):
+                task = main._schedule_background(remaining())
+            return await task
+
+        self.assertIsNone(asyncio.run(go()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+from collections import Counter
+
+from fastapi.testclient import TestClient
+
+from benchmarks.upstreams import UpstreamConfig, make_fake_github, make_fake_ollama
+
+
+class FakeGithubTests(unittest.TestCase):
+    def _client(self, **overrides):
+        cfg = UpstreamConfig(github_latency_ms=0, github_jitter_ms=0, **overrides)
+        calls = Counter()
+        app = make_fake_github(cfg, calls, "http://fake")
+        return TestClient(app), calls
+
+    def test_tree_size_and_call_counting(self):
+        client, calls = self._client(tree_entries=50)
+        res = client.get("/repos/o/r/git/trees/main", params={"recursive": "1"})
+        blobs = [e for e in res.json()["tree"] if e["type"] == "blob"]
+        self.assertEqual(len(blobs), 50)
+        self.assertEqual(calls["github:/repos/{owner}/{repo}/git/trees/{ref}"], 1)
+
+    def test_raw_content_honours_payload_size(self):
+        client, _ = self._client(file_bytes=123)
+        res = client.get(
+            "/repos/o/r/contents/main.py",
+            headers={"Accept": "application/vnd.github.raw"},
+        )
+        self.assertEqual(len(res.content), 123)
+
+    def test_rate_limit_returns_403_with_headers(self):
+        client, calls = self._client(github_rate_limit=2)
+        codes = [client.get("/repos/o/r").status_code for _ in range(3)]
+        self.assertEqual(codes, [200, 200, 403])
+        self.assertEqual(calls["github:rate_limited"], 1)
+
+    def test_error_rate_injects_5xx(self):
+        client, _ = self._client(github_error_rate=1.0)
+        self.assertEqual(client.get("/repos/o/r").status_code, 502)
+
+
+class FakeOllamaTests(unittest.TestCase):
+    def test_generate_streams_ndjson(self):
+        cfg = UpstreamConfig(ollama_latency_ms=0, ollama_token_ms=0, ollama_tokens=3)
+        calls = Counter()
+        client = TestClient(make_fake_ollama(cfg, calls))
+        res = client.post("/api/generate", json={"model": "m", "stream": True})
+        lines = res.text.strip().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(calls["ollama:generate:m"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
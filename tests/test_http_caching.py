@@ -0,0 +1,121 @@
+import hashlib
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from fastapi.testclient import TestClient
+
+import main
+
+FILE_BODY = b"print('hello')\n"
+
+
+class _RawResponse:
+    status_code = 200
+    content = FILE_BODY
+    text = FILE_BODY.decode()
+    headers = {"Last-Modified": "Tue, 01 Oct 2024 10:00:00 GMT"}
+
+
+class _MockAsyncClient:
+    calls = []
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def get(self, url, headers=None, params=None):
+        _MockAsyncClient.calls.append((url, params))
+        return _RawResponse()
+
+
+class _TreeResponse:
+    status_code = 200
+    headers = {}
+
+    def json(self):
+        return {
+            "sha": "a" * 40,
+            "tree": [{"path": "main.py", "type": "blob", "size": 15}],
+        }
+
+
+class HttpCachingTests(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(main.app)
+        _MockAsyncClient.calls = []
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_blob_sha_matches_git(self):
+        expected = hashlib.sha1(b"blob 15\0" + FILE_BODY).hexdigest()
+        self.assertEqual(main.git_blob_sha(FILE_BODY), expected)
+
+    def test_file_content_etag_and_304(self):
+        with patch("main.httpx.AsyncClient", _MockAsyncClient):
+            first = self.client.get("/repos/o/r/file-content?path=main.py")
+            etag = first.headers["etag"]
+            second = self.client.get(
+                "/repos/o/r/file-content?path=main.py",
+                headers={"If-None-Match": etag},
+            )
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.text, FILE_BODY.decode())
+        self.assertEqual(etag, f'"{main.git_blob_sha(FILE_BODY)}"')
+        self.assertIn("must-revalidate", first.headers["cache-control"])
+        self.assertEqual(
+            first.headers["last-modified"], _RawResponse.headers["Last-Modified"]
+        )
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b"")
+        self.assertEqual(second.headers["etag"], etag)
+
+    def test_commit_pinned_content_is_long_lived(self):
+        sha = "b" * 40
+        with patch("main.httpx.AsyncClient", _MockAsyncClient):
+            res = self.client.get(f"/repos/o/r/file-content?path=main.py&ref={sha}")
+        self.assertIn("immutable", res.headers["cache-control"])
+        self.assertEqual(_MockAsyncClient.calls[0][1], {"ref": sha})
+
+    def test_recursive_files_use_tree_sha(self):
+        with (
+            patch("main.get_repo_default_branch", AsyncMock(return_value="main")),
+            patch("main.gh_get", AsyncMock(return_value=_TreeResponse())),
+        ):
+            res = self.client.get("/repos/o/r/files?recursive=true")
+            again = self.client.get(
+                "/repos/o/r/files?recursive=true",
+                headers={"If-None-Match": f'W/"x", "{"a" * 40}"'},
+            )
+        self.assertEqual(res.headers["etag"], f'"{"a" * 40}"')
+        self.assertEqual(res.json()[0]["path"], "main.py")
+        self.assertEqual(again.status_code, 304)
+
+    def test_languages_etag_changes_with_payload(self):
+        class _Langs:
+            status_code = 200
+            headers = {}
+
+            def __init__(self, data):
+                self._data = data
+
+            def json(self):
+                return self._data
+
+        with patch("main.gh_get", AsyncMock(return_value=_Langs({"Python": 10}))):
+            a = self.client.get("/repos/o/r/languages")
+        with patch("main.gh_get", AsyncMock(return_value=_Langs({"Python": 11}))):
+            b = self.client.get(
+                "/repos/o/r/languages", headers={"If-None-Match": a.headers["etag"]}
+            )
+        self.assertEqual(b.status_code, 200)
+        self.assertNotEqual(a.headers["etag"], b.headers["etag"])
+
+
+if __name__ == "__main__":
+    unittest.main()
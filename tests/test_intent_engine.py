@@ -0,0 +1,54 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+import main
+
+
+class IntentEngineTests(unittest.TestCase):
+    def test_builtin_patterns_keep_their_priority(self):
+        self.assertEqual(main.detect_intent("explain this file"), "summarize_file")
+        self.assertEqual(main.detect_intent("explain the project"), "summarize_repo")
+        self.assertEqual(main.detect_intent("how many files are there"), "count_files")
+        self.assertEqual(main.detect_intent("what is the capital of peru"), "freeform")
+
+    def test_later_match_with_higher_priority_wins(self):
+        # summarize_repo matches first in the text, but list_files ranks higher.
+        self.assertEqual(
+            main.detect_intent("give me a summary and list the files"), "list_files"
+        )
+
+    def test_register_intent_with_handler_and_priority(self):
+        engine = main.IntentEngine()
+        for name, pattern in main.INTENT_PATTERNS:
+            engine.register(name, pattern)
+
+        @engine.intent("get_license", r"\blicen[cs]e\b", priority=0)
+        async def license_handler(req, msg, generate):
+            return main.ChatResponse(reply="MIT")
+
+        self.assertEqual(engine.classify("summarize the license"), "get_license")
+        self.assertEqual(engine.patterns()[0][0], "get_license")
+        reply = asyncio.run(engine.dispatch("get_license", None, "", None))
+        self.assertEqual(reply.reply, "MIT")
+        self.assertIsNone(asyncio.run(engine.dispatch("summarize_repo", None, "")))
+
+        stats = engine.stats()
+        self.assertEqual(stats["get_license"]["count"], 1)
+        self.assertEqual(stats["get_license"]["handled"], 1)
+
+    def test_invalid_pattern_is_rejected_at_registration(self):
+        with self.assertRaises(Exception):
+            main.IntentEngine().register("broken", r"(unclosed")
+
+    def test_pipeline_routes_through_registered_handler(self):
+        req = main.ChatRequest(message="how many stars?", repo="r", github_user="o")
+        with patch("main.get_repo_meta", return_value={"stargazers_count": 7}) as meta:
+            reply = asyncio.run(main.run_chat_pipeline(req))
+        meta.assert_called_once_with("o", "r")
+        self.assertEqual(reply.meta, {"stars": 7})
+        self.assertGreaterEqual(main.INTENTS.stats()["get_stars"]["handled"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import patch
+
+import main
+
+
+class LoopMonitorTests(unittest.TestCase):
+    def setUp(self):
+        main._LOOP_BLOCK_REPORTS.clear()
+
+    def test_blocking_call_is_caught_with_its_stack(self):
+        def blocking_helper():
+            time.sleep(0.3)
+
+        async def scenario():
+            task = main.start_loop_monitor()
+            await asyncio.sleep(0.06)  # let the monitor take a heartbeat
+            blocking_helper()
+            await asyncio.sleep(0.06)
+            task.cancel()
+
+        with (
+            patch("main.LOOP_LAG_INTERVAL_SECONDS", 0.02),
+            patch("main.LOOP_BLOCK_THRESHOLD_SECONDS", 0.1),
+        ):
+            asyncio.run(scenario())
+
+        self.assertEqual(len(main._LOOP_BLOCK_REPORTS), 1)
+        report = main._LOOP_BLOCK_REPORTS[0]
+        self.assertIn("blocking_helper", report["stack"])
+        self.assertGreater(main._loop_monitor_state["max_lag"], 0.1)
+
+    def test_idle_loop_reports_nothing(self):
+        async def scenario():
+            task = main.start_loop_monitor()
+            await asyncio.sleep(0.15)
+            task.cancel()
+
+        with (
+            patch("main.LOOP_LAG_INTERVAL_SECONDS", 0.02),
+            patch("main.LOOP_BLOCK_THRESHOLD_SECONDS", 0.1),
+        ):
+            asyncio.run(scenario())
+        self.assertEqual(len(main._LOOP_BLOCK_REPORTS), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from fastapi.testclient import TestClient
+
+import main
+
+
+class MetricsRegistryTests(unittest.TestCase):
+    def test_histogram_renders_cumulative_buckets(self):
+        registry = main.MetricsRegistry()
+        hist = registry.histogram("t_seconds", "test", ("route",), buckets=(0.1, 1))
+        hist.observe(0.05, "/a")
+        hist.observe(0.5, "/a")
+        hist.observe(5, "/a")
+        text = registry.render()
+        self.assertIn('t_seconds_bucket{route="/a",le="0.1"} 1', text)
+        self.assertIn('t_seconds_bucket{route="/a",le="1"} 2', text)
+        self.assertIn('t_seconds_bucket{route="/a",le="+Inf"} 3', text)
+        self.assertIn('t_seconds_count{route="/a"} 3', text)
+
+    def test_label_values_are_escaped(self):
+        registry = main.MetricsRegistry()
+        registry.counter("t_total", "test", ("model",)).inc('a"b\\c')
+        self.assertIn('t_total{model="a\\"b\\\\c"} 1', registry.render())
+
+    def test_failing_collector_does_not_break_render(self):
+        registry = main.MetricsRegistry()
+        registry.gauge("bad", "test", collect=lambda: 1 / 0)
+        registry.counter("good_total", "test").inc()
+        self.assertIn("good_total 1", registry.render())
+
+
+class MetricsEndpointTests(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(main.app)
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_metrics_cover_routes_upstreams_and_caches(self):
+        self.client.get("/test")
+        main.cache_get("gh:missing")
+        main.observe_upstream("ollama", 0.0, 200, "phi3:mini", retried=True)
+        with patch("main._refresh_celery_queue_depth", AsyncMock()):
+            res = self.client.get("/metrics")
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.headers["content-type"].startswith("text/plain"))
+        body = res.text
+        self.assertIn(
+            'codescribe_http_request_duration_seconds_count{method="GET",route="/test",status="200"}',
+            body,
+        )
+        self.assertIn(
+            'codescribe_upstream_responses_total{service="ollama",model="phi3:mini",status="200"}',
+            body,
+        )
+        self.assertIn('codescribe_upstream_retries_total{service="ollama"}', body)
+        self.assertIn('codescribe_circuit_breaker_open{service="github"} 0', body)
+        self.assertIn('codescribe_cache_hit_ratio{cache="github"}', body)
+
+    def test_queue_depth_needs_a_configured_broker(self):
+        with (
+            patch.dict("os.environ", {}, clear=False),
+            patch("main._redis_module") as redis_module,
+        ):
+            main.os.environ.pop("CELERY_BROKER_URL", None)
+            asyncio.run(main._refresh_celery_queue_depth())
+        redis_module.assert_not_called()
+
+    def test_queue_depth_uses_the_pooled_client(self):
+        client = AsyncMock()
+        client.llen.return_value = 7
+        with (
+            patch.dict("os.environ", {"CELERY_BROKER_URL": "redis://broker:6379/1"}),
+            patch("main._redis_module", return_value=object()),
+            patch("main._get_async_redis_client", return_value=client) as pooled,
+        ):
+            asyncio.run(main._refresh_celery_queue_depth())
+        pooled.assert_called_once_with("redis://broker:6379/1")
+        self.assertEqual(main.CELERY_QUEUE_DEPTH.values[("celery",)], 7)
+
+    def test_session_store_latency_is_recorded(self):
+        asyncio.run(main.asession_store_get("no-such-session"))
+        key = (main.SESSION_STORE_TYPE, "get")
+        self.assertIn(key, main.SESSION_STORE_SECONDS.values)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+
+import main
+from benchmarks import micro
+
+
+class MicroBenchmarkTests(unittest.TestCase):
+    def test_every_case_runs(self):
+        for name, setup in micro.CASES.items():
+            with self.subTest(case=name):
+                try:
+                    with setup(main) as fn:
+                        fn()
+                except micro.Skip:
+                    pass
+
+    def test_compare_flags_only_slowdowns_beyond_tolerance(self):
+        baseline = {"cases": {"a": 10.0, "b": 10.0, "c": 10.0}}
+        results = {"a": 12.0, "b": 14.0, "c": 5.0, "d": 1.0, "e": None}
+        self.assertEqual(micro.compare(results, baseline, 0.3), ["b"])
+
+    def test_normalize_tree_relative_to_subdir(self):
+        tree = [
+            {"path": "src/a.py", "type": "blob", "size": 3},
+            {"path": "docs/b.md", "type": "blob", "size": 4},
+            {"path": "src/sub", "type": "tree"},
+            {"path": "src/vendored", "type": "commit"},
+        ]
+        rows = main.normalize_tree(tree, "/src/")
+        self.assertEqual(
+            rows,
+            [
+                {"type": "file", "path": "a.py", "size": 3, "download_url": None},
+                {"type": "dir", "path": "sub", "size": None, "download_url": None},
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
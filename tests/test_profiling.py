@@ -0,0 +1,57 @@
+import marshal
+import unittest
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+import main
+
+
+class ProfilingTests(unittest.TestCase):
+    def setUp(self):
+        main._PROFILES.clear()
+        self.client = TestClient(main.app)
+        self._patch = patch("main.PROFILE_ADMIN_TOKEN", "s3cret")
+        self._patch.start()
+
+    def tearDown(self):
+        self._patch.stop()
+        self.client.close()
+        main._PROFILES.clear()
+
+    def test_requests_are_not_profiled_without_token(self):
+        res = self.client.get("/test", headers={"X-Profile-Token": "wrong"})
+        self.assertNotIn("x-profile-id", res.headers)
+        self.assertEqual(len(main._PROFILES), 0)
+
+    def test_profiled_request_is_stored_and_downloadable(self):
+        headers = {"X-Profile-Token": "s3cret"}
+        res = self.client.get("/test", headers={**headers, "X-Profile-Memory": "1"})
+        profile_id = res.headers["x-profile-id"]
+
+        listing = self.client.get("/debug/profiles", headers=headers).json()
+        self.assertEqual(listing[0]["id"], profile_id)
+        self.assertEqual(listing[0]["path"], "/test")
+
+        detail = self.client.get(f"/debug/profiles/{profile_id}", headers=headers)
+        self.assertIn("cumulative", detail.json()["report"])
+        self.assertIsInstance(detail.json()["allocations"], list)
+
+        raw = self.client.get(f"/debug/profiles/{profile_id}/pstats", headers=headers)
+        self.assertEqual(raw.status_code, 200)
+        self.assertIsInstance(marshal.loads(raw.content), dict)
+
+    def test_store_is_capped(self):
+        with patch("main.PROFILE_MAX_STORED", 2):
+            for _ in range(3):
+                self.client.get("/test", headers={"X-Profile-Token": "s3cret"})
+        self.assertEqual(len(main._PROFILES), 2)
+
+    def test_profile_endpoints_require_token(self):
+        self.assertEqual(self.client.get("/debug/profiles").status_code, 403)
+        with patch("main.PROFILE_ADMIN_TOKEN", ""):
+            self.assertEqual(self.client.get("/debug/profiles").status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,3 +1,4 @@
+import asyncio
 import time
 import unittest
 from unittest.mock import patch
@@ -36,11 +37,67 @@ class RedisSessionStoreTests(unittest.TestCase):
         self._patcher = patch("main._get_redis_client", return_value=self.fake_redis)
         self._patcher.start()
 
+        # Async counterpart sharing the same store; records pipeline round trips.
+        self.ttls = {}
+        self.round_trips = []
+        test = self
+
+        class FakePipeline:
+            def __init__(self):
+                self._ops = []
+
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            def __getattr__(self, name):
+                return lambda *args, **kwargs: self._ops.append((name, args, kwargs))
+
+            async def execute(self):
+                test.round_trips.append([name for name, _, _ in self._ops])
+                results = []
+                for name, args, kwargs in self._ops:
+                    key = args[0]
+                    if name == "get":
+                        results.append(test._store.get(key))
+                    elif name == "expire":
+                        test.ttls[key] = args[1]
+                        results.append(key in test._store)
+                    elif name == "set":
+                        test._store[key] = args[1]
+                        test.ttls[key] = kwargs.get("ex")
+                        results.append(True)
+                    elif name == "delete":
+                        results.append(int(test._store.pop(key, None) is not None))
+                    else:
+                        results.append(0)
+                return results
+
+        class FakeAsyncRedis:
+            def pipeline(self, transaction=True):
+                return FakePipeline()
+
+            async def delete(self, key):
+                test._store.pop(key, None)
+
+            async def expire(self, key, seconds):
+                test.ttls[key] = seconds
+
+        self._async_patcher = patch(
+            "main._get_async_redis_client", return_value=FakeAsyncRedis()
+        )
+        self._async_patcher.start()
+        main._SESSION_CACHE.clear()
+
         # Initialize store (no-op for redis) to ensure no SQLite usage.
         main.init_session_store()
 
     def tearDown(self):
+        self._async_patcher.stop()
         self._patcher.stop()
+        main._SESSION_CACHE.clear()
         main.SESSION_STORE_TYPE = self._orig_store_type
         main._redis_client = self._orig_redis_client
 
@@ -61,6 +118,56 @@ class RedisSessionStoreTests(unittest.TestCase):
         main.session_store_delete(session_id)
         self.assertIsNone(main.session_store_get(session_id))
 
+    def test_async_read_refreshes_ttl_in_one_round_trip(self):
+        async def flow():
+            await main.asession_store_set(
+                "s1", {"user": "u", "expires": time.time() + 30}
+            )
+            main._SESSION_CACHE.clear()
+            self.round_trips.clear()
+            return await main.asession_store_get("s1")
+
+        with patch("main.SESSION_SLIDING_EXPIRATION", True):
+            got = asyncio.run(flow())
+        self.assertEqual(got["user"], "u")
+        self.assertEqual(self.round_trips, [["get", "expire"]])
+        self.assertEqual(self.ttls["session:s1"], main.SESSION_TTL_SECONDS)
+        self.assertGreater(got["expires"], time.time() + main.SESSION_TTL_SECONDS - 5)
+
+    def test_sliding_expiration_stops_at_the_absolute_lifetime(self):
+        async def read(issued_at):
+            await main.asession_store_set(
+                "s3",
+                {"user": "u", "issued_at": issued_at, "expires": time.time() + 30},
+            )
+            main._SESSION_CACHE.clear()
+            return await main.asession_store_get("s3")
+
+        with (
+            patch("main.SESSION_SLIDING_EXPIRATION", True),
+            patch("main.SESSION_MAX_LIFETIME_SECONDS", 7200),
+        ):
+            near_end = asyncio.run(read(time.time() - 7200 + 60))
+            self.assertLessEqual(self.ttls["session:s3"], 60)
+            self.assertLessEqual(near_end["expires"], time.time() + 60)
+            self.assertIsNone(asyncio.run(read(time.time() - 7201)))
+        self.assertNotIn("session:s3", self._store)
+
+    def test_async_write_keeps_key_layout_and_delete_removes(self):
+        async def flow():
+            await main.asession_store_set(
+                "s2", {"user": "u", "expires": time.time() + 60}
+            )
+            stored = main.session_store_get("s2")
+            await main.asession_store_delete("s2")
+            return stored, await main.asession_store_get("s2")
+
+        stored, gone = asyncio.run(flow())
+        self.assertIn("session:s2", self.ttls)
+        self.assertEqual(stored["user"], "u")
+        self.assertIsNone(gone)
+        self.assertIn("publish", self.round_trips[0])
+
 
 if __name__ == "__main__":
     unittest.main()
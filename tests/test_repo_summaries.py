@@ -0,0 +1,102 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import main
+
+
+def _tree(sha, blobs, dirs):
+    entries = [{"path": p, "type": "blob", "sha": s, "size": 10} for p, s in blobs]
+    entries += [{"path": p, "type": "tree", "sha": s} for p, s in dirs]
+    return {"sha": sha, "ref": "main", "tree": entries}
+
+
+def _snapshot(tree, files):
+    blobs = {t["path"]: t["sha"] for t in tree["tree"] if t["type"] == "blob"}
+    return {"tree_sha": tree["sha"], "blobs": blobs, "files": files}
+
+
+class RepoSummaryTests(unittest.TestCase):
+    def setUp(self):
+        self._orig_db = main.SUMMARIES_DB_PATH
+        self._tmp = tempfile.TemporaryDirectory()
+        main.SUMMARIES_DB_PATH = os.path.join(self._tmp.name, "summaries.db")
+        main._summary_store_ready = False
+        main._SUMMARY_JOBS.clear()
+
+    def tearDown(self):
+        main.SUMMARIES_DB_PATH = self._orig_db
+        main._summary_store_ready = False
+        self._tmp.cleanup()
+
+    def _run(self, tree, files, llm):
+        with (
+            patch("main.get_repo_tree", AsyncMock(return_value=tree)),
+            patch(
+                "main.get_repo_snapshot", AsyncMock(return_value=_snapshot(tree, files))
+            ),
+            patch("main.call_llm", llm),
+        ):
+            asyncio.run(main.build_repo_summaries("o", "r"))
+            return asyncio.run(main.get_cached_repo_summaries("o", "r"))
+
+    def test_only_changed_files_are_resummarized(self):
+        files = {"main.py": "print(1)", "src/a.py": "A = 1", "src/b.py": "B = 2"}
+        tree = _tree(
+            "t1",
+            [("main.py", "m1"), ("src/a.py", "a1"), ("src/b.py", "b1")],
+            [("src", "d1")],
+        )
+        llm = AsyncMock(return_value="summary")
+        result = self._run(tree, files, llm)
+        self.assertEqual(result["repository"], "summary")
+        self.assertIn("src", result["directories"])
+        # three files, one directory roll-up, one repository roll-up
+        self.assertEqual(llm.await_count, 5)
+
+        files["src/b.py"] = "B = 3"
+        tree = _tree(
+            "t2",
+            [("main.py", "m1"), ("src/a.py", "a1"), ("src/b.py", "b2")],
+            [("src", "d2")],
+        )
+        llm = AsyncMock(return_value="summary")
+        self._run(tree, files, llm)
+        self.assertEqual(llm.await_count, 3)
+
+    def test_llm_errors_are_not_cached(self):
+        files = {"main.py": "print(1)"}
+        tree = _tree("t1", [("main.py", "m1")], [])
+        llm = AsyncMock(return_value="AI generation failed after model fallbacks: x")
+        self.assertIsNone(self._run(tree, files, llm))
+        self.assertEqual(main._SUMMARY_JOBS["o/r"]["state"], "failed")
+
+    def test_partial_rollups_expire_and_are_retried(self):
+        files = {"main.py": "print(1)", "src/a.py": "A = 1", "src/b.py": "B = 2"}
+        tree = _tree(
+            "t1",
+            [("main.py", "m1"), ("src/a.py", "a1"), ("src/b.py", "b1")],
+            [("src", "d1")],
+        )
+
+        async def flaky(prompt, model=None):
+            if "src/b.py" in prompt:
+                return "AI generation failed after model fallbacks: x"
+            return "summary"
+
+        result = self._run(tree, files, AsyncMock(side_effect=flaky))
+        self.assertTrue(result["partial"])
+        self.assertTrue(main._SUMMARY_JOBS["o/r"]["partial"])
+
+        llm = AsyncMock(return_value="summary")
+        with patch("main.time.time", return_value=main.time.time() + 3600):
+            result = self._run(tree, files, llm)
+        # b.py, then the src/ and repository roll-ups that were missing it
+        self.assertEqual(llm.await_count, 3)
+        self.assertFalse(result["partial"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import main
+
+
+class RepoWarmupTests(unittest.TestCase):
+    def setUp(self):
+        main._WARMUP_STATE.clear()
+        main._WARMUP_QUEUE.clear()
+        main._warmup_drainer = None
+        self._orig_rate = dict(main._GITHUB_RATE_LIMIT)
+        self.mocks = {
+            name: AsyncMock()
+            for name in (
+                "get_repo_default_branch",
+                "get_repo_tree",
+                "build_repo_context",
+                "get_search_index",
+                "get_symbol_index",
+            )
+        }
+        self._patchers = [patch(f"main.{n}", m) for n, m in self.mocks.items()]
+        self._patchers.append(patch("main.WARMUP_STEP_DELAY_SECONDS", 0))
+        for p in self._patchers:
+            p.start()
+
+    def tearDown(self):
+        for p in self._patchers:
+            p.stop()
+        main._GITHUB_RATE_LIMIT.update(self._orig_rate)
+
+    def _drain(self, *repos):
+        async def run():
+            queued = [main.enqueue_warmup("o", r) for r in repos]
+            await main._warmup_drainer
+            return queued
+
+        return asyncio.run(run())
+
+    def test_prefetches_repo_metadata_once_per_repo(self):
+        queued = self._drain("a", "a", "b")
+        self.assertEqual(queued, [True, False, True])
+        self.assertEqual(main.warmup_state("o/a"), "done")
+        self.assertEqual(main.warmup_state("o/b"), "done")
+        self.assertEqual(self.mocks["build_repo_context"].await_count, 4)
+        self.mocks["get_search_index"].assert_not_awaited()
+
+    def test_skips_when_github_budget_is_low(self):
+        main._GITHUB_RATE_LIMIT.update(remaining=10, reset=time.time() + 600)
+        self._drain("a")
+        self.assertEqual(main.warmup_state("o/a"), "skipped")
+        self.mocks["get_repo_tree"].assert_not_awaited()
+
+    def test_state_is_bounded_and_finished_entries_expire(self):
+        with patch("main.WARMUP_STATE_LIMIT", 3):
+            queued = self._drain(*(f"r{i}" for i in range(5)))
+            main._set_warmup_state("o/busy", "running")
+        self.assertEqual(queued, [True, True, True, False, False])
+        self.assertEqual(list(main._WARMUP_STATE), ["o/r1", "o/r2", "o/busy"])
+        with patch("main.time.time", return_value=time.time() + 3600):
+            self.assertIsNone(main.warmup_state("o/r2"))
+            self.assertEqual(main.warmup_state("o/busy"), "running")
+
+    def test_rate_limit_headers_are_tracked(self):
+        reset = str(int(time.time()) + 60)
+        main._note_github_rate_limit(
+            {"X-RateLimit-Remaining": "42", "X-RateLimit-Reset": reset}
+        )
+        self.assertFalse(main.github_budget_available(100))
+        self.assertTrue(main.github_budget_available(10))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import asyncio
+import io
+import os
+import tarfile
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from fastapi import HTTPException
+
+import main
+
+
+class TokenizerTests(unittest.TestCase):
+    def test_splits_camel_and_snake_case(self):
+        tokens = main.tokenize_code("getRepoFiles session_store_get")
+        for expected in ("getrepofiles", "get", "repo", "files", "session_store_get"):
+            self.assertIn(expected, tokens)
+        self.assertIn("store", tokens)
+
+    def test_path_segments(self):
+        tokens = main.tokenize_path("frontend/src/components/RepoSelector.jsx")
+        for expected in ("frontend", "components", "reposelector", "selector", "jsx"):
+            self.assertIn(expected, tokens)
+
+
+class BM25IndexTests(unittest.TestCase):
+    def setUp(self):
+        self.files = {
+            "main.py": "def session_store_get(session_id):\n    return None\n",
+            "auth/cookies.py": "COOKIE_SAMESITE = 'Lax'\n",
+            "README.md": "Sessions are stored in SQLite.\n",
+        }
+        self.index = main.BM25Index.build("o/r@abc", self.files)
+
+    def test_exact_identifier_ranks_first(self):
+        hits = self.index.search("where is session_store_get")
+        self.assertEqual(hits[0]["path"], "main.py")
+
+    def test_path_terms_are_searchable(self):
+        hits = self.index.search("cookies")
+        self.assertEqual(hits[0]["path"], "auth/cookies.py")
+
+    def test_unknown_terms_return_nothing(self):
+        self.assertEqual(self.index.search("zzzqqq"), [])
+
+    def test_dump_and_load_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "idx.json.gz")
+            self.index.dump(path)
+            loaded = main.BM25Index.load(path)
+        self.assertEqual(loaded.search("cookie"), self.index.search("cookie"))
+
+    def test_find_snippet_reports_line_number(self):
+        line, text = main.find_snippet(self.files["main.py"], ["session_store_get"])
+        self.assertEqual(line, 1)
+        self.assertIn("session_store_get", text)
+
+
+def _tarball(files: dict[str, str]) -> bytes:
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as tar:
+        for path, text in files.items():
+            data = text.encode()
+            info = tarfile.TarInfo(f"o-r-abc/{path}")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+
+class RepoIndexBuildTests(unittest.TestCase):
+    FILES = {"app.py": "def handler():\n    pass\n"}
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        for patcher in (
+            patch("main.SEARCH_INDEX_DIR", self.dir),
+            patch.dict(main._SEARCH_INDEXES, clear=True),
+            patch.dict(main._REPO_SNAPSHOTS, clear=True),
+            patch.dict(main._INDEX_TREE_BY_HEAD, clear=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _tree(self, sha):
+        blobs = [{"path": p, "type": "blob", "size": 10} for p in self.FILES]
+        return {"sha": sha, "ref": "main", "tree": blobs}
+
+    def _run(self, coro_factory, tree_sha="a" * 40, head="c1"):
+        async def slow_download(url, max_bytes):
+            await asyncio.sleep(0.05)
+            return _tarball(self.FILES)
+
+        self.download = AsyncMock(side_effect=slow_download)
+        self.get_tree = AsyncMock(return_value=self._tree(tree_sha))
+        with (
+            patch("main.gh_download", self.download),
+            patch("main.get_repo_tree", self.get_tree),
+            patch("main.get_repo_head_sha", AsyncMock(return_value=head)),
+        ):
+            return asyncio.run(coro_factory())
+
+    def test_concurrent_builds_share_one_download(self):
+        async def go():
+            return await asyncio.gather(
+                *(main.get_search_index("o", "r") for _ in range(3))
+            )
+
+        indexes = self._run(go)
+        self.assertEqual(self.download.await_count, 1)
+        self.assertTrue(all(i is indexes[0] for i in indexes))
+
+    def test_known_head_skips_the_tree_fetch(self):
+        async def go():
+            await main.get_search_index("o", "r")
+            self.get_tree.reset_mock()
+            return await main.get_search_index("o", "r", build=False)
+
+        self.assertIsNotNone(self._run(go))
+        self.get_tree.assert_not_awaited()
+
+    def test_superseded_index_files_are_pruned(self):
+        self._run(lambda: main.get_search_index("o", "r"), "a" * 40, "c1")
+        self._run(lambda: main.get_search_index("o", "r"), "b" * 40, "c2")
+        self._run(lambda: main.get_search_index("o", "rx"), "a" * 40, "c3")
+        self.assertEqual(
+            sorted(os.listdir(self.dir)),
+            [f"o__r__{'b' * 40}.bm25.json.gz", f"o__rx__{'a' * 40}.bm25.json.gz"],
+        )
+
+    def test_download_refused_while_github_breaker_is_open(self):
+        breaker = main.CircuitBreaker("test", window_seconds=30, min_requests=1)
+        breaker.record_failure()
+        with patch.dict(main.CIRCUITS, {"github": breaker}):
+            with self.assertRaises(HTTPException) as raised:
+                asyncio.run(main.gh_download("https://api.test/tarball", 10))
+        self.assertEqual(raised.exception.status_code, 503)
+
+
+if __name__ == "__main__":
+    unittest.main()
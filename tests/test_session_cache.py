@@ -0,0 +1,70 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import main
+
+
+class SessionCacheTests(unittest.TestCase):
+    def setUp(self):
+        self._orig_db = main.SESSIONS_DB_PATH
+        self._tmp = tempfile.TemporaryDirectory()
+        main.SESSIONS_DB_PATH = os.path.join(self._tmp.name, "sessions.db")
+        main.init_session_store()
+        main._SESSION_CACHE.clear()
+        for k in main._SESSION_CACHE_STATS:
+            main._SESSION_CACHE_STATS[k] = 0
+
+    def tearDown(self):
+        main._SESSION_CACHE.clear()
+        main.SESSIONS_DB_PATH = self._orig_db
+        self._tmp.cleanup()
+
+    def test_repeated_reads_are_served_from_cache(self):
+        main.session_store_set("s1", {"user": "u", "expires": time.time() + 60})
+        self.assertEqual(main.session_store_get("s1")["user"], "u")
+        with patch("main._session_store_read") as read:
+            self.assertEqual(main.session_store_get("s1")["user"], "u")
+        read.assert_not_called()
+        stats = main.session_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_cache_never_outlives_session_expiry(self):
+        main.session_store_set("s2", {"user": "u", "expires": time.time() + 0.05})
+        self.assertIsNotNone(main.session_store_get("s2"))
+        time.sleep(0.06)
+        self.assertIsNone(main.session_store_get("s2"))
+
+    def test_delete_invalidates(self):
+        main.session_store_set("s3", {"user": "u", "expires": time.time() + 60})
+        main.session_store_get("s3")
+        main.session_store_delete("s3")
+        self.assertIsNone(main.session_store_get("s3"))
+
+    def test_hits_misses_and_invalidations_are_exported(self):
+        before = dict(main.CACHE_LOOKUPS.values)
+        dropped = main.SESSION_CACHE_INVALIDATIONS.values.get((), 0)
+        main.session_store_set("s5", {"user": "u", "expires": time.time() + 60})
+        main.session_store_get("s5")
+        main.session_store_get("s5")
+        main.session_store_delete("s5")
+        for result in ("hit", "miss"):
+            key = ("session", result)
+            self.assertEqual(
+                main.CACHE_LOOKUPS.values[key] - before.get(key, 0), 1, result
+            )
+        self.assertEqual(main.SESSION_CACHE_INVALIDATIONS.values[()] - dropped, 1)
+        text = main.METRICS.render()
+        self.assertIn('codescribe_cache_hit_ratio{cache="session"}', text)
+        self.assertIn("codescribe_session_cache_entries 0", text)
+
+    def test_cached_copy_is_not_shared(self):
+        main.session_store_set("s4", {"user": "u", "expires": time.time() + 60})
+        main.session_store_get("s4")["user"] = "mutated"
+        self.assertEqual(main.session_store_get("s4")["user"], "u")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import main
+
+
+class SqliteSessionBackendTests(unittest.TestCase):
+    def setUp(self):
+        self._orig_db = main.SESSIONS_DB_PATH
+        self._tmp = tempfile.TemporaryDirectory()
+        main.SESSIONS_DB_PATH = os.path.join(self._tmp.name, "sessions.db")
+        main.init_session_store()
+        main._SESSION_CACHE.clear()
+
+    def tearDown(self):
+        main._SESSION_CACHE.clear()
+        main.SESSIONS_DB_PATH = self._orig_db
+        self._tmp.cleanup()
+
+    def test_connection_is_persistent_and_uses_wal(self):
+        with main._db_connect() as first:
+            mode = first.execute("PRAGMA journal_mode").fetchone()[0]
+            sync = first.execute("PRAGMA synchronous").fetchone()[0]
+        with main._db_connect() as second:
+            pass
+        self.assertIs(first, second)
+        self.assertEqual(mode, "wal")
+        self.assertEqual(sync, 1)  # NORMAL
+
+    def test_async_api_round_trip(self):
+        async def flow():
+            data = {"user": "u", "expires": time.time() + 60}
+            await main.asession_store_set("a1", data)
+            got = await main.asession_store_get("a1")
+            await main.asession_store_delete("a1")
+            gone = await main.asession_store_get("a1")
+            return got, gone
+
+        got, gone = asyncio.run(flow())
+        self.assertEqual(got["user"], "u")
+        self.assertIsNone(gone)
+        # Visible to the sync API as well.
+        self.assertIsNone(main.session_store_get("a1"))
+
+    def test_concurrent_writes_are_batched(self):
+        async def burst():
+            await asyncio.gather(
+                *(
+                    main.asession_store_set(
+                        f"b{i}", {"user": f"u{i}", "expires": time.time() + 60}
+                    )
+                    for i in range(50)
+                )
+            )
+
+        with patch(
+            "main._flush_session_writes", wraps=main._flush_session_writes
+        ) as flush:
+            asyncio.run(burst())
+        self.assertLess(flush.call_count, 50)
+        with main._db_connect() as conn:
+            count = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        self.assertEqual(count, 50)
+
+    def test_reads_do_not_run_on_the_event_loop_thread(self):
+        main.session_store_set("t1", {"user": "u", "expires": time.time() + 60})
+        main._SESSION_CACHE.clear()
+        threads = []
+        read = main._session_store_read
+
+        def record(session_id):
+            threads.append(main.threading.current_thread().name)
+            return read(session_id)
+
+        async def get():
+            loop_thread = main.threading.current_thread().name
+            with patch("main._session_store_read", side_effect=record):
+                await main.asession_store_get("t1")
+            return loop_thread
+
+        loop_thread = asyncio.run(get())
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], loop_thread)
+
+    def test_reads_do_not_wait_for_a_write_flush(self):
+        main.session_store_set("r1", {"user": "u", "expires": time.time() + 60})
+        main._SESSION_CACHE.clear()
+
+        async def flow():
+            # Hold the writer connection as a slow flush would.
+            with main._db_lock:
+                write = asyncio.ensure_future(
+                    main.asession_store_set(
+                        "w1", {"user": "w", "expires": time.time() + 60}
+                    )
+                )
+                read = await asyncio.wait_for(main.asession_store_get("r1"), 2)
+                queued = await main.asession_store_get("w1")
+                self.assertFalse(write.done())
+            await write
+            return read, queued
+
+        read, queued = asyncio.run(flow())
+        self.assertEqual(read["user"], "u")
+        self.assertEqual(queued["user"], "w")
+
+    def test_sweeper_removes_expired_rows_in_batches(self):
+        now = time.time()
+        with main._db_connect() as conn:
+            conn.executemany(
+                "INSERT INTO sessions (session_id, data, expires) VALUES (?, ?, ?)",
+                [(f"old{i}", "{}", now - 10) for i in range(25)]
+                + [("live", "{}", now + 60)],
+            )
+        batches = main._SESSION_SWEEP_STATS["batches"]
+        sweeps = main.SESSION_SWEEPS.values.get((), 0)
+        rows = main.SESSION_SWEEP_ROWS.values.get((), 0)
+        with patch("main.SESSION_SWEEP_BATCH_SIZE", 10):
+            removed = asyncio.run(main.sweep_expired_sessions())
+        self.assertEqual(removed, 25)
+        self.assertEqual(main._SESSION_SWEEP_STATS["batches"] - batches, 3)
+        self.assertEqual(main.SESSION_SWEEPS.values[()] - sweeps, 1)
+        self.assertEqual(main.SESSION_SWEEP_ROWS.values[()] - rows, 25)
+        self.assertIn(
+            "codescribe_session_sweep_duration_seconds_count", main.METRICS.render()
+        )
+        self.assertEqual(main.session_sweep_stats()["last_rows_deleted"], 25)
+        with main._db_connect() as conn:
+            left = [r[0] for r in conn.execute("SELECT session_id FROM sessions")]
+        self.assertEqual(left, ["live"])
+
+    def test_incremental_vacuum_runs(self):
+        main._incremental_vacuum(10)
+        with main._db_connect() as conn:
+            mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        self.assertEqual(mode, 2)  # INCREMENTAL on a fresh database
+
+
+if __name__ == "__main__":
+    unittest.main()
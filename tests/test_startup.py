@@ -0,0 +1,59 @@
+import os
+import unittest
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+import main
+from benchmarks import startup
+
+
+class StartupTests(unittest.TestCase):
+    def setUp(self):
+        self._patcher = patch.dict(
+            main._STARTUP_STATE, {"ready": False, "error": None, "seconds": None}
+        )
+        self._patcher.start()
+        self.client = TestClient(main.app)
+
+    def tearDown(self):
+        self.client.close()
+        self._patcher.stop()
+
+    def test_import_does_no_io_and_skips_heavy_modules(self):
+        probe = startup.measure_import(os.path.dirname(main.__file__), 0)
+        self.assertEqual(probe["loaded"], [])
+
+    def test_first_request_initializes_storage_when_lifespan_did_not(self):
+        self.assertEqual(self.client.get("/ready").status_code, 503)
+        with patch("main.migrate_legacy_sessions") as migrate:
+            self.assertEqual(self.client.get("/test").status_code, 200)
+            self.client.get("/test")
+        migrate.assert_called_once()
+        res = self.client.get("/ready")
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.json()["ready"])
+
+    def test_failed_initialization_is_reported_and_retried(self):
+        with patch("main.init_session_store", side_effect=RuntimeError("no redis")):
+            res = self.client.get("/test")
+            self.assertEqual(res.status_code, 503)
+            self.assertIn("no redis", res.json()["detail"])
+            self.assertEqual(self.client.get("/ready").json()["error"], "no redis")
+        self.assertEqual(self.client.get("/test").status_code, 200)
+
+    def test_lifespan_initializes_in_background(self):
+        with TestClient(main.app) as client:
+            for _ in range(100):
+                if client.get("/ready").status_code == 200:
+                    break
+            self.assertTrue(main._STARTUP_STATE["ready"])
+
+    def test_celery_app_and_task_resolve_lazily(self):
+        self.assertIs(main.celery_app, main.get_celery_app())
+        self.assertIs(main.process_chat_query, main.get_chat_task())
+        self.assertIn("process_chat_query", main.celery_app.tasks)
+
+
+if __name__ == "__main__":
+    unittest.main()
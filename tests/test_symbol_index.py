@@ -0,0 +1,125 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from fastapi.testclient import TestClient
+
+import main
+
+PY_SOURCE = """import os
+from typing import Optional
+
+
+class Store:
+    def get(self, key):
+        return load(key)
+
+
+def load(key):
+    return os.environ.get(key)
+
+
+DEFAULT = load("X")
+"""
+
+JS_SOURCE = """import { useState } from "react";
+
+export default function RepoSelector({ onRepoSelect }) {
+  const fetchRepos = async () => {
+    setRepos(await loadRepos());
+  };
+}
+
+export const loadRepos = async () => fetch("/repos");
+"""
+
+
+class SymbolIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.index = main.SymbolIndex.build(
+            "o/r@abc", {"store.py": PY_SOURCE, "src/RepoSelector.jsx": JS_SOURCE}
+        )
+
+    def test_python_definitions(self):
+        defs = {d["kind"]: d for d in self.index.definitions("Store")}
+        self.assertEqual(defs["class"]["line"], 5)
+        get = self.index.definitions("get")[0]
+        self.assertEqual((get["kind"], get["container"]), ("method", "Store"))
+        self.assertEqual(self.index.definitions("DEFAULT")[0]["kind"], "variable")
+        self.assertEqual(self.index.definitions("Optional")[0]["kind"], "import")
+
+    def test_python_callers(self):
+        callers = {(c["caller"], c["line"]) for c in self.index.callers("load")}
+        self.assertEqual(callers, {("Store.get", 7), ("<module>", 14)})
+
+    def test_js_definitions_and_calls(self):
+        self.assertEqual(self.index.definitions("RepoSelector")[0]["line"], 3)
+        self.assertEqual(self.index.definitions("loadRepos")[0]["kind"], "function")
+        self.assertIn(
+            "fetchRepos", [c["caller"] for c in self.index.callers("loadRepos")]
+        )
+
+    def test_answer_cites_line_numbers(self):
+        res = main.answer_symbol_query(self.index, "find_definition", "load")
+        self.assertEqual(res.sources, ["store.py:10"])
+        missing = main.answer_symbol_query(self.index, "find_callers", "nope")
+        self.assertEqual(missing.meta["matches"], 0)
+
+
+class SymbolIntentTests(unittest.TestCase):
+    def test_detects_structured_intents(self):
+        self.assertEqual(
+            main.detect_intent("Where is session_store_get defined?"),
+            "find_definition",
+        )
+        self.assertEqual(main.detect_intent("what calls gh_get"), "find_callers")
+        self.assertEqual(main.extract_symbol("who calls `call_llm`?"), "call_llm")
+        self.assertEqual(main.detect_intent("who uses RepoSelector"), "find_callers")
+        self.assertEqual(main.extract_symbol("where is load() defined"), "load")
+
+    def test_plain_words_are_not_symbols(self):
+        for msg in (
+            "who uses this project",
+            "what uses the most memory in this repo",
+            "which library calls the api",
+            "where are the tests defined",
+        ):
+            with self.subTest(msg=msg):
+                self.assertEqual(main.detect_intent(msg), "freeform")
+
+    def test_unknown_symbol_falls_through_to_generation(self):
+        index = main.SymbolIndex.build("o/r@abc", {"store.py": PY_SOURCE})
+        req = main.ChatRequest(message="", repo="r", github_user="o")
+        with patch("main.get_symbol_index", AsyncMock(return_value=index)):
+            found = asyncio.run(
+                main._answer_symbol_intent("find_callers", req, "what calls load()")
+            )
+            missing = asyncio.run(
+                main._answer_symbol_intent("find_callers", req, "what calls no_such")
+            )
+        self.assertEqual(found.sources, ["store.py:7", "store.py:14"])
+        self.assertIsNone(missing)
+
+    def test_chat_answers_from_index_without_llm(self):
+        index = main.SymbolIndex.build("o/r@abc", {"store.py": PY_SOURCE})
+        with (
+            patch("main.get_symbol_index", AsyncMock(return_value=index)),
+            patch("main.call_llm", AsyncMock()) as llm,
+        ):
+            client = TestClient(main.app)
+            res = client.post(
+                "/api/chat",
+                json={
+                    "message": "where is load() defined",
+                    "repo": "r",
+                    "github_user": "o",
+                },
+            )
+            client.close()
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()["sources"], ["store.py:10"])
+        llm.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
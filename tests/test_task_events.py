@@ -0,0 +1,112 @@
+import asyncio
+import json
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fastapi.testclient import TestClient
+
+import main
+
+
+class _FakePubSub:
+    def __init__(self, messages):
+        self._messages = list(messages)
+        self.channels = []
+
+    async def subscribe(self, channel):
+        self.channels.append(channel)
+
+    async def get_message(self, ignore_subscribe_messages=True, timeout=None):
+        if not self._messages:
+            return None
+        return {"data": json.dumps(self._messages.pop(0))}
+
+    async def aclose(self):
+        self.closed = True
+
+
+class TaskEventTests(unittest.TestCase):
+    def test_pubsub_stream_ends_on_terminal_event(self):
+        pubsub = _FakePubSub(
+            [
+                {"status": "PROGRESS", "stage": "generating", "partial": "He"},
+                {"status": "SUCCESS", "result": {"reply": "Hello"}},
+            ]
+        )
+
+        async def collect():
+            return [p async for p in main._task_events_from_pubsub("t1", pubsub)]
+
+        with patch.object(
+            main.celery_app,
+            "AsyncResult",
+            return_value=SimpleNamespace(state="PENDING", info=None),
+        ):
+            events = asyncio.run(collect())
+        self.assertEqual(pubsub.channels, ["task-events:t1"])
+        self.assertEqual(
+            [e["status"] for e in events], ["PENDING", "PROGRESS", "SUCCESS"]
+        )
+
+    def test_sse_endpoint_returns_finished_task_immediately(self):
+        done = SimpleNamespace(state="SUCCESS", result={"reply": "hi"}, info=None)
+        with (
+            patch("main.redis", None),
+            patch.object(main.celery_app, "AsyncResult", return_value=done),
+        ):
+            client = TestClient(main.app)
+            res = client.get("/tasks/t1/events")
+            client.close()
+        self.assertEqual(res.headers["content-type"].split(";")[0], "text/event-stream")
+        self.assertIn("event: done", res.text)
+        self.assertIn('"reply": "hi"', res.text)
+
+    def test_sse_uses_pooled_client_and_reads_state_off_the_loop(self):
+        pubsubs = []
+
+        def new_pubsub():
+            pubsubs.append(_FakePubSub([{"status": "SUCCESS", "result": {}}]))
+            return pubsubs[-1]
+
+        pooled = SimpleNamespace(pubsub=new_pubsub)
+        on_loop = []
+
+        def async_result(task_id):
+            try:
+                asyncio.get_running_loop()
+                on_loop.append(True)
+            except RuntimeError:
+                on_loop.append(False)
+            return SimpleNamespace(state="PENDING", info=None)
+
+        with (
+            patch("main._get_async_redis_client", return_value=pooled) as get_client,
+            patch.object(main.celery_app, "AsyncResult", side_effect=async_result),
+        ):
+            client = TestClient(main.app)
+            for _ in range(2):
+                self.assertIn("event: done", client.get("/tasks/t1/events").text)
+            client.close()
+        self.assertEqual(get_client.call_count, 2)
+        self.assertTrue(all(p.closed for p in pubsubs))
+        self.assertEqual(on_loop, [False, False])
+
+    def test_worker_publishes_progress_and_result(self):
+        published = []
+        with (
+            patch("main.build_repo_context", AsyncMock(return_value={})),
+            patch("main.lexical_hits", AsyncMock(return_value=[])),
+            patch("main.call_llm", AsyncMock(return_value="ok")),
+            patch("main.publish_task_event", lambda tid, p: published.append((tid, p))),
+            patch.object(main.process_chat_query, "update_state", MagicMock()),
+        ):
+            main.process_chat_query.apply(args=["hi", "r", "o"], task_id="t9")
+        statuses = [p["status"] for _, p in published]
+        self.assertEqual(statuses[-1], "SUCCESS")
+        self.assertIn("PROGRESS", statuses)
+        self.assertTrue(all(tid == "t9" for tid, _ in published))
+
+
+if __name__ == "__main__":
+    unittest.main()
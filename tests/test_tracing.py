@@ -0,0 +1,90 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from fastapi.testclient import TestClient
+
+import main
+
+
+class SpanTests(unittest.TestCase):
+    def test_span_is_noop_without_trace(self):
+        with main.span("anything") as sp:
+            self.assertIsNone(sp)
+
+    def test_nested_spans_and_server_timing(self):
+        trace = main.Trace("req-1")
+
+        async def work():
+            token = main._CURRENT_TRACE.set(trace)
+            try:
+                with main.span("outer"):
+                    await asyncio.gather(*(self._child("github") for _ in range(2)))
+            finally:
+                main._CURRENT_TRACE.reset(token)
+
+        asyncio.run(work())
+        outer, first, second = trace.spans
+        self.assertIsNone(outer["parent"])
+        self.assertEqual(first["parent"], outer["id"])
+        self.assertEqual(second["parent"], outer["id"])
+        header = trace.server_timing(12.5)
+        self.assertIn("github;dur=", header)
+        self.assertIn('desc="2 calls"', header)
+        self.assertTrue(header.endswith("total;dur=12.5"))
+
+    async def _child(self, name):
+        with main.span(name):
+            await asyncio.sleep(0)
+
+    def test_errors_are_recorded_on_the_span(self):
+        trace = main.Trace("req-2")
+        token = main._CURRENT_TRACE.set(trace)
+        try:
+            with self.assertRaises(ValueError):
+                with main.span("boom"):
+                    raise ValueError("x")
+        finally:
+            main._CURRENT_TRACE.reset(token)
+        self.assertEqual(trace.spans[0]["attrs"]["error"], "ValueError")
+        self.assertIsNotNone(trace.spans[0]["duration_ms"])
+
+
+class ChatTracingTests(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(main.app)
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_chat_response_carries_stage_timings_and_exports(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "traces.jsonl")
+            with (
+                patch("main.TRACE_EXPORT_PATH", path),
+                patch("main.build_repo_context", AsyncMock(return_value={})),
+                patch("main.lexical_hits", AsyncMock(return_value=[])),
+                patch("main._call_llm", AsyncMock(return_value="hi")),
+            ):
+                res = self.client.post(
+                    "/api/chat",
+                    json={"message": "hello there", "repo": "r", "github_user": "o"},
+                    headers={"X-Request-ID": "trace-me"},
+                )
+            self.assertEqual(res.status_code, 200)
+            timing = res.headers["server-timing"]
+            self.assertIn("detect_intent;dur=", timing)
+            self.assertIn("call_llm;dur=", timing)
+            self.assertIn("total;dur=", timing)
+            with open(path, encoding="utf-8") as f:
+                exported = [json.loads(line) for line in f]
+        self.assertEqual(exported[-1]["request_id"], "trace-me")
+        names = [s["name"] for s in exported[-1]["spans"]]
+        self.assertIn("detect_intent", names)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import httpx
+from fastapi.testclient import TestClient
+
+import main
+from benchmarks.replay import RecordedUpstream, upstream_route
+
+
+def _upstream(request: httpx.Request) -> httpx.Response:
+    if request.url.path == "/api/generate":
+        return httpx.Response(200, text='{"response": "hi"}\n{"done": true}\n')
+    return httpx.Response(
+        200,
+        json={"default_branch": "main"},
+        headers={"X-RateLimit-Remaining": "42", "Set-Cookie": "secret=1"},
+    )
+
+
+class RecordingTransportTests(unittest.TestCase):
+    def _exchange(self, url, **kwargs):
+        records = []
+
+        async def go():
+            token = main._CURRENT_CAPTURE.set(records)
+            transport = main._RecordingTransport(httpx.MockTransport(_upstream))
+            try:
+                async with httpx.AsyncClient(transport=transport) as client:
+                    async with client.stream(
+                        "POST" if kwargs else "GET", url, **kwargs
+                    ) as r:
+                        lines = [line async for line in r.aiter_lines()]
+            finally:
+                main._CURRENT_CAPTURE.reset(token)
+            return lines
+
+        return asyncio.run(go()), records
+
+    def test_github_exchange_is_recorded_without_cookies(self):
+        with patch("main.GITHUB_API_BASE", "https://gh.test"):
+            _, records = self._exchange("https://gh.test/repos/o/r?page=2")
+        (entry,) = records
+        self.assertEqual(entry["service"], "github")
+        self.assertEqual(entry["target"], "/repos/o/r?page=2")
+        self.assertEqual(
+            entry["headers"],
+            {"content-type": "application/json", "x-ratelimit-remaining": "42"},
+        )
+        self.assertEqual(json.loads(entry["body"]["text"]), {"default_branch": "main"})
+        self.assertIn("duration_ms", entry)
+
+    def test_streamed_ollama_response_still_streams(self):
+        with patch("main.OLLAMA_URL", "http://ollama.test"):
+            lines, records = self._exchange(
+                "http://ollama.test/api/generate", json={"model": "m", "stream": True}
+            )
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(records[0]["model"], "m")
+        self.assertEqual(records[0]["service"], "ollama")
+
+    def test_nothing_recorded_outside_a_capture(self):
+        async def go():
+            transport = main._RecordingTransport(httpx.MockTransport(_upstream))
+            async with httpx.AsyncClient(transport=transport) as client:
+                return await client.get("https://gh.test/x")
+
+        self.assertEqual(asyncio.run(go()).status_code, 200)
+
+
+class CaptureMiddlewareTests(unittest.TestCase):
+    def test_request_is_written_sanitized(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "traffic.jsonl")
+            with (
+                patch("main.TRAFFIC_CAPTURE_PATH", path),
+                TestClient(main.app) as client,
+            ):
+                client.get(
+                    "/test?token=abc&x=1",
+                    headers={"Authorization": "Bearer t", "Cookie": "session_id=s"},
+                )
+                client.get("/debug/loop-blocks")
+            with open(path, encoding="utf-8") as f:
+                entries = [json.loads(line) for line in f]
+        (entry,) = entries
+        self.assertEqual(entry["path"], "/test")
+        self.assertEqual(entry["route"], "/test")
+        self.assertEqual(entry["query"], [["token", "REDACTED"], ["x", "1"]])
+        self.assertNotIn("authorization", entry["headers"])
+        self.assertNotIn("cookie", entry["headers"])
+        self.assertEqual(entry["status"], 200)
+
+
+class RecordedUpstreamTests(unittest.TestCase):
+    def test_repeated_calls_replay_in_order_then_reuse_last(self):
+        exchanges = [
+            {"method": "GET", "target": "/a", "status": 200, "body": {"text": "1"}},
+            {"method": "GET", "target": "/a", "status": 200, "body": {"text": "2"}},
+        ]
+        client = TestClient(RecordedUpstream("github", exchanges, 0).app())
+        bodies = [client.get("/a").text for _ in range(3)]
+        self.assertEqual(bodies, ["1", "2", "2"])
+        self.assertEqual(client.get("/b").status_code, 404)
+
+    def test_upstream_route_groups_repo_paths(self):
+        self.assertEqual(
+            upstream_route("/repos/o/r/contents/src/x.py?ref=main"),
+            "/repos/{owner}/{repo}/contents/{path}",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()